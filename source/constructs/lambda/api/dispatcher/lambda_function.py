@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+from datetime import datetime
+
+import boto3
+
+from commonlib.builds import start_shard_builds, stop_build
+from commonlib.checkpoint import CheckPointDao
+from commonlib.in_flight import IN_FLIGHT_ATTRIBUTE, IN_FLIGHT_STATUS, InFlightRunDao
+from commonlib.launch import (
+    LAUNCH_SLOT_COUNT_ATTRIBUTE,
+    DynamoDBLaunchSlots,
+    LaunchDispatcher,
+    SQSLaunchQueue,
+)
+from commonlib.launch_stats import LaunchQueueStatsDao
+from commonlib.runs import FinishedRunRecorder
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table_name = os.environ["TABLE"]
+codebuild_project = os.environ.get("CODEBUILD_PROJECT_NAME")
+
+codebuild_client = boto3.client("codebuild", region_name=os.environ.get("REGION"))
+checkpoint_dao = CheckPointDao(table_name)
+in_flight_run_dao = InFlightRunDao(table_name)
+launch_queue_stats_dao = LaunchQueueStatsDao(table_name)
+run_recorder = FinishedRunRecorder(table_name)
+
+dispatcher = LaunchDispatcher(
+    queue=SQSLaunchQueue(os.environ["LAUNCH_QUEUE_URL"]),
+    slots=DynamoDBLaunchSlots(table_name),
+    start=lambda message, scopes: start_run(message, scopes),
+    on_error=lambda message, error: fail_run(message, error),
+    project_limit=int(os.environ.get("MAX_IN_FLIGHT_PER_PROJECT", "5")),
+    account_limit=int(os.environ.get("MAX_IN_FLIGHT_PER_ACCOUNT", "20")),
+    rate=float(os.environ.get("LAUNCH_RATE", "1")),
+    burst=float(os.environ.get("LAUNCH_BURST", "5")),
+)
+
+
+def lambda_handler(event, context):
+    """Drain the launch queue, on schedule or when runs are queued."""
+    # keep some time to save the statistics before the function times out
+    time_budget = context.get_remaining_time_in_millis() / 1000 - 10
+    stats = dispatcher.drain(time_budget=max(time_budget, 1))
+    stats["updatedAt"] = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    launch_queue_stats_dao.put_launch_queue_stats(stats)
+    if stats["dispatched"] or stats["failed"]:
+        checkpoint_dao.bump_generation()
+    return stats
+
+
+def start_run(message: dict, scopes: list) -> bool:
+    """Start the build of a queued run.
+
+    The launch slots are recorded on the TEST item with its RUNNING status,
+    once the builds started, so that the result parser can release them.
+    Until then the slots are held by the dispatcher, which releases them if
+    the run is not started. A sharded run holds a launch slot of each scope
+    per shard, as each shard is a build.
+
+    Returns:
+        bool: False if the run is no longer QUEUED, e.g. it was stopped.
+    """
+    test_id, marker_id = message["testId"], message["markerId"]
+    item = checkpoint_dao.get_test_history(test_id, marker_id)
+    if item is None:
+        raise RuntimeError(f"Run {test_id} is queued but not written yet")
+    if item["status"] != "QUEUED":
+        logger.info(f"Run {test_id} is no longer queued, skip it")
+        return False
+
+    shards = message.get("shards", 1)
+    # a run is either fully started or retried
+    codebuild_arns = start_shard_builds(
+        codebuild_client, codebuild_project, message["variables"], shards
+    )
+
+    attributes = {
+        "status": "RUNNING",
+        IN_FLIGHT_ATTRIBUTE: IN_FLIGHT_STATUS,
+        "codeBuildArn": codebuild_arns[0],
+        "launchSlots": scopes,
+        LAUNCH_SLOT_COUNT_ATTRIBUTE: shards,
+        "updatedAt": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    if shards > 1:
+        attributes["shardBuildArns"] = codebuild_arns
+    if not in_flight_run_dao.update_queued_run(test_id, marker_id, attributes):
+        logger.info(f"Run {test_id} is no longer queued, stop its builds")
+        for codebuild_arn in codebuild_arns:
+            stop_build(codebuild_client, codebuild_arn)
+        return False
+    checkpoint_dao.update_latest_run(
+        marker_id, test_id, status="RUNNING", tested_at=message["createdAt"]
+    )
+    return True
+
+
+def fail_run(message: dict, error: Exception) -> None:
+    """Finish a queued run as ERROR once its launch is given up.
+
+    The run is recorded as the reconciler records a run finished without
+    report. The launch slots of its last attempt are already released.
+    """
+    [previous_run] = in_flight_run_dao.finish_runs(
+        [
+            {
+                "PK": f"TEST#{message['testId']}",
+                "SK": f"MARKER#{message['markerId']}",
+                "status": "ERROR",
+                "duration": "-",
+            }
+        ],
+        from_statuses=("QUEUED",),
+    )
+    if previous_run is None:
+        return
+    logger.info(f"Run {previous_run['PK']} failed to start: {error}")
+    run_recorder.record(previous_run, "ERROR")
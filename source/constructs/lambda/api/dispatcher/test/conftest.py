@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+TABLE_NAME = "mocked-test-table"
+
+
+@pytest.fixture(autouse=True)
+def default_environment_variables():
+    """Mocked AWS evivronment variables such as AWS credentials and region"""
+    os.environ["AWS_ACCESS_KEY_ID"] = "mocked-aws-access-key-id"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "mocked-aws-secret-access-key"
+    os.environ["AWS_SESSION_TOKEN"] = "mocked-aws-session-token"
+    os.environ["AWS_REGION"] = "us-east-1"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    os.environ["REGION"] = "us-east-1"
+    os.environ["TABLE"] = TABLE_NAME
+    os.environ["CODEBUILD_PROJECT_NAME"] = "mocked-project"
+    os.environ["LAUNCH_QUEUE_URL"] = "mocked-launch-queue-url"
+
+
+@pytest.fixture
+def ddb_table(default_environment_variables):
+    with mock_dynamodb():
+        ddb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = ddb.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        table.put_item(
+            Item={
+                "PK": "MARKER#m-001",
+                "SK": "PROJECT#p-001",
+                "entityType": "MARKER",
+                "projectName": "CLO",
+            }
+        )
+        yield table
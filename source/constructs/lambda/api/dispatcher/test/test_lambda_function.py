@@ -0,0 +1,274 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+from commonlib.checkpoint import CheckPointDao
+from commonlib.in_flight import InFlightRunDao
+from commonlib.launch import (
+    ACCOUNT_SCOPE,
+    DynamoDBLaunchSlots,
+    InMemoryLaunchQueue,
+    LaunchDispatcher,
+    get_project_scope,
+)
+from commonlib.launch_stats import LaunchQueueStatsDao
+from commonlib.runs import FinishedRunRecorder
+from .conftest import TABLE_NAME
+
+CREATED_AT = "2024-01-01T00:00:00Z"
+PROJECT_SCOPE = get_project_scope("CLO")
+
+
+class FakeCodeBuildClient:
+    """Records the builds started and stopped, the starts in fail_at raise"""
+
+    def __init__(self, fail_at=()):
+        self.fail_at = set(fail_at)
+        self.starts = 0
+        self.builds = []
+        self.stopped = []
+
+    def start_build(self, projectName, environmentVariablesOverride):
+        self.starts += 1
+        if self.starts in self.fail_at:
+            raise RuntimeError("throttled")
+        build_id = f"{projectName}:{len(self.builds)}"
+        self.builds.append(
+            {
+                variable["name"]: variable["value"]
+                for variable in environmentVariablesOverride
+            }
+        )
+        return {
+            "build": {
+                "id": build_id,
+                "arn": f"arn:aws:codebuild:us-east-1:123456789012:build/{build_id}",
+            }
+        }
+
+    def stop_build(self, id):
+        self.stopped.append(id)
+
+
+def put_queued_run(table, test_id, **attributes):
+    table.put_item(
+        Item={
+            "PK": f"TEST#{test_id}",
+            "SK": "MARKER#m-001",
+            "createdAt": CREATED_AT,
+            "status": "QUEUED",
+            "duration": "-",
+            "codeBuildArn": "-",
+            **attributes,
+        }
+    )
+
+
+def new_message(test_id, shards=1):
+    return {
+        "testId": test_id,
+        "markerId": "m-001",
+        "projectName": "CLO",
+        "createdAt": CREATED_AT,
+        "enqueuedAt": 0,
+        "variables": [{"name": "pk", "value": f"TEST#{test_id}"}],
+        "shards": shards,
+    }
+
+
+def get_run(table, test_id):
+    return table.get_item(Key={"PK": f"TEST#{test_id}", "SK": "MARKER#m-001"})[
+        "Item"
+    ]
+
+
+@pytest.fixture
+def lambda_function(ddb_table, monkeypatch):
+    import lambda_function
+
+    monkeypatch.setattr(lambda_function, "checkpoint_dao", CheckPointDao(TABLE_NAME))
+    monkeypatch.setattr(
+        lambda_function, "in_flight_run_dao", InFlightRunDao(TABLE_NAME)
+    )
+    monkeypatch.setattr(
+        lambda_function, "launch_queue_stats_dao", LaunchQueueStatsDao(TABLE_NAME)
+    )
+    monkeypatch.setattr(
+        lambda_function, "run_recorder", FinishedRunRecorder(TABLE_NAME)
+    )
+    yield lambda_function
+
+
+def new_dispatcher(lambda_function, queue, defer_seconds=0):
+    return LaunchDispatcher(
+        queue=queue,
+        slots=DynamoDBLaunchSlots(TABLE_NAME),
+        start=lambda_function.start_run,
+        on_error=lambda_function.fail_run,
+        project_limit=5,
+        account_limit=20,
+        rate=100,
+        burst=10,
+        max_attempts=2,
+        defer_seconds=defer_seconds,
+    )
+
+
+def test_start_run(lambda_function, ddb_table, monkeypatch):
+    codebuild_client = FakeCodeBuildClient()
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    put_queued_run(ddb_table, "t-001")
+    put_queued_run(ddb_table, "t-002", status="ABORTED")
+
+    scopes = [ACCOUNT_SCOPE, PROJECT_SCOPE]
+    assert lambda_function.start_run(new_message("t-001", shards=2), scopes)
+    run = get_run(ddb_table, "t-001")
+    assert run["status"] == "RUNNING"
+    assert run["inFlight"] == "RUNNING"
+    assert run["launchSlots"] == scopes
+    assert run["shardBuildArns"][1].endswith("/mocked-project:1")
+    assert [build["shard_index"] for build in codebuild_client.builds] == ["0", "1"]
+    marker = ddb_table.get_item(Key={"PK": "MARKER#m-001", "SK": "PROJECT#p-001"})[
+        "Item"
+    ]
+    assert (marker["latestTestId"], marker["status"]) == ("t-001", "RUNNING")
+
+    # a run stopped while queued is skipped
+    assert lambda_function.start_run(new_message("t-002"), scopes) is False
+    assert len(codebuild_client.builds) == 2
+    # a run received before its item is written is retried
+    with pytest.raises(RuntimeError, match="not written yet"):
+        lambda_function.start_run(new_message("t-404"), scopes)
+
+
+def test_start_run_partial_failure(lambda_function, ddb_table, monkeypatch):
+    codebuild_client = FakeCodeBuildClient(fail_at=[2])
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    put_queued_run(ddb_table, "t-001")
+
+    with pytest.raises(RuntimeError, match="throttled"):
+        lambda_function.start_run(new_message("t-001", shards=3), [ACCOUNT_SCOPE])
+    # the build of the first shard is stopped, the run waits to be retried
+    assert codebuild_client.stopped == ["mocked-project:0"]
+    run = get_run(ddb_table, "t-001")
+    assert run["status"] == "QUEUED"
+    assert "launchSlots" not in run
+
+
+def test_run_stopped_while_starting(lambda_function, ddb_table, monkeypatch):
+    codebuild_client = FakeCodeBuildClient()
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    put_queued_run(ddb_table, "t-001")
+    queue = InMemoryLaunchQueue()
+    queue.put([new_message("t-001")])
+
+    def stop_run(*args):
+        # the run is stopped once its build started
+        ddb_table.update_item(
+            Key={"PK": "TEST#t-001", "SK": "MARKER#m-001"},
+            UpdateExpression="SET #status = :status",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":status": "ABORTED"},
+        )
+        return False
+
+    monkeypatch.setattr(
+        lambda_function.in_flight_run_dao, "update_queued_run", stop_run
+    )
+
+    stats = new_dispatcher(lambda_function, queue).drain(time_budget=5)
+    assert (stats["dispatched"], stats["skipped"]) == (0, 1)
+    assert codebuild_client.stopped == ["mocked-project:0"]
+    # the launch slots are released by the dispatcher
+    slots = DynamoDBLaunchSlots(TABLE_NAME)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 0
+    assert slots.get_in_flight(PROJECT_SCOPE) == 0
+
+
+def test_shards_exceed_free_slots(lambda_function, ddb_table, monkeypatch):
+    codebuild_client = FakeCodeBuildClient()
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    for test_id in ("t-001", "t-002", "t-003"):
+        put_queued_run(ddb_table, test_id)
+    now = [0]
+    queue = InMemoryLaunchQueue(clock=lambda: now[0])
+    queue.put(
+        [
+            new_message("t-001", shards=3),
+            new_message("t-002", shards=3),
+            new_message("t-003", shards=6),
+        ]
+    )
+    dispatcher = new_dispatcher(lambda_function, queue, defer_seconds=30)
+
+    # a slot per shard, the project limit is 5 builds in flight
+    stats = dispatcher.drain(time_budget=5)
+    assert (stats["dispatched"], stats["deferred"], stats["failed"]) == (1, 1, 1)
+    assert len(codebuild_client.builds) == 3
+    slots = DynamoDBLaunchSlots(TABLE_NAME)
+    assert slots.get_in_flight(PROJECT_SCOPE) == 3
+    assert get_run(ddb_table, "t-001")["launchSlotCount"] == 3
+    # a run which can never get its slots is given up
+    assert get_run(ddb_table, "t-003")["status"] == "ERROR"
+
+    # the slots of all the shards are released once the run finished
+    [previous_run] = lambda_function.in_flight_run_dao.finish_runs(
+        [{"PK": "TEST#t-001", "SK": "MARKER#m-001", "status": "PASS", "duration": 1}]
+    )
+    lambda_function.run_recorder.record(previous_run, "PASS", 1)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 0
+    assert slots.get_in_flight(PROJECT_SCOPE) == 0
+    now[0] += 30
+    stats = dispatcher.drain(time_budget=5)
+    assert (stats["dispatched"], stats["depth"]) == (1, 0)
+    assert slots.get_in_flight(PROJECT_SCOPE) == 3
+
+
+def test_retry_and_fail_run(lambda_function, ddb_table, monkeypatch):
+    # the first run fails twice, the second run on its first attempt only
+    codebuild_client = FakeCodeBuildClient(fail_at=[1, 2, 3])
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    ddb_table.put_item(
+        Item={
+            "PK": "MATRIX#x-001",
+            "SK": "MARKER#m-001",
+            "status": "RUNNING",
+            "total": 1,
+            "finished": 0,
+            "passes": 0,
+            "failures": 0,
+        }
+    )
+    put_queued_run(ddb_table, "t-001", matrixRunId="x-001")
+    put_queued_run(ddb_table, "t-002")
+    queue = InMemoryLaunchQueue()
+    queue.put([new_message("t-001"), new_message("t-002")])
+
+    # the runs failed to start are retried until their last attempt
+    stats = new_dispatcher(lambda_function, queue).drain(time_budget=5)
+    assert (stats["dispatched"], stats["failed"], stats["depth"]) == (1, 3, 0)
+    assert codebuild_client.starts == 4
+
+    # the run given up is finished as the reconciler finishes a run
+    failed = get_run(ddb_table, "t-001")
+    assert failed["status"] == "ERROR"
+    assert "inFlight" not in failed and "launchSlots" not in failed
+    stats = ddb_table.get_item(Key={"PK": "STATS#m-001", "SK": "TOTAL"})["Item"]
+    assert (stats["runs"], stats["failures"]) == (1, 1)
+    matrix_run = ddb_table.get_item(Key={"PK": "MATRIX#x-001", "SK": "MARKER#m-001"})[
+        "Item"
+    ]
+    assert matrix_run["status"] == "FAILED"
+
+    # only the run started holds its launch slots
+    started = get_run(ddb_table, "t-002")
+    assert started["status"] == "RUNNING"
+    slots = DynamoDBLaunchSlots(TABLE_NAME)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 1
+    assert slots.get_in_flight(PROJECT_SCOPE) == 1
+
+    # a run finished meanwhile is not failed again
+    lambda_function.fail_run(new_message("t-002"), RuntimeError("throttled"))
+    assert get_run(ddb_table, "t-002")["status"] == "RUNNING"
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 1
@@ -4,9 +4,25 @@
 import logging
 import os
 import json
+import threading
+import time
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from commonlib.cases import CaseDao
+from commonlib.checkpoint import CheckPointDao, get_id_from_key
+from commonlib.in_flight import IN_FLIGHT_ATTRIBUTE
+from commonlib.report import (
+    MAX_INLINE_RESULT_SIZE,
+    RESULT_CHUNKS_ATTRIBUTE,
+    RESULT_DATA_ATTRIBUTE,
+    ResultStore,
+    iter_report,
+    parse_test_case,
+)
+from commonlib.runs import FinishedRunRecorder
+
 s3 = boto3.client("s3")
 dynamodb = boto3.resource("dynamodb")
 
@@ -15,60 +31,329 @@ logger.setLevel(logging.INFO)
 
 ddb_table_name = os.environ["TABLE"]
 ddb_table = dynamodb.Table(ddb_table_name)
+# The records are parsed by a pool of threads, each thread has its own
+# DAOs. The pool is kept in the warm container, and so are the DAOs of its
+# threads.
+ddb_client = ddb_table.meta.client
+max_workers = int(os.environ.get("MAX_WORKERS", "8"))
+executor = ThreadPoolExecutor(max_workers=max_workers)
+worker_local = threading.local()
+
+# ERROR and TIMED_OUT are set by the reconciler on builds which finished
+# without a report, a report delivered later is not counted again.
+FINISHED_STATUS = ('PASS', 'FAILED', 'ERROR', 'TIMED_OUT')
+ABORTED_STATUS = 'ABORTED'
+# Members of a report kept by the parser, the tests are parsed one by one
+REPORT_FIELDS = ('summary', 'duration', 'pk', 'sk', 'shardIndex', 'shardTotal')
+# Prefix of the results too large for the TEST item, in the central bucket
+RESULT_PREFIX = 'results'
 
 
 def lambda_handler(event, context):
-    for record in event["Records"]:
-        bucket = record["s3"]["bucket"]["name"]
-        key = record["s3"]["object"]["key"]
+    """Parse the reports of the records concurrently.
+
+    A record is an S3 event notification, or an SQS message with an S3 event
+    notification in its body. The records which failed are returned as batch
+    item failures, so that a queue only delivers their messages again.
+    """
+    start = time.perf_counter()
+    records = event.get("Records", [])
+    succeeded = list(executor.map(process_record, records))
+    failures = [
+        {"itemIdentifier": get_item_identifier(record)}
+        for record, ok in zip(records, succeeded)
+        if not ok
+    ]
+    if len(failures) < len(records):
+        # the runs updated by the batch are published at once
+        get_checkpoint_dao().bump_generation()
+    logger.info(
+        f"Parsed {len(records) - len(failures)} of {len(records)} records "
+        f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    return {"batchItemFailures": failures}
+
+
+def get_checkpoint_dao():
+    """Get the CheckPointDao of the current thread"""
+    if not hasattr(worker_local, 'checkpoint_dao'):
+        worker_local.checkpoint_dao = CheckPointDao(ddb_table_name)
+    return worker_local.checkpoint_dao
+
+
+def get_case_dao():
+    """Get the CaseDao of the current thread"""
+    if not hasattr(worker_local, 'case_dao'):
+        worker_local.case_dao = CaseDao(ddb_table_name)
+    return worker_local.case_dao
+
+
+def get_run_recorder():
+    """Get the FinishedRunRecorder of the current thread"""
+    if not hasattr(worker_local, 'run_recorder'):
+        worker_local.run_recorder = FinishedRunRecorder(ddb_table_name)
+    return worker_local.run_recorder
+
 
+def get_item_identifier(record):
+    """Get the id of a record in a batch item failure, its message id if any"""
+    if 'messageId' in record:
+        return record['messageId']
+    return record.get('s3', {}).get('object', {}).get('key', '')
+
+
+def get_s3_objects(record):
+    """Get the bucket and key of the reports of a record"""
+    if record.get('eventSource') == 'aws:sqs':
+        # the test event sent when the notification is set up has no records
+        notifications = json.loads(record['body']).get('Records', [])
+    else:
+        notifications = [record]
+    return [
+        (notification['s3']['bucket']['name'], notification['s3']['object']['key'])
+        for notification in notifications
+    ]
+
+
+def process_record(record):
+    """Parse the reports of a record, returns False if one failed"""
+    try:
+        s3_objects = get_s3_objects(record)
+    except Exception:
+        logger.exception(f"Invalid record {get_item_identifier(record)}")
+        return False
+    for bucket, key in s3_objects:
+        start = time.perf_counter()
         try:
-            response = s3.get_object(Bucket=bucket, Key=key)
-            test_result = response["Body"].read().decode("utf-8")
-            parsed_data = json.loads(test_result)
-            print(parsed_data)
-            pk = parsed_data['pk']
-            sk = parsed_data['sk']
-            parsed_result = parse_test_result(parsed_data)          
-
-            expression_attribute_names = {
-                '#status': 'status', 
-                '#failed': 'failed', 
-                '#passed': 'passed', 
-                '#total': 'total', 
-                '#updatedAt': 'updatedAt', 
-                '#duration': 'duration', 
-                '#result': 'result'}
-            update_expression = 'SET #status = :value1, #failed = :value2, #passed = :value3, #total = :value4, #updatedAt = :value5, #duration = :value6, #result = :value7'
-            expression_attribute_values = {
-                ':value1': parsed_result['status'], 
-                ':value2': parsed_result['failed'],
-                ':value3': parsed_result['passed'],
-                ':value4': parsed_result['total'],
-                ':value5': parsed_result['updatedAt'],
-                ':value6': parsed_result['duration'],
-                ':value7': parsed_result['result']}
-
-            response = ddb_table.update_item(
-                # TableName=table_name,
-                Key={'PK': pk, 'SK': sk},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ExpressionAttributeNames=expression_attribute_names,
-                ReturnValues='ALL_NEW'  
-            )
-            print(response['Attributes'])
-        except Exception as e:
-            print(f"Error: {str(e)}")
-
-
-def parse_test_result(parsed_data):
+            parse_report(bucket, key)
+        except Exception:
+            logger.exception(f"Failed to parse s3://{bucket}/{key}")
+            return False
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            logger.info(f"Processed s3://{bucket}/{key} in {elapsed:.0f} ms")
+    return True
+
+
+def parse_report(bucket, key):
+    """Parse a report and write its result to the run"""
+    response = s3.get_object(Bucket=bucket, Key=key)
+    parsed_data, results = read_report(response["Body"])
+    pk = parsed_data['pk']
+    sk = parsed_data['sk']
+    parsed_result = parse_test_result(parsed_data, results)
+    shard_total = parsed_data.get('shardTotal', 1)
+    shard_index = parsed_data.get('shardIndex', 0)
+    # results are compressed in the TEST item, those too large overflow to
+    # chunks next to the reports. The shards of a run share the item size.
+    result_store = ResultStore(bucket, s3_client=s3)
+    parsed_result.update(result_store.put(
+        parsed_result['result'],
+        f"{RESULT_PREFIX}/{get_id_from_key(pk)}/{shard_index}",
+        max_inline_size=MAX_INLINE_RESULT_SIZE // max(shard_total, 1),
+    ))
+
+    if shard_total > 1:
+        run = merge_shard_report(pk, sk, shard_index, parsed_result)
+        # the encoded results of the shard are the last ones of the run
+        data_index = max(len((run or {}).get(RESULT_DATA_ATTRIBUTE) or []) - 1, 0)
+    else:
+        run = update_run(pk, sk, parsed_result)
+        data_index = 0
+    if run is None:
+        return
+
+    # each test case is also written as an item, indexed by its node id
+    refs = result_store.locate(parsed_result, data_index=data_index)
+    cases = [
+        {
+            'nodeid': result['nodeid'],
+            'outcome': result['outcome'],
+            'duration': result['duration'],
+            'traceRef': ref,
+        }
+        for result, ref in zip(parsed_result['result'], refs)
+    ]
+    get_case_dao().put_test_cases(
+        get_id_from_key(pk), get_id_from_key(sk), run['createdAt'], cases
+    )
+
+
+def read_report(body):
+    """Read a report from the streaming body of its S3 object.
+
+    The report is not loaded in memory as a whole, its tests are parsed as
+    they are read, so only the stored fields of each test are kept.
+    """
+    parsed_data = {}
+    results = []
+    for prefix, value in iter_report(body):
+        if prefix == 'tests.item':
+            results.append(parse_test_case(value))
+        elif prefix in REPORT_FIELDS:
+            parsed_data[prefix] = value
+    return parsed_data, results
+
+
+def update_run(pk, sk, parsed_result):
+    """Write the report of a run which is not sharded.
+
+    Returns the previous TEST item, or None if the run is not found or aborted.
+    """
+    expression_attribute_names = {
+        '#status': 'status', 
+        '#failed': 'failed', 
+        '#passed': 'passed', 
+        '#total': 'total', 
+        '#updatedAt': 'updatedAt', 
+        '#duration': 'duration', 
+        '#resultData': RESULT_DATA_ATTRIBUTE,
+        '#resultChunks': RESULT_CHUNKS_ATTRIBUTE,
+        '#result': 'result',
+        '#inFlight': IN_FLIGHT_ATTRIBUTE}
+    # the results parsed before they were encoded are replaced, so that a
+    # report parsed again is not read twice
+    update_expression = 'SET #status = :value1, #failed = :value2, #passed = :value3, #total = :value4, #updatedAt = :value5, #duration = :value6, #resultData = :value7, #resultChunks = :value8 REMOVE #inFlight, #result'
+    expression_attribute_values = {
+        ':value1': parsed_result['status'], 
+        ':value2': parsed_result['failed'],
+        ':value3': parsed_result['passed'],
+        ':value4': parsed_result['total'],
+        ':value5': parsed_result['updatedAt'],
+        ':value6': parsed_result['duration'],
+        ':value7': parsed_result[RESULT_DATA_ATTRIBUTE],
+        ':value8': parsed_result[RESULT_CHUNKS_ATTRIBUTE],
+        ':aborted': ABORTED_STATUS}
+
+    try:
+        response = ddb_client.update_item(
+            TableName=ddb_table_name,
+            Key={'PK': pk, 'SK': sk},
+            UpdateExpression=update_expression,
+            # the report of an unknown run is not written, and a run
+            # stopped by the user stays ABORTED
+            ConditionExpression='attribute_exists(PK) AND (attribute_not_exists(#status) OR #status <> :aborted)',
+            ExpressionAttributeValues=expression_attribute_values,
+            ExpressionAttributeNames=expression_attribute_names,
+            ReturnValues='ALL_OLD'
+        )
+    except ddb_client.exceptions.ConditionalCheckFailedException:
+        # the record is acknowledged, a redelivery would not change it
+        logger.info(f"Run {pk} is not found or aborted, skip its result")
+        return None
+    previous_run = response['Attributes']
+    logger.info(f"Run {pk} finished: {parsed_result['status']}")
+    record_finished_run(pk, sk, previous_run, parsed_result['status'], parsed_result['duration'])
+    return previous_run
+
+
+def merge_shard_report(pk, sk, shard_index, parsed_result):
+    """Merge the report of a shard into the TEST item of its run.
+
+    The counts are added and the results appended by an update conditioned
+    on the shard not being merged yet, so a report delivered again is not
+    counted twice. The report of the last shard completes the run, with
+    the duration of the longest shard.
+
+    Returns the TEST item once the shard is merged, or None if the shard is
+    already merged, or the run is not found or aborted.
+    """
+    try:
+        response = ddb_client.update_item(
+            TableName=ddb_table_name,
+            Key={'PK': pk, 'SK': sk},
+            UpdateExpression=(
+                'ADD #passed :passed, #failed :failed, #total :total, '
+                '#reportedShards :shards, #shardDurations :durations '
+                'SET #resultData = list_append(if_not_exists(#resultData, :empty), :resultData), '
+                '#resultChunks = list_append(if_not_exists(#resultChunks, :empty), :resultChunks), '
+                '#updatedAt = :updatedAt '
+                'REMOVE #result'
+            ),
+            ConditionExpression=(
+                'attribute_exists(PK) '
+                'AND (attribute_not_exists(#reportedShards) OR NOT contains(#reportedShards, :shardIndex)) '
+                'AND #status <> :aborted'
+            ),
+            ExpressionAttributeNames={
+                '#status': 'status',
+                '#passed': 'passed',
+                '#failed': 'failed',
+                '#total': 'total',
+                '#reportedShards': 'reportedShards',
+                '#shardDurations': 'shardDurations',
+                '#resultData': RESULT_DATA_ATTRIBUTE,
+                '#resultChunks': RESULT_CHUNKS_ATTRIBUTE,
+                '#result': 'result',
+                '#updatedAt': 'updatedAt'},
+            ExpressionAttributeValues={
+                ':passed': parsed_result['passed'],
+                ':failed': parsed_result['failed'],
+                ':total': parsed_result['total'],
+                ':shards': {shard_index},
+                ':shardIndex': shard_index,
+                ':durations': {parsed_result['duration']},
+                ':resultData': parsed_result[RESULT_DATA_ATTRIBUTE],
+                ':resultChunks': parsed_result[RESULT_CHUNKS_ATTRIBUTE],
+                ':empty': [],
+                ':updatedAt': parsed_result['updatedAt'],
+                ':aborted': ABORTED_STATUS},
+            ReturnValues='ALL_NEW'
+        )
+    except ddb_client.exceptions.ConditionalCheckFailedException:
+        logger.info(f"Shard {shard_index} of run {pk} is already merged, not found or aborted")
+        return None
+    run = response['Attributes']
+    if len(run['reportedShards']) < run['shardTotal']:
+        logger.info(f"{len(run['reportedShards'])} of {run['shardTotal']} shards of run {pk} reported")
+        return run
+
+    status = 'PASS' if run['passed'] == run['total'] else 'FAILED'
+    duration = int(max(run['shardDurations']))
+    try:
+        response = ddb_client.update_item(
+            TableName=ddb_table_name,
+            Key={'PK': pk, 'SK': sk},
+            UpdateExpression='SET #status = :status, #duration = :duration REMOVE #inFlight',
+            ConditionExpression='#status = :running',
+            ExpressionAttributeNames={
+                '#status': 'status',
+                '#duration': 'duration',
+                '#inFlight': IN_FLIGHT_ATTRIBUTE},
+            ExpressionAttributeValues={
+                ':status': status,
+                ':duration': duration,
+                ':running': 'RUNNING'},
+            ReturnValues='ALL_OLD'
+        )
+    except ddb_client.exceptions.ConditionalCheckFailedException:
+        logger.info(f"Run {pk} is already finished")
+        return run
+    record_finished_run(pk, sk, response['Attributes'], status, duration)
+    return run
+
+
+def record_finished_run(pk, sk, previous_run, status, duration):
+    """Record a finished run on its checkpoint, statistics, launch slots and matrix run"""
+    # A report delivered again must not be counted twice, only the
+    # first result of a run is recorded.
+    if previous_run.get('status') in FINISHED_STATUS:
+        get_checkpoint_dao().update_latest_run(
+            get_id_from_key(sk),
+            get_id_from_key(pk),
+            status=status,
+            tested_at=previous_run['createdAt'],
+            duration=duration,
+        )
+        return
+    get_run_recorder().record(previous_run, status, duration)
+
+
+def parse_test_result(parsed_data, results):
     """Parse test result"""
     current_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    print(parsed_data)
     ddb_data = {}
     summary_result = parsed_data['summary']
-    test_detail = parsed_data['tests']
     if 'failed' in summary_result:
         ddb_data['failed'] = summary_result['failed']
     else:
@@ -84,22 +369,5 @@ def parse_test_result(parsed_data):
         ddb_data['status'] = 'FAILED'
     ddb_data['updatedAt'] = current_timestamp
     ddb_data['duration'] = int(parsed_data['duration'])
-    results = []
-    for each in test_detail:
-        result = {}
-        node_id = each['nodeid']
-        call = each['call']
-        outcome = call['outcome']
-        if 'crash' in call.keys():
-            result['message'] = call['crash']['message']
-        else:
-            result['message'] = '-'
-        if 'longrepr' in call.keys():
-            result['trace'] = call['longrepr']
-        else:
-            result['trace'] = '-'
-        results.append(result)
     ddb_data['result'] = results
     return ddb_data
-    
-        
\ No newline at end of file
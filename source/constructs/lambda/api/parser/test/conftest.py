@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import boto3
+import pytest
+from moto import mock_dynamodb, mock_s3
+
+TABLE_NAME = "mocked-test-table"
+BUCKET_NAME = "central-bucket"
+
+
+@pytest.fixture(autouse=True)
+def default_environment_variables():
+    """Mocked AWS evivronment variables such as AWS credentials and region"""
+    os.environ["AWS_ACCESS_KEY_ID"] = "mocked-aws-access-key-id"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "mocked-aws-secret-access-key"
+    os.environ["AWS_SESSION_TOKEN"] = "mocked-aws-session-token"
+    os.environ["AWS_REGION"] = "us-east-1"
+    os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
+    os.environ["TABLE"] = TABLE_NAME
+
+
+@pytest.fixture
+def aws_resources(default_environment_variables):
+    with mock_dynamodb(), mock_s3():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        ddb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = ddb.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+                {"AttributeName": "nodeid", "AttributeType": "S"},
+                {"AttributeName": "testedAt", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "nodeIdIndex",
+                    "KeySchema": [
+                        {"AttributeName": "nodeid", "KeyType": "HASH"},
+                        {"AttributeName": "testedAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        table.put_item(
+            Item={
+                "PK": "MARKER#m-001",
+                "SK": "PROJECT#p-001",
+                "entityType": "MARKER",
+                "projectName": "CLO",
+            }
+        )
+        yield s3, table
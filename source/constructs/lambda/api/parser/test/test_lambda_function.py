@@ -0,0 +1,221 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+from commonlib.cases import CaseDao
+from commonlib.checkpoint import CheckPointDao
+from commonlib.report import ResultStore
+from .conftest import BUCKET_NAME, TABLE_NAME
+
+MARKER_SK = "MARKER#m-001"
+
+
+def new_report(test_id, outcomes, **fields):
+    """A report in the format of pytest-json-report"""
+    tests = []
+    for i, outcome in enumerate(outcomes):
+        test = {
+            "nodeid": f"test/test_a.py::test_{i}",
+            "outcome": outcome,
+            "setup": {"duration": 0.25, "outcome": "passed"},
+            "call": {"duration": 1.5, "outcome": outcome},
+        }
+        if outcome == "failed":
+            test["call"]["crash"] = {"message": f"AssertionError: {i}"}
+            test["call"]["longrepr"] = f"E       assert {i} == 0"
+        tests.append(test)
+    passed = outcomes.count("passed")
+    return {
+        "created": 1700000000.0,
+        "duration": 120.5,
+        "exitcode": 0 if passed == len(outcomes) else 1,
+        "summary": {
+            "passed": passed,
+            "failed": len(outcomes) - passed,
+            "total": len(outcomes),
+        },
+        "tests": tests,
+        "pk": f"TEST#{test_id}",
+        "sk": MARKER_SK,
+        **fields,
+    }
+
+
+def put_report(s3, key, report):
+    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=json.dumps(report).encode())
+
+
+def s3_record(key):
+    return {
+        "eventSource": "aws:s3",
+        "s3": {"bucket": {"name": BUCKET_NAME}, "object": {"key": key}},
+    }
+
+
+def sqs_record(message_id, keys):
+    return {
+        "eventSource": "aws:sqs",
+        "messageId": message_id,
+        "body": json.dumps({"Records": [s3_record(key) for key in keys]}),
+    }
+
+
+def put_run(table, test_id, **attributes):
+    table.put_item(
+        Item={
+            "PK": f"TEST#{test_id}",
+            "SK": MARKER_SK,
+            "createdAt": "2024-01-01T00:00:00Z",
+            "status": "RUNNING",
+            "inFlight": "RUNNING",
+            "duration": "-",
+            **attributes,
+        }
+    )
+
+
+def get_run(table, test_id):
+    return table.get_item(Key={"PK": f"TEST#{test_id}", "SK": MARKER_SK}).get("Item")
+
+
+@pytest.fixture
+def lambda_function(aws_resources):
+    import lambda_function
+
+    yield lambda_function
+
+
+def test_parse_reports(lambda_function, aws_resources):
+    s3, table = aws_resources
+    put_run(table, "t-001", launchSlots=["ACCOUNT"])
+    put_run(table, "t-002")
+    put_report(s3, "reports/t-001.json", new_report("t-001", ["passed", "failed"]))
+    put_report(s3, "reports/t-002.json", new_report("t-002", ["passed"]))
+    put_report(s3, "reports/t-404.json", new_report("t-404", ["passed"]))
+    s3.put_object(Bucket=BUCKET_NAME, Key="reports/invalid.json", Body=b'{"pk": ')
+
+    response = lambda_function.lambda_handler(
+        {
+            "Records": [
+                s3_record("reports/t-001.json"),
+                sqs_record("message-1", ["reports/t-002.json"]),
+                # the report of an unknown run is acknowledged
+                sqs_record("message-2", ["reports/t-404.json"]),
+                sqs_record("message-3", ["reports/invalid.json"]),
+                s3_record("reports/missing.json"),
+            ]
+        },
+        None,
+    )
+
+    assert response == {
+        "batchItemFailures": [
+            {"itemIdentifier": "message-3"},
+            {"itemIdentifier": "reports/missing.json"},
+        ]
+    }
+    assert get_run(table, "t-404") is None
+
+    run = get_run(table, "t-001")
+    assert run["status"] == "FAILED"
+    assert (run["passed"], run["failed"], run["total"]) == (1, 1, 2)
+    assert "inFlight" not in run and "result" not in run
+    results = ResultStore(s3_client=s3).read(run)
+    assert [result["outcome"] for result in results] == ["passed", "failed"]
+    assert results[1]["message"] == "AssertionError: 1"
+    assert results[1]["duration"] == 1.75
+    assert get_run(table, "t-002")["status"] == "PASS"
+
+    # the latest run and the statistics of the checkpoint
+    dao = CheckPointDao(TABLE_NAME)
+    assert dao.get_marker("m-001")["latestTestId"] in ("t-001", "t-002")
+    stats = table.get_item(Key={"PK": "STATS#m-001", "SK": "TOTAL"})["Item"]
+    assert (stats["runs"], stats["passes"]) == (2, 1)
+
+    # each test case is an item, which points to its result
+    cases, _ = CaseDao(TABLE_NAME).list_test_case_history("test/test_a.py::test_1")
+    assert [(case["PK"], case["outcome"]) for case in cases] == [
+        ("TEST#t-001", "failed")
+    ]
+    assert ResultStore(s3_client=s3).read_refs([cases[0]["traceRef"]], [run]) == [
+        results[1]
+    ]
+
+
+def test_parse_sharded_report(lambda_function, aws_resources):
+    s3, table = aws_resources
+    put_run(table, "t-001", shardTotal=2)
+    for shard, outcomes in enumerate((["passed", "passed"], ["failed"])):
+        put_report(
+            s3,
+            f"reports/t-001/{shard}.json",
+            new_report("t-001", outcomes, shardIndex=shard, shardTotal=2),
+        )
+
+    event = {
+        "Records": [
+            sqs_record(f"message-{i}", [f"reports/t-001/{i}.json"]) for i in (0, 1)
+        ]
+    }
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+    # the reports delivered again are not merged twice
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+
+    run = get_run(table, "t-001")
+    assert run["status"] == "FAILED"
+    assert (run["passed"], run["failed"], run["total"]) == (2, 1, 3)
+    assert len(ResultStore(s3_client=s3).read(run)) == 3
+
+    dao = CaseDao(TABLE_NAME)
+    for i in range(2):
+        cases, _ = dao.list_test_case_history(f"test/test_a.py::test_{i}")
+        results = ResultStore(s3_client=s3).read_refs(
+            [case["traceRef"] for case in cases], [run] * len(cases)
+        )
+        assert {result["outcome"] for result in results} == {
+            case["outcome"] for case in cases
+        }
+
+
+def test_parse_aborted_run(lambda_function, aws_resources):
+    s3, table = aws_resources
+    put_run(table, "t-001", status="ABORTED")
+    put_report(s3, "reports/t-001.json", new_report("t-001", ["passed"]))
+
+    response = lambda_function.lambda_handler(
+        {"Records": [s3_record("reports/t-001.json")]}, None
+    )
+
+    assert response == {"batchItemFailures": []}
+    assert get_run(table, "t-001")["status"] == "ABORTED"
+
+
+def test_parse_report_again(lambda_function, aws_resources):
+    s3, table = aws_resources
+    # runs parsed before the results were encoded
+    legacy_result = [{"nodeid": "test/test_a.py::test_0", "outcome": "passed"}]
+    put_run(table, "t-001", result=legacy_result)
+    put_run(table, "t-002", shardTotal=2, result=legacy_result)
+    put_report(s3, "reports/t-001.json", new_report("t-001", ["passed"]))
+    put_report(
+        s3,
+        "reports/t-002/0.json",
+        new_report("t-002", ["passed"], shardIndex=0, shardTotal=2),
+    )
+
+    event = {
+        "Records": [
+            s3_record("reports/t-001.json"),
+            s3_record("reports/t-001.json"),
+            s3_record("reports/t-002/0.json"),
+        ]
+    }
+    assert lambda_function.lambda_handler(event, None) == {"batchItemFailures": []}
+
+    for test_id in ("t-001", "t-002"):
+        run = get_run(table, test_id)
+        assert "result" not in run
+        assert len(ResultStore(s3_client=s3).read(run)) == 1
@@ -0,0 +1,146 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+from commonlib.checkpoint import CheckPointDao
+from commonlib.in_flight import InFlightRunDao
+from commonlib.runs import FinishedRunRecorder
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table_name = os.environ["TABLE"]
+
+codebuild_client = boto3.client("codebuild", region_name=os.environ.get("REGION"))
+checkpoint_dao = CheckPointDao(table_name)
+in_flight_run_dao = InFlightRunDao(table_name)
+run_recorder = FinishedRunRecorder(table_name)
+
+# Max number of ids in a BatchGetBuilds request
+BATCH_GET_BUILDS_MAX_IDS = 100
+
+# A finished build is reconciled only after this delay, so that the parser
+# has the time to write the result of the report uploaded by the build.
+GRACE_PERIOD = timedelta(minutes=int(os.environ.get("GRACE_PERIOD_MINUTES", "15")))
+
+# Status of a run which finished without a report, by build status. A build
+# which succeeded without a report is an error of the test project.
+BUILD_STATUS = {
+    "SUCCEEDED": "ERROR",
+    "FAILED": "FAILED",
+    "FAULT": "ERROR",
+    "STOPPED": "ERROR",
+    "TIMED_OUT": "TIMED_OUT",
+}
+# Status of a sharded run, the first status of a shard in this order
+STATUS_PRIORITY = ["ERROR", "TIMED_OUT", "FAILED"]
+
+
+def lambda_handler(event, context):
+    """Finish the RUNNING runs whose build finished without a report."""
+    deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - 10
+    now = datetime.now(timezone.utc)
+    created_before = (now - GRACE_PERIOD).strftime("%Y-%m-%dT%H:%M:%SZ")
+    stats = {"checked": 0, "finished": 0}
+    next_token = ""
+    while True:
+        runs, next_token = in_flight_run_dao.list_in_flight_runs(
+            limit=BATCH_GET_BUILDS_MAX_IDS,
+            next_token=next_token,
+            created_before=created_before,
+        )
+        stats["checked"] += len(runs)
+        stats["finished"] += reconcile_runs(runs, now)
+        if not next_token or time.time() > deadline:
+            break
+
+    if stats["finished"]:
+        checkpoint_dao.bump_generation()
+    logger.info(f"Reconciled runs in flight: {stats}")
+    return stats
+
+
+def get_build_id(codebuild_arn: str) -> str:
+    """Get the build id, e.g. project:uuid, from the ARN of a build"""
+    return codebuild_arn.split(":build/", 1)[-1]
+
+
+def get_final_status(builds: list, now: datetime):
+    """Get the status and duration of a run from the builds of its shards.
+
+    Returns:
+        tuple: The status and duration, or None if a build is in progress,
+            or finished too recently to have been parsed.
+    """
+    if not builds or any(build is None for build in builds):
+        # a build was never started, or does not exist anymore, only runs
+        # created before the grace period are reconciled.
+        return "ERROR", "-"
+    for build in builds:
+        if build["buildStatus"] not in BUILD_STATUS or "endTime" not in build:
+            return None
+        if now - build["endTime"] < GRACE_PERIOD:
+            return None
+    statuses = {BUILD_STATUS[build["buildStatus"]] for build in builds}
+    status = next(
+        (status for status in STATUS_PRIORITY if status in statuses), "ERROR"
+    )
+    duration = max(build["endTime"] for build in builds) - min(
+        build["startTime"] for build in builds
+    )
+    return status, int(duration.total_seconds())
+
+
+def get_build_arns(run: dict) -> list:
+    """Get the ARNs of the builds of a run, one per shard"""
+    build_arns = run.get("shardBuildArns") or [run.get("codeBuildArn", "-")]
+    return [build_arn for build_arn in build_arns if build_arn != "-"]
+
+
+def reconcile_runs(runs: list, now: datetime) -> int:
+    """Finish a page of runs from the status of their builds.
+
+    Returns:
+        int: Number of runs finished.
+    """
+    build_ids = [
+        get_build_id(build_arn) for run in runs for build_arn in get_build_arns(run)
+    ]
+    builds = {}
+    for i in range(0, len(build_ids), BATCH_GET_BUILDS_MAX_IDS):
+        response = codebuild_client.batch_get_builds(
+            ids=build_ids[i : i + BATCH_GET_BUILDS_MAX_IDS]
+        )
+        builds.update({build["id"]: build for build in response.get("builds", [])})
+
+    updates = []
+    for run in runs:
+        build_arns = get_build_arns(run)
+        final_status = get_final_status(
+            [builds.get(get_build_id(build_arn)) for build_arn in build_arns], now
+        )
+        if final_status is None:
+            continue
+        status, duration = final_status
+        updates.append(
+            {"PK": run["PK"], "SK": run["SK"], "status": status, "duration": duration}
+        )
+
+    finished = 0
+    previous_runs = in_flight_run_dao.finish_runs(updates, return_exceptions=True)
+    for update, previous_run in zip(updates, previous_runs):
+        if previous_run is None or isinstance(previous_run, Exception):
+            # finished meanwhile, or retried by the next reconciliation
+            continue
+        # the run finished without report, it is recorded as the parser
+        # records a parsed report
+        logger.info(f"Run {previous_run['PK']} finished without report")
+        run_recorder.record(previous_run, update["status"], update["duration"])
+        finished += 1
+    return finished
@@ -0,0 +1,210 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from commonlib.checkpoint import CheckPointDao
+from commonlib.in_flight import InFlightRunDao
+from commonlib.launch import ACCOUNT_SCOPE, DynamoDBLaunchSlots
+from commonlib.runs import FinishedRunRecorder
+from .conftest import TABLE_NAME
+
+NOW = datetime.now(timezone.utc)
+# started before the grace period of the reconciler
+STARTED_AT = NOW - timedelta(hours=2)
+
+
+def get_build_arn(build_id):
+    return f"arn:aws:codebuild:us-east-1:123456789012:build/{build_id}"
+
+
+def new_build(build_id, status, ended_ago=timedelta(hours=1), started_at=STARTED_AT):
+    build = {"id": build_id, "buildStatus": status, "startTime": started_at}
+    if status != "IN_PROGRESS":
+        build["endTime"] = NOW - ended_ago
+    return build
+
+
+class FakeCodeBuildClient:
+    """Returns the builds it knows of, and records the ids requested"""
+
+    def __init__(self, builds):
+        self.builds = {build["id"]: build for build in builds}
+        self.requests = []
+
+    def batch_get_builds(self, ids):
+        self.requests.append(ids)
+        return {
+            "builds": [self.builds[id] for id in ids if id in self.builds],
+            "buildsNotFound": [id for id in ids if id not in self.builds],
+        }
+
+
+class FakeContext:
+    def get_remaining_time_in_millis(self):
+        return 60000
+
+
+def put_run(table, test_id, build_arns, **attributes):
+    item = {
+        "PK": f"TEST#{test_id}",
+        "SK": "MARKER#m-001",
+        "createdAt": STARTED_AT.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "status": "RUNNING",
+        "inFlight": "RUNNING",
+        "duration": "-",
+        "codeBuildArn": build_arns[0] if build_arns else "-",
+        **attributes,
+    }
+    if len(build_arns) > 1:
+        item["shardBuildArns"] = build_arns
+    table.put_item(Item=item)
+
+
+def get_run(table, test_id):
+    return table.get_item(Key={"PK": f"TEST#{test_id}", "SK": "MARKER#m-001"})[
+        "Item"
+    ]
+
+
+@pytest.fixture
+def lambda_function(ddb_table, monkeypatch):
+    import lambda_function
+
+    monkeypatch.setattr(lambda_function, "checkpoint_dao", CheckPointDao(TABLE_NAME))
+    monkeypatch.setattr(
+        lambda_function, "in_flight_run_dao", InFlightRunDao(TABLE_NAME)
+    )
+    monkeypatch.setattr(
+        lambda_function, "run_recorder", FinishedRunRecorder(TABLE_NAME)
+    )
+    yield lambda_function
+
+
+def test_reconcile_runs(lambda_function, ddb_table, monkeypatch):
+    builds = [
+        new_build("p:failed", "FAILED"),
+        new_build("p:in-progress", "IN_PROGRESS"),
+        new_build("p:recent", "SUCCEEDED", ended_ago=timedelta(minutes=1)),
+        new_build("p:shard-0", "FAILED", ended_ago=timedelta(minutes=30)),
+        new_build(
+            "p:shard-1",
+            "TIMED_OUT",
+            started_at=STARTED_AT + timedelta(minutes=5),
+        ),
+    ]
+    codebuild_client = FakeCodeBuildClient(builds)
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+
+    slots = DynamoDBLaunchSlots(TABLE_NAME)
+    slots.acquire(ACCOUNT_SCOPE, 10)
+    ddb_table.put_item(
+        Item={
+            "PK": "MATRIX#x-001",
+            "SK": "MARKER#m-001",
+            "status": "RUNNING",
+            "total": 1,
+            "finished": 0,
+            "passes": 0,
+            "failures": 0,
+        }
+    )
+    put_run(
+        ddb_table,
+        "t-failed",
+        [get_build_arn("p:failed")],
+        launchSlots=[ACCOUNT_SCOPE],
+        matrixRunId="x-001",
+    )
+    put_run(ddb_table, "t-in-progress", [get_build_arn("p:in-progress")])
+    put_run(ddb_table, "t-recent", [get_build_arn("p:recent")])
+    put_run(ddb_table, "t-missing", [get_build_arn("p:missing")])
+    # a run whose build was never started
+    put_run(ddb_table, "t-no-build", [])
+    put_run(
+        ddb_table,
+        "t-sharded",
+        [get_build_arn("p:shard-0"), get_build_arn("p:shard-1")],
+    )
+    # a run created within the grace period is not checked
+    put_run(
+        ddb_table,
+        "t-new",
+        [get_build_arn("p:new")],
+        createdAt=NOW.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    )
+
+    stats = lambda_function.lambda_handler({}, FakeContext())
+
+    assert stats == {"checked": 6, "finished": 4}
+    assert "p:new" not in sum(codebuild_client.requests, [])
+
+    failed = get_run(ddb_table, "t-failed")
+    assert failed["status"] == "FAILED"
+    assert failed["duration"] == 3600
+    assert "inFlight" not in failed
+    assert get_run(ddb_table, "t-missing")["status"] == "ERROR"
+    assert get_run(ddb_table, "t-no-build")["status"] == "ERROR"
+    sharded = get_run(ddb_table, "t-sharded")
+    # the status of the shards by priority, from the first start to the last end
+    assert sharded["status"] == "TIMED_OUT"
+    assert sharded["duration"] == 5400
+    for test_id in ("t-in-progress", "t-recent", "t-new"):
+        run = get_run(ddb_table, test_id)
+        assert run["status"] == "RUNNING" and run["inFlight"] == "RUNNING"
+
+    # the finished runs are recorded as the parser records a result
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 0
+    matrix_run = ddb_table.get_item(Key={"PK": "MATRIX#x-001", "SK": "MARKER#m-001"})[
+        "Item"
+    ]
+    assert matrix_run["status"] == "FAILED"
+    stats = ddb_table.get_item(Key={"PK": "STATS#m-001", "SK": "TOTAL"})["Item"]
+    assert (stats["runs"], stats["failures"]) == (4, 4)
+    marker = ddb_table.get_item(Key={"PK": "MARKER#m-001", "SK": "PROJECT#p-001"})[
+        "Item"
+    ]
+    assert marker["status"] in {"FAILED", "ERROR", "TIMED_OUT"}
+
+    # the finished runs are no longer in flight
+    assert lambda_function.lambda_handler({}, FakeContext()) == {
+        "checked": 2,
+        "finished": 0,
+    }
+
+
+def test_reconcile_pages(lambda_function, ddb_table, monkeypatch):
+    builds = [new_build(f"p:{i}", "IN_PROGRESS") for i in range(5)]
+    codebuild_client = FakeCodeBuildClient(builds)
+    monkeypatch.setattr(lambda_function, "codebuild_client", codebuild_client)
+    monkeypatch.setattr(lambda_function, "BATCH_GET_BUILDS_MAX_IDS", 2)
+    for i in range(5):
+        put_run(
+            ddb_table,
+            f"t-{i}",
+            [get_build_arn(f"p:{i}")],
+            createdAt=(STARTED_AT + timedelta(seconds=i)).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+        )
+
+    assert lambda_function.lambda_handler({}, FakeContext()) == {
+        "checked": 5,
+        "finished": 0,
+    }
+    # the runs are read by pages of BATCH_GET_BUILDS_MAX_IDS, oldest first
+    assert codebuild_client.requests == [["p:0", "p:1"], ["p:2", "p:3"], ["p:4"]]
+
+
+def test_get_final_status():
+    from lambda_function import get_final_status
+
+    assert get_final_status([], NOW) == ("ERROR", "-")
+    assert get_final_status([None], NOW) == ("ERROR", "-")
+    assert get_final_status([new_build("p:1", "IN_PROGRESS")], NOW) is None
+    assert get_final_status([new_build("p:1", "SUCCEEDED")], NOW) == ("ERROR", 3600)
+    assert get_final_status(
+        [new_build("p:1", "FAILED"), new_build("p:2", "FAULT")], NOW
+    ) == ("ERROR", 3600)
@@ -3,46 +3,199 @@
 
 import logging
 import os
-from datetime import datetime
+import shlex
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import uuid
-from enum import Enum
 
-from boto3.dynamodb.conditions import Attr, Key
-
-from commonlib import AWSConnection, handle_error, AppSyncRouter
+from commonlib import handle_error, AppSyncRouter
+from commonlib.exception import APIException, ErrorCode
+from commonlib.builds import start_shard_builds, stop_build
+from commonlib.cache import LRUCache
+from commonlib.cases import CaseDao
+from commonlib.checkpoint import ENTITY_TYPE, CheckPointDao
+from commonlib.in_flight import IN_FLIGHT_ATTRIBUTE, IN_FLIGHT_STATUSES, InFlightRunDao
+from commonlib.launch import (
+    ACCOUNT_SCOPE,
+    DynamoDBLaunchSlots,
+    SQSLaunchQueue,
+)
+from commonlib.launch_stats import LaunchQueueStatsDao
+from commonlib.matrix import expand_matrix, to_combination, to_parameters
+from commonlib.matrix_dao import MatrixRunDao
+from commonlib.project import DEFAULT_PROJECT_TTL, ProjectRegistry, map_parameters
+from commonlib.project_dao import ProjectDao
+from commonlib.report import RESULT_DATA_ATTRIBUTE, ResultStore
+from commonlib.runs import FinishedRunRecorder
+from commonlib.stats import (
+    DURATION_BUCKETS,
+    STATS_DAY_PREFIX,
+    RunStatsDao,
+    get_bucket_name,
+)
+from commonlib.tokens import ClientTokenDao
 from commonlib.utils import paginate
 
 import boto3
 
 
-class ENTITY_TYPE(Enum):
-    MARKER = "MARKER"
-    PROJECT = "PROJECT"
-    TEST = "TEST"
-
-
-metadata_json = {
+# Settings of the projects onboarded before projects were registered in the
+# table, they are registered by backfillCheckPoints on deployment. Other
+# projects are registered with the putProject mutation.
+LEGACY_PROJECTS = {
     "CLO": {
         "region": "ap-northeast-1",
         "branch": "develop",
-        "codecommit_repo": "https://git-codecommit.us-west-2.amazonaws.com/v1/repos/Loghub-test",
+        "codecommitRepo": "https://git-codecommit.us-west-2.amazonaws.com/v1/repos/Loghub-test",
+        "parameterMapping": [
+            {"parameterKey": "buffer", "name": "buffer_layer"},
+            {"parameterKey": "logType", "name": "log_type"},
+        ],
+        "passUnmapped": True,
     }
 }
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-conn = AWSConnection()
 router = AppSyncRouter()
 
 table_name = os.environ.get("TABLE")
-
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(table_name)
 codebuild_project = os.environ.get("CODEBUILD_PROJECT_NAME")
 current_region = os.environ.get("REGION")
 current_partition = os.environ.get("PARTITION")
-codebuild_client = boto3.client("codebuild", region_name=current_region)
+max_concurrent_launches = int(os.environ.get("MAX_CONCURRENT_LAUNCHES", "10"))
+launch_queue_url = os.environ.get("LAUNCH_QUEUE_URL")
+dispatcher_function = os.environ.get("DISPATCHER_FUNCTION_NAME")
+# Client tokens of startSingleTest expire after this number of seconds
+client_token_ttl = int(os.environ.get("CLIENT_TOKEN_TTL", str(24 * 3600)))
+project_ttl = int(os.environ.get("PROJECT_CACHE_TTL", str(DEFAULT_PROJECT_TTL)))
+
+# Runs started within this window and still RUNNING are considered in
+# progress, older ones are likely stuck and are started again.
+RUNNING_RUN_WINDOW = timedelta(hours=8)
+
+# Outcomes of the tests which are rerun by rerunFailed
+FAILED_OUTCOMES = ("failed", "error")
+# Max number of tests of a rerun, the ids of the tests are passed to the
+# build in a variable.
+MAX_RERUN_TESTS = 200
+# Max size in bytes of the variable of the tests of a rerun, the ids of
+# parametrized tests can be long, and the variables of a build are limited.
+MAX_RERUN_TESTS_BYTES = int(os.environ.get("MAX_RERUN_TESTS_BYTES", "4096"))
+
+# Max number of shards of a run, each shard is a build of the test project
+MAX_SHARDS = 20
+
+# Statuses of the runs in progress, which can be stopped
+STOPPABLE_STATUS = ("QUEUED", "RUNNING")
+
+
+# AWS clients are created on first use and then kept in the warm container,
+# so that queries do not pay for the clients they never use on cold start.
+@lru_cache(maxsize=None)
+def get_table():
+    return boto3.resource("dynamodb").Table(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_codebuild_client():
+    return boto3.client("codebuild", region_name=current_region)
+
+
+@lru_cache(maxsize=None)
+def get_checkpoint_dao() -> CheckPointDao:
+    return CheckPointDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_in_flight_run_dao() -> InFlightRunDao:
+    return InFlightRunDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_project_dao() -> ProjectDao:
+    return ProjectDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_launch_queue_stats_dao() -> LaunchQueueStatsDao:
+    return LaunchQueueStatsDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_run_recorder() -> FinishedRunRecorder:
+    return FinishedRunRecorder(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_case_dao() -> CaseDao:
+    return CaseDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_matrix_run_dao() -> MatrixRunDao:
+    return MatrixRunDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_run_stats_dao() -> RunStatsDao:
+    return RunStatsDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_client_token_dao() -> ClientTokenDao:
+    return ClientTokenDao(table_name)
+
+
+@lru_cache(maxsize=None)
+def get_project_registry() -> ProjectRegistry:
+    return ProjectRegistry(get_project_dao(), ttl=project_ttl)
+
+
+@lru_cache(maxsize=None)
+def get_result_store() -> ResultStore:
+    # the chunks of the results carry their bucket
+    return ResultStore(s3_client=boto3.client("s3"))
+
+
+@lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client("lambda")
+
+
+@lru_cache(maxsize=None)
+def get_launch_queue():
+    return SQSLaunchQueue(launch_queue_url) if launch_queue_url else None
+
+
+@lru_cache(maxsize=None)
+def get_launch_slots() -> DynamoDBLaunchSlots:
+    return DynamoDBLaunchSlots(table_name)
+
+
+# Results of list queries are cached in the warm container, and invalidated
+# by the table generation which is increased on every write. The generation
+# is read again at most once per READ_CACHE_VERSION_TTL seconds, so that the
+# writes of other containers are seen within this delay.
+read_cache = LRUCache(
+    maxsize=int(os.environ.get("READ_CACHE_SIZE", "256")),
+    ttl=int(os.environ.get("READ_CACHE_TTL", "30")),
+    version_ttl=float(os.environ.get("READ_CACHE_VERSION_TTL", "1")),
+)
+
+
+def get_generation() -> int:
+    return get_checkpoint_dao().get_generation()
+
+
+def bump_generation() -> None:
+    """Increase the generation of the table after a write, the results
+    cached in this container are dropped at once."""
+    get_checkpoint_dao().bump_generation()
+    read_cache.clear()
 
 
 @handle_error
@@ -51,58 +204,150 @@ def lambda_handler(event, _):
 
 
 @router.route(field_name="listTestCheckPoints")
-def list_test_checkpoints(page=1, count=20):
-    """List test checkpoints"""
-    logger.info(
-        f"List TestCheckPoints from JSON file in page {page} with {count} of records"
-    )
-
-    response = table.scan(
-        FilterExpression=Attr("PK").begins_with(f"{ENTITY_TYPE.MARKER.value}#"),
-    )
+@read_cache.cached(get_version=get_generation)
+def list_test_checkpoints(page=None, count=20, nextToken=None):
+    """List test checkpoints
 
-    items = response.get("Items", [])
-    total = response.get("Count", 0)
+    If page is not provided, the checkpoints are paginated with nextToken.
+    """
+    if page is None:
+        logger.info(f"List TestCheckPoints with {count} of records from {nextToken}")
+        items, next_token = get_checkpoint_dao().list_markers(
+            limit=count, next_token=nextToken
+        )
+        total = get_checkpoint_dao().count_markers()
+    else:
+        logger.info(f"List TestCheckPoints in page {page} with {count} of records")
+        items, next_token = get_checkpoint_dao().list_markers()
 
     for item in items:
         pk = item.get("PK", "")
         item["id"] = pk.split("#")[1] if "#" in pk else pk
 
-        history_response = table.query(
-            IndexName="sortCreatedAtIndex",
-            KeyConditionExpression=Key("SK").eq(
-                f"{ENTITY_TYPE.MARKER.value}#{item['id']}"
-            ),
-            ScanIndexForward=False,
-            Limit=1,
-        )
+    if page is None:
+        checkPoints = items
+    else:
+        total, checkPoints = paginate(items, page, count, sort_by="id")
 
-        latest_test = history_response.get("Items", [])
-        if latest_test:
-            item["status"] = latest_test[0].get("status", "UNKNOWN")
-        else:
-            item["status"] = "UNKNOWN"
+    # The latest run is materialized on the MARKER item when it starts and
+    # finishes. The runs in progress are read again by their id from the
+    # MARKER items, in one BatchGetItem, in case their result was not
+    # materialized yet. Only the checkpoints not backfilled yet query their
+    # latest run.
+    unresolved = [
+        item
+        for item in checkPoints
+        if "status" not in item or item["status"] in STOPPABLE_STATUS
+    ]
+    latest_status = get_checkpoint_dao().batch_get_latest_status(
+        [item["id"] for item in unresolved],
+        {
+            item["id"]: item["latestTestId"]
+            for item in unresolved
+            if item.get("latestTestId")
+        },
+    )
+    for item in unresolved:
+        item["status"] = latest_status[item["id"]]
 
-    total, checkPoints = paginate(items, page, count, sort_by="id")
     return {
         "total": total,
         "checkPoints": checkPoints,
+        "nextToken": next_token,
     }
 
 
-@router.route(field_name="listTestHistory")
-def list_test_history(id, page=1, count=20):
-    """List test history"""
-    logger.info(f"List history from JSON file in page {page} with {count} of records")
-
-    response = table.query(
-        IndexName="sortCreatedAtIndex",
-        KeyConditionExpression=Key("SK").eq(f"{ENTITY_TYPE.MARKER.value}#{id}"),
-        ScanIndexForward=False,
+@router.route(field_name="backfillCheckPoints")
+def backfill_checkpoints():
+    """Backfill the entity type and the latest run on existing checkpoints.
+
+    This is not exposed in the GraphQL schema, it is invoked by the
+    custom resource during deployment.
+    """
+    get_project_dao().backfill_projects(LEGACY_PROJECTS)
+    get_in_flight_run_dao().backfill_in_flight_runs()
+    return get_checkpoint_dao().backfill_markers()
+
+
+def backfill_handler(event, context):
+    """Backfill existing checkpoints on deployment.
+
+    Invoked by the custom resource provider, which waits for it and fails
+    the deployment if it raises. Nothing is done when the stack is deleted.
+    """
+    logger.info(f"Backfill checkpoints on {event['RequestType']}")
+    if event["RequestType"] == "Delete":
+        return {}
+    return {"Data": {"updated": backfill_checkpoints()}}
+
+
+def format_project(item: dict) -> dict:
+    item["id"] = item["PK"].split("#")[1]
+    item.setdefault("parameterMapping", [])
+    item.setdefault("passUnmapped", False)
+    return item
+
+
+@router.route(field_name="listProjects")
+def list_projects():
+    return [format_project(item) for item in get_project_dao().list_projects()]
+
+
+@router.route(field_name="putProject")
+def put_project(
+    projectName: str,
+    codecommitRepo: str,
+    branch: str,
+    region: str,
+    id: str = "",
+    parameterMapping=None,
+    passUnmapped: bool = False,
+):
+    """Register a project, or update the settings of a registered project.
+
+    The settings are used by the next runs of the project once the cached
+    project expires in the warm containers, without a redeployment.
+    """
+    project_id = id or str(uuid.uuid4())
+    logger.info(f"Put project {projectName} ({project_id})")
+    item = get_project_dao().put_project(
+        project_id,
+        {
+            "projectName": projectName,
+            "codecommitRepo": codecommitRepo,
+            "branch": branch,
+            "region": region,
+            "parameterMapping": [
+                {"parameterKey": rule["parameterKey"], "name": rule["name"]}
+                for rule in parameterMapping or []
+            ],
+            "passUnmapped": passUnmapped,
+        },
     )
+    get_project_registry().invalidate()
+    return format_project(item)
 
-    items = response.get("Items", [])
-    total = response.get("Count", 0)
+
+@router.route(field_name="listTestHistory")
+@read_cache.cached(get_version=get_generation)
+def list_test_history(id, page=None, count=20, nextToken=None):
+    """List test history
+
+    If page is not provided, the test history is paginated with nextToken.
+    """
+    if page is None:
+        logger.info(f"List history with {count} of records from {nextToken}")
+        items, next_token = get_checkpoint_dao().list_test_histories(
+            id, limit=count, next_token=nextToken, summary=True
+        )
+    else:
+        logger.info(f"List history in page {page} with {count} of records")
+        # The index returns the latest runs first, only the runs up to the
+        # requested page are read.
+        items, next_token = get_checkpoint_dao().list_test_histories(
+            id, limit=page * count, summary=True
+        )
+    total = get_checkpoint_dao().count_test_histories(id)
 
     for item in items:
         pk = item.get("PK", "")
@@ -110,31 +355,70 @@ def list_test_history(id, page=1, count=20):
         sk = item.get("SK", "")
         item["markerId"] = sk.split("#")[1] if "#" in sk else sk
 
-    total, testHistories = paginate(items, page, count, sort_by="createdAt")
+    if page is None:
+        testHistories = items
+    else:
+        _, testHistories = paginate(items, page, count, sort_by="createdAt")
 
     return {
         "total": total,
         "testHistories": testHistories,
+        "nextToken": next_token,
     }
 
 
+@router.route(field_name="result", type_name="TestHistory", batch=True)
+def get_test_history_results(sources: list, arguments: list):
+    """Get the result of test histories when it is selected.
+
+    Lists of test history only read the summary attributes, the results of
+    a page are loaded here at once, as AppSync batches this field resolver.
+    The results are decoded only here, large results are read from their
+    chunks in S3, only the chunks of the requested offset and limit.
+    """
+    logger.info(f"Get result of {len(sources)} test histories")
+    run_keys = [
+        (source["id"], source["markerId"])
+        for source in sources
+        if "result" not in source
+    ]
+    items = iter(get_checkpoint_dao().batch_get_test_results(run_keys))
+    results = []
+    for source, args in zip(sources, arguments):
+        item = source if "result" in source else next(items)
+        try:
+            results.append(
+                get_result_store().read(
+                    item, offset=args.get("offset") or 0, limit=args.get("limit")
+                )
+            )
+        except Exception as e:
+            logger.error(f"Failed to read the result of {source.get('id')}: {e}")
+            results.append(
+                APIException(ErrorCode.UNKNOWN_ERROR, "Failed to read the result")
+            )
+    return results
+
+
 @router.route(field_name="getTestHistory")
-def get_test_history(id: str):
-    """Get test history for a given ID."""
+def get_test_history(id: str, markerId: str = ""):
+    """Get test history for a given ID.
+
+    If markerId is provided, the test history is read by its full key. The
+    encoded results are not returned, they are read by the result field
+    only when it is selected.
+    """
     logger.info(f"Get test history for ID: {id}")
 
     try:
-        response = table.query(
-            KeyConditionExpression=Key("PK").eq(f"{ENTITY_TYPE.TEST.value}#{id}")
-        )
-        items = response.get("Items", [])
+        item = get_checkpoint_dao().get_test_history(id, markerId)
 
-        if items:
-            item = items[0]
+        if item:
             pk = item.get("PK", "")
             item["id"] = pk.split("#")[1] if "#" in pk else pk
             sk = item.get("SK", "")
             item["markerId"] = sk.split("#")[1] if "#" in sk else sk
+            item.pop(RESULT_DATA_ATTRIBUTE, None)
 
             return item
         else:
@@ -146,112 +430,173 @@ def get_test_history(id: str):
         return None
 
 
-def pass_parameters_to_codebuild(parameters, project_name):
-    codebuild_params_json = {}
-    if project_name == "CLO":
-        for param in parameters:
-            parameter_key = param.get("parameterKey")
-            parameter_value = param.get("parameterValue")
-            if parameter_key == "buffer":
-                codebuild_params_json["buffer_layer"] = parameter_value
-            elif parameter_key == "logType":
-                codebuild_params_json["log_type"] = parameter_value
-            else:
-                codebuild_params_json[parameter_key] = parameter_value
-    codebuild_params_list = [codebuild_params_json]
-    logger.info(f"CodeBuild parameters: {codebuild_params_list}")
-    return codebuild_params_list
+@router.route(field_name="listTestCaseHistory")
+def list_test_case_history(nodeid: str, count=20, nextToken=None):
+    """List the runs of a test case, latest first.
+
+    Each test case of a run is stored as its own item, the node id index
+    serves the history of a test case in a single query.
+    """
+    logger.info(f"List history of test case {nodeid} with {count} of records")
+    items, next_token = get_case_dao().list_test_case_history(
+        nodeid, limit=count, next_token=nextToken or ""
+    )
+    for item in items:
+        pk = item.get("PK", "")
+        item["testId"] = pk.split("#")[1] if "#" in pk else pk
+
+    return {"testCases": items, "nextToken": next_token}
 
 
-def update_environment_variables(codebuild_project, environment_variables):
-    project_info = codebuild_client.batch_get_projects(names=[codebuild_project])
-    current_environment_variables = project_info["projects"][0]["environment"][
-        "environmentVariables"
+@router.route(field_name="result", type_name="TestCase", batch=True)
+def get_test_case_results(sources: list, arguments: list):
+    """Get the message and trace of test cases when they are selected.
+
+    The traceRef of a test case points either to an encoded result in its
+    run item, which are read at once with BatchGetItem, or to a line of a
+    result chunk in S3, each chunk is read once for the whole batch.
+    """
+    logger.info(f"Get result of {len(sources)} test cases")
+    refs = [source.get("traceRef") for source in sources]
+    run_keys = [
+        (source["testId"], source["markerId"])
+        for source, ref in zip(sources, refs)
+        if ref and "dataIndex" in ref
     ]
-    for variable in environment_variables:
-        variable_name = variable["name"]
-        variable_value = variable["value"]
-
-        existing_variable = next(
-            (
-                var
-                for var in current_environment_variables
-                if var["name"] == variable_name
-            ),
-            None,
-        )
-        if existing_variable:
-            existing_variable["value"] = variable_value
-        else:
-            current_environment_variables.append(
-                {"name": variable_name, "value": variable_value}
-            )
-    response = codebuild_client.update_project(
-        name=codebuild_project,
-        environment={
-            "type": "LINUX_CONTAINER",
-            "image": "aws/codebuild/standard:5.0",
-            "imagePullCredentialsType": "CODEBUILD",
-            "computeType": "BUILD_GENERAL1_SMALL",
-            "environmentVariables": current_environment_variables,
-        },
-    )
-    print(response)
+    items = iter(get_checkpoint_dao().batch_get_test_results(run_keys))
+    runs = [next(items) if ref and "dataIndex" in ref else {} for ref in refs]
+    try:
+        return get_result_store().read_refs(refs, runs)
+    except Exception as e:
+        logger.error(f"Failed to read the result of test cases: {e}")
+        return [
+            APIException(ErrorCode.UNKNOWN_ERROR, "Failed to read the result")
+        ] * len(sources)
 
 
-@router.route(field_name="startSingleTest")
-def start_single_task(**args):
-    """Start single test task"""
-    logger.info(f"Starting task with args: {args}")
-    marker_id = args.get("markerId")
-    parameters = args.get("parameters")
-    pk_id = str(uuid.uuid4())
-    search_response = table.query(
-        KeyConditionExpression=Key("PK").eq(f"{ENTITY_TYPE.MARKER.value}#{marker_id}")
-    )
-    items = search_response.get("Items", [])
-    if items:
-        item = items[0]
-        mark = item.get("modelName", "")
-        project_name = item.get("projectName", "")
-    codebuild_params_list = pass_parameters_to_codebuild(parameters, project_name)
-    codecommit_repo = metadata_json[project_name]["codecommit_repo"]
-    branch = metadata_json[project_name]["branch"]
-    region = metadata_json[project_name]["region"]
-    parameters_parsed = []
+def format_run_stats(item: dict) -> dict:
+    """Format a statistics item as RunStats"""
+    runs = int(item.get("runs", 0))
+    duration_sum = int(item.get("durationSum", 0))
+    histogram = [
+        {"le": upper_bound, "count": int(item.get(get_bucket_name(upper_bound), 0))}
+        for upper_bound in DURATION_BUCKETS
+    ]
+    histogram.append({"le": None, "count": int(item.get("bucketInf", 0))})
+    durations = sum(bucket["count"] for bucket in histogram)
+    sk = item.get("SK", "")
+    day = sk[len(STATS_DAY_PREFIX) :] if sk.startswith(STATS_DAY_PREFIX) else None
+    return {
+        "date": day,
+        "runs": runs,
+        "passes": int(item.get("passes", 0)),
+        "failures": int(item.get("failures", 0)),
+        "passRate": int(item.get("passes", 0)) / runs if runs else None,
+        "durationSum": duration_sum,
+        "durationMin": int(item["durationMin"]) if "durationMin" in item else None,
+        "durationMax": int(item["durationMax"]) if "durationMax" in item else None,
+        "durationAvg": duration_sum / durations if durations else None,
+        "histogram": histogram,
+    }
+
+
+@router.route(field_name="getCheckPointStats")
+@read_cache.cached(get_version=get_generation)
+def get_checkpoint_stats(id: str, days: int = 30):
+    """Get the run statistics of a checkpoint, in total and for each of
+    the last days with runs.
+
+    The statistics are aggregated by the result parser, so the cost does
+    not depend on the number of runs.
+    """
+    logger.info(f"Get statistics of checkpoint {id} for {days} days")
+    total, daily = get_run_stats_dao().get_run_stats(id, days=days)
+    return {
+        "id": id,
+        "total": format_run_stats(total or {}),
+        "daily": [format_run_stats(item) for item in daily],
+    }
+
+
+def get_shard_attributes(shards: int, codebuild_arns=None) -> dict:
+    """Get the attributes of the TEST item of a sharded run.
+
+    The parser merges the reports of the shards into the item, and only
+    completes the run once all the shards reported.
+    """
+    if shards <= 1:
+        return {}
+    attributes = {"shardTotal": shards}
+    if codebuild_arns:
+        attributes["shardBuildArns"] = codebuild_arns
+    return attributes
+
 
-    environment_variables = [
-        {"name": "code_commit_repo", "value": codecommit_repo},
-        {"name": "branch", "value": branch},
-        {"name": "mark", "value": mark},
+def get_build_arns(run: dict) -> list:
+    """Get the ARNs of the builds of a run, one per shard"""
+    build_arns = run.get("shardBuildArns") or [run.get("codeBuildArn", "-")]
+    return [build_arn for build_arn in build_arns if build_arn != "-"]
+
+
+def get_run_variables(marker: dict, test_id: str, parameters) -> list:
+    """Get the environment variables of the build of a run.
+
+    The repository, branch and region of the build, and the mapping of the
+    parameters to the variables of the test project, are the settings of
+    the project of the checkpoint.
+    """
+    marker_id = marker["PK"].split("#")[1]
+    project_name = marker.get("projectName", "")
+    project_id = marker["SK"].split("#")[1]
+    project = get_project_registry().get(project_id)
+    if not project:
+        raise APIException(
+            ErrorCode.ITEM_NOT_FOUND,
+            f"Project {project_name} ({project_id}) is not registered",
+        )
+    codebuild_params_list = [
+        map_parameters(
+            parameters,
+            project.get("parameterMapping"),
+            project.get("passUnmapped", False),
+        )
+    ]
+    logger.info(f"CodeBuild parameters: {codebuild_params_list}")
+    return [
+        {"name": "code_commit_repo", "value": project["codecommitRepo"]},
+        {"name": "branch", "value": project["branch"]},
+        {"name": "mark", "value": marker.get("modelName", "")},
         {"name": "parameter", "value": f"{codebuild_params_list}"},
-        {"name": "region", "value": region},
+        {"name": "region", "value": project["region"]},
         {"name": "project_name", "value": project_name},
-        {"name": "pk", "value": f"{ENTITY_TYPE.TEST.value}#{pk_id}"},
+        {"name": "pk", "value": f"{ENTITY_TYPE.TEST.value}#{test_id}"},
         {"name": "sk", "value": f"{ENTITY_TYPE.MARKER.value}#{marker_id}"},
     ]
 
-    update_environment_variables(codebuild_project, environment_variables)
-    start_build_response = codebuild_client.start_build(projectName=codebuild_project)
-    codebuild_arn = start_build_response['build']['arn']
-
-    print("CodeBuild triggered:", start_build_response)
 
-    if parameters:
-        for param in parameters:
-            parameter_key = param.get("parameterKey")
-            parameter_value = param.get("parameterValue")
-            if parameter_key and parameter_value:
-                parameters_parsed.append(
-                    {"parameterKey": parameter_key, "parameterValue": parameter_value}
-                )
+def new_test_item(
+    marker_id: str,
+    test_id: str,
+    parameters,
+    codebuild_arn: str,
+    created_at: str,
+    status: str = "RUNNING",
+) -> dict:
+    """Get the TEST item of a run which is started, or queued."""
+    parameters_parsed = []
+    for param in parameters or []:
+        parameter_key = param.get("parameterKey")
+        parameter_value = param.get("parameterValue")
+        if parameter_key and parameter_value:
+            parameters_parsed.append(
+                {"parameterKey": parameter_key, "parameterValue": parameter_value}
+            )
 
-    current_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    ddb_data = {
-        "PK": f"{ENTITY_TYPE.TEST.value}#{pk_id}",
+    item = {
+        "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
         "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
-        "createdAt": current_timestamp,
-        "updatedAt": current_timestamp,
+        "createdAt": created_at,
+        "updatedAt": created_at,
         "duration": "-",
         "metaData": {
             "accountId": "691546483958",
@@ -259,15 +604,537 @@ def start_single_task(**args):
             "stackName": "clo-auto-test",
         },
         "parameters": parameters_parsed,
-        "status": "RUNNING",
-        "codeBuildArn": codebuild_arn
+        "status": status,
+        "codeBuildArn": codebuild_arn,
     }
+    if status in IN_FLIGHT_STATUSES:
+        # the run is listed in progress until it is finished, the RUNNING
+        # runs are watched by the reconciler until their result is parsed
+        item[IN_FLIGHT_ATTRIBUTE] = status
+    return item
 
-    response = table.put_item(Item=ddb_data)
 
-    if response:
-        print(f"Data written to DDB successfully. PK: {ddb_data['PK']}")
-        return pk_id
-    else:
-        print("Failed to write data to DDB.")
+def update_started_runs(started: list) -> None:
+    """Count the started runs and make the last one the latest run of its
+    checkpoint, the runs of a checkpoint are counted at once.
+
+    Args:
+        started (list): (MARKER item, TEST item) of each run, the TEST items
+            are already written.
+    """
+    runs = {}
+    for marker, test_item in started:
+        runs.setdefault(marker["PK"], (marker, []))[1].append(test_item)
+    for marker, test_items in runs.values():
+        marker_id = marker["PK"].split("#")[1]
+        get_checkpoint_dao().increment_run_count(
+            marker_id, marker["SK"], runs=len(test_items)
+        )
+        get_checkpoint_dao().update_latest_run(
+            marker_id,
+            test_items[-1]["PK"].split("#")[1],
+            status=test_items[-1]["status"],
+            tested_at=test_items[-1]["createdAt"],
+            duration=test_items[-1]["duration"],
+            marker_sk=marker["SK"],
+        )
+
+
+@router.route(field_name="startSingleTest")
+def start_single_task(**args):
+    """Start single test task
+
+    If a clientToken is provided, a request replayed with the same token
+    returns the run of the first request, without starting another one.
+    """
+    logger.info(f"Starting task with args: {args}")
+    marker_id = args.get("markerId")
+    parameters = args.get("parameters")
+    client_token = args.get("clientToken")
+    shards = args.get("shards") or 1
+    if not 1 <= shards <= MAX_SHARDS:
+        raise APIException(
+            ErrorCode.VALUE_ERROR, f"The number of shards must be 1 to {MAX_SHARDS}"
+        )
+    item = get_checkpoint_dao().get_marker(marker_id)
+    if not item:
+        raise APIException(
+            ErrorCode.ITEM_NOT_FOUND, f"Checkpoint {marker_id} is not found"
+        )
+
+    pk_id = str(uuid.uuid4())
+    if client_token:
+        claimed_id = get_client_token_dao().claim_client_token(
+            client_token, marker_id, pk_id, client_token_ttl
+        )
+        if claimed_id != pk_id:
+            return claimed_id
+
+    try:
+        [launch] = launch_runs(
+            [
+                {
+                    "marker": item,
+                    "parameters": parameters,
+                    "testId": pk_id,
+                    "shards": shards,
+                }
+            ]
+        )
+        if launch["error"]:
+            raise APIException(ErrorCode.UNKNOWN_ERROR, launch["error"])
+    except Exception:
+        # the token must not point to a run which was not recorded
+        if client_token:
+            get_client_token_dao().release_client_token(client_token)
+        raise
+    return launch["testId"]
+
+
+def launch_runs(runs: list) -> list:
+    """Start many runs at once.
+
+    If the launch queue is configured, the runs are queued, and started by
+    the dispatcher within the concurrency limits of the account. Otherwise
+    the builds are started by a bounded thread pool, then the TEST items of
+    the started runs are written through a batch writer. A run which can
+    not be started does not fail the others.
+
+    Args:
+        runs (list): the runs to start, each with the MARKER item of its
+            checkpoint as marker, its parameters, and optionally its test id,
+            number of shards, variables to add to its builds and attributes
+            to add to its TEST item.
+
+    Returns:
+        list: The test id, or the error, of each run, in order.
+    """
+    if get_launch_queue():
+        return enqueue_runs(runs)
+
+    def start_run(run: dict) -> dict:
+        marker = run["marker"]
+        test_id = run.get("testId") or str(uuid.uuid4())
+        shards = run.get("shards", 1)
+        try:
+            codebuild_arns = start_shard_builds(
+                get_codebuild_client(),
+                codebuild_project,
+                get_run_variables(marker, test_id, run["parameters"])
+                + run.get("variables", []),
+                shards,
+            )
+        except Exception as e:
+            logger.error(f"Failed to start checkpoint {marker['PK']}: {e}")
+            return {"error": str(e)}
+        current_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+        item = new_test_item(
+            marker["PK"].split("#")[1],
+            test_id,
+            run["parameters"],
+            codebuild_arns[0],
+            current_timestamp,
+        )
+        item.update(get_shard_attributes(shards, codebuild_arns))
+        item.update(run.get("attributes", {}))
+        return {"testId": test_id, "item": item}
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_launches) as executor:
+        launches = list(executor.map(start_run, runs))
+
+    started = [
+        (run["marker"], launch["item"])
+        for run, launch in zip(runs, launches)
+        if "item" in launch
+    ]
+    if started:
+        try:
+            get_checkpoint_dao().put_test_runs([item for _, item in started])
+        except Exception as e:
+            # The builds are stopped, so that no build runs for a TEST item
+            # which may not exist, and the runs are reported as failed.
+            logger.error(f"Failed to record {len(started)} started runs: {e}")
+            with ThreadPoolExecutor(max_workers=max_concurrent_launches) as executor:
+                list(
+                    executor.map(
+                        lambda arn: stop_build(get_codebuild_client(), arn),
+                        [arn for _, item in started for arn in get_build_arns(item)],
+                    )
+                )
+            return [
+                {"testId": None, "error": launch.get("error") or str(e)}
+                for launch in launches
+            ]
+        update_started_runs(started)
+        bump_generation()
+
+    return [
+        {"testId": launch.get("testId"), "error": launch.get("error")}
+        for launch in launches
+    ]
+
+
+def enqueue_runs(runs: list) -> list:
+    """Queue many runs, their TEST items are written as QUEUED."""
+    current_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    launches, items, messages = [], [], []
+    for run in runs:
+        marker = run["marker"]
+        marker_id = marker["PK"].split("#")[1]
+        test_id = run.get("testId") or str(uuid.uuid4())
+        try:
+            variables = get_run_variables(
+                marker, test_id, run["parameters"]
+            ) + run.get("variables", [])
+        except Exception as e:
+            logger.error(f"Failed to queue checkpoint {marker['PK']}: {e}")
+            launches.append({"testId": None, "error": str(e)})
+            continue
+        item = new_test_item(
+            marker_id,
+            test_id,
+            run["parameters"],
+            "-",
+            current_timestamp,
+            status="QUEUED",
+        )
+        item.update(get_shard_attributes(run.get("shards", 1)))
+        item.update(run.get("attributes", {}))
+        items.append((marker, item))
+        messages.append(
+            {
+                "testId": test_id,
+                "markerId": marker_id,
+                "projectName": marker.get("projectName", ""),
+                "createdAt": current_timestamp,
+                "enqueuedAt": time.time(),
+                "variables": variables,
+                "shards": run.get("shards", 1),
+            }
+        )
+        launches.append({"testId": test_id, "error": None})
+
+    if not messages:
+        return launches
+    # The runs are queued before their TEST items are written, a run
+    # received by the dispatcher before its item exists is retried.
+    try:
+        get_launch_queue().put(messages)
+    except Exception as e:
+        logger.error(f"Failed to queue {len(messages)} runs: {e}")
+        return [
+            {"testId": None, "error": launch["error"] or str(e)} for launch in launches
+        ]
+    get_checkpoint_dao().put_test_runs([item for _, item in items])
+    update_started_runs(items)
+    bump_generation()
+    notify_dispatcher()
+
+    return launches
+
+
+def notify_dispatcher() -> None:
+    """Invoke the dispatcher asynchronously, so that queued runs do not wait
+    for its next scheduled drain."""
+    if not dispatcher_function:
+        return
+    try:
+        get_lambda_client().invoke(
+            FunctionName=dispatcher_function, InvocationType="Event", Payload=b"{}"
+        )
+    except Exception as e:
+        logger.warning(f"Failed to notify the dispatcher: {e}")
+
+
+@router.route(field_name="getLaunchQueueStatus")
+def get_launch_queue_status():
+    """Get the depth of the launch queue, the builds in flight, and the
+    wait time of the runs dispatched by the last drain."""
+    stats = get_launch_queue_stats_dao().get_launch_queue_stats() or {}
+    return {
+        "depth": get_launch_queue().depth() if get_launch_queue() else 0,
+        "inFlight": get_launch_slots().get_in_flight(ACCOUNT_SCOPE),
+        "dispatched": stats.get("dispatched", 0),
+        "deferred": stats.get("deferred", 0),
+        "failed": stats.get("failed", 0),
+        "maxWaitSeconds": stats.get("maxWaitSeconds", 0),
+        "avgWaitSeconds": stats.get("avgWaitSeconds", 0),
+        "updatedAt": stats.get("updatedAt"),
+    }
+
+
+@router.route(field_name="startBatchTests")
+def start_batch_tests(markerIds: list, parameters=None):
+    """Start a test run of many checkpoints with the same parameters.
+
+    Returns:
+        list: The run id, or the error, of each checkpoint, in order.
+    """
+    marker_ids = list(dict.fromkeys(markerIds))
+    logger.info(f"Starting batch of {len(marker_ids)} checkpoints")
+    project_ids = [
+        item["PK"].split("#")[1] for item in get_project_dao().list_projects()
+    ]
+    markers = get_checkpoint_dao().batch_get_markers(marker_ids, project_ids)
+
+    found_ids = [marker_id for marker_id in marker_ids if markers[marker_id]]
+    launches = launch_runs(
+        [
+            {"marker": markers[marker_id], "parameters": parameters}
+            for marker_id in found_ids
+        ]
+    )
+
+    runs = dict(zip(found_ids, launches))
+    not_found = {"testId": None, "error": "Checkpoint is not found"}
+    return [
+        {"markerId": marker_id, **runs.get(marker_id, not_found)}
+        for marker_id in markerIds
+    ]
+
+
+@router.route(field_name="startMatrixTest")
+def start_matrix_test(markerId: str, mode="FULL", include=None, exclude=None):
+    """Start a run of each combination of the allowed parameter values of
+    a checkpoint.
+
+    The runs are grouped under a parent matrix run, which counts the runs
+    finished, passed and failed. A combination already queued or running on
+    the checkpoint is not started again, that run is referenced instead.
+
+    Args:
+        markerId (str): checkpoint id.
+        mode (str, optional): FULL or PAIRWISE. Defaults to FULL.
+        include (list, optional): combinations to add, as lists of ParameterInput.
+        exclude (list, optional): combinations to remove, as lists of ParameterInput.
+    """
+    marker = get_checkpoint_dao().get_marker(markerId)
+    if not marker:
+        raise APIException(
+            ErrorCode.ITEM_NOT_FOUND, f"Checkpoint {markerId} is not found"
+        )
+    combinations = expand_matrix(
+        marker.get("parameters", []),
+        mode=mode,
+        include=[to_combination(rule) for rule in include or []],
+        exclude=[to_combination(rule) for rule in exclude or []],
+    )
+
+    since = (datetime.utcnow() - RUNNING_RUN_WINDOW).strftime("%Y-%m-%dT%H:%M:%SZ")
+    running = {}
+    for item in get_in_flight_run_dao().list_running_runs(
+        markerId, since, statuses=STOPPABLE_STATUS
+    ):
+        combination = frozenset(to_combination(item.get("parameters")).items())
+        running[combination] = item["PK"].split("#")[1]
+    cells = [
+        {
+            "parameters": to_parameters(combination),
+            "runningTestId": running.get(frozenset(combination.items())),
+        }
+        for combination in combinations
+    ]
+    new_cells = [cell for cell in cells if not cell["runningTestId"]]
+
+    matrix_id = str(uuid.uuid4())
+    current_timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    get_matrix_run_dao().put_matrix_run(
+        {
+            "PK": f"{ENTITY_TYPE.MATRIX.value}#{matrix_id}",
+            "SK": f"{ENTITY_TYPE.MARKER.value}#{markerId}",
+            "startedAt": current_timestamp,
+            "mode": mode,
+            "status": "RUNNING" if new_cells else "UNKNOWN",
+            "finished": 0,
+            "passes": 0,
+            "failures": 0,
+        }
+    )
+    logger.info(
+        f"Starting matrix run {matrix_id} of {len(new_cells)} cells, "
+        f"{len(cells) - len(new_cells)} cells already running"
+    )
+
+    launches = launch_runs(
+        [
+            {
+                "marker": marker,
+                "parameters": cell["parameters"],
+                "attributes": {"matrixRunId": matrix_id},
+            }
+            for cell in new_cells
+        ]
+    )
+    for cell, launch in zip(new_cells, launches):
+        cell.update(launch)
+    for cell in cells:
+        if cell["runningTestId"]:
+            cell.update(testId=cell["runningTestId"], deduplicated=True)
+        cell.pop("runningTestId")
+        cell.setdefault("deduplicated", False)
+    get_matrix_run_dao().update_matrix_cells(matrix_id, markerId, cells)
+
+    return get_matrix_run(matrix_id)
+
+
+@router.route(field_name="rerunFailed")
+def rerun_failed(testId: str):
+    """Rerun only the failed tests of a run, with the same parameters.
+
+    The ids of the failed tests are passed to pytest through PYTEST_ADDOPTS
+    by the build, so the rerun only collects these tests.
+    """
+    item = get_checkpoint_dao().get_test_history(testId)
+    if not item:
+        raise APIException(ErrorCode.ITEM_NOT_FOUND, f"Test run {testId} is not found")
+    results = get_result_store().read(item)
+    if results and not all(result.get("nodeid") for result in results):
+        raise APIException(
+            ErrorCode.VALUE_ERROR,
+            f"Test run {testId} has no test ids, rerun the whole checkpoint",
+        )
+    node_ids = list(
+        dict.fromkeys(
+            result["nodeid"]
+            for result in results
+            if result.get("outcome") in FAILED_OUTCOMES
+        )
+    )
+    if not node_ids:
+        raise APIException(
+            ErrorCode.VALUE_ERROR, f"Test run {testId} has no failed test"
+        )
+    if len(node_ids) > MAX_RERUN_TESTS:
+        raise APIException(
+            ErrorCode.VALUE_ERROR,
+            f"Test run {testId} has {len(node_ids)} failed tests, "
+            f"the max to rerun is {MAX_RERUN_TESTS}",
+        )
+
+    selected_tests = shlex.join(node_ids)
+    if len(selected_tests.encode()) > MAX_RERUN_TESTS_BYTES:
+        raise APIException(
+            ErrorCode.VALUE_ERROR,
+            f"The ids of the failed tests of run {testId} exceed "
+            f"{MAX_RERUN_TESTS_BYTES} bytes, rerun the whole checkpoint",
+        )
+
+    marker_id = item["SK"].split("#")[1]
+    marker = get_checkpoint_dao().get_marker(marker_id)
+    if not marker:
+        raise APIException(
+            ErrorCode.ITEM_NOT_FOUND, f"Checkpoint {marker_id} is not found"
+        )
+    logger.info(f"Rerun {len(node_ids)} failed tests of run {testId}")
+    [launch] = launch_runs(
+        [
+            {
+                "marker": marker,
+                "parameters": item.get("parameters"),
+                "variables": [
+                    {"name": "selected_tests", "value": selected_tests}
+                ],
+                "attributes": {"rerunOf": testId, "selectedTests": node_ids},
+            }
+        ]
+    )
+    if launch["error"]:
+        raise APIException(ErrorCode.UNKNOWN_ERROR, launch["error"])
+    return launch["testId"]
+
+
+@router.route(field_name="getMatrixRun")
+def get_matrix_run(id: str):
+    """Get a matrix run with its cells."""
+    item = get_matrix_run_dao().get_matrix_run(id)
+    if not item:
         return None
+    item["id"] = item["PK"].split("#")[1]
+    item["markerId"] = item["SK"].split("#")[1]
+    return item
+
+
+@router.route(field_name="stopTest")
+def stop_test(id: str):
+    """Stop a queued or running test run."""
+    item = get_checkpoint_dao().get_test_history(id)
+    if not item:
+        raise APIException(ErrorCode.ITEM_NOT_FOUND, f"Test run {id} is not found")
+    [stopped] = stop_runs([item])
+    return stopped
+
+
+@router.route(field_name="stopTestsForMarker")
+def stop_tests_for_marker(markerId: str):
+    """Stop all the queued and running runs of a checkpoint."""
+    items = get_in_flight_run_dao().list_running_runs(
+        markerId, statuses=STOPPABLE_STATUS
+    )
+    logger.info(f"Stopping {len(items)} runs of checkpoint {markerId}")
+    return stop_runs(items)
+
+
+def stop_runs(items: list) -> list:
+    """Abort many runs, then stop their builds concurrently.
+
+    The runs are marked ABORTED first, with updates conditioned on the runs
+    being still in progress, so that neither a result parsed meanwhile is
+    overwritten, nor a result parsed later flips the run back. The aborted
+    runs are recorded as the parser records a finished run.
+
+    Returns:
+        list: The id, status and error of each run, in order.
+    """
+    previous_runs = get_in_flight_run_dao().finish_runs(
+        [
+            {"PK": item["PK"], "SK": item["SK"], "status": "ABORTED", "duration": "-"}
+            for item in items
+        ],
+        from_statuses=STOPPABLE_STATUS,
+        max_workers=max_concurrent_launches,
+        return_exceptions=True,
+    )
+    aborted = [run for run in previous_runs if isinstance(run, dict)]
+
+    # every shard of a run is a build to stop
+    builds = [
+        (run["PK"], codebuild_arn)
+        for run in aborted
+        for codebuild_arn in get_build_arns(run)
+    ]
+    with ThreadPoolExecutor(max_workers=max_concurrent_launches) as executor:
+        stop_errors = executor.map(
+            lambda arn: stop_build(get_codebuild_client(), arn),
+            [arn for _, arn in builds],
+        )
+    errors = {run["PK"]: None for run in aborted}
+    for (pk, _), error in zip(builds, stop_errors):
+        errors[pk] = errors[pk] or error
+
+    for run in aborted:
+        get_run_recorder().record(run, "ABORTED")
+    if aborted:
+        bump_generation()
+
+    stopped = []
+    for item, previous_run in zip(items, previous_runs):
+        if isinstance(previous_run, Exception):
+            status = item.get("status", "UNKNOWN")
+            error = f"Test run can not be stopped: {previous_run}"
+        elif previous_run is None:
+            current = get_checkpoint_dao().get_test_history(
+                item["PK"].split("#")[1], item["SK"].split("#")[1]
+            )
+            status = (current or {}).get("status", "UNKNOWN")
+            error = f"Test run is already {status}"
+        else:
+            status, error = "ABORTED", errors[item["PK"]]
+        stopped.append(
+            {
+                "id": item["PK"].split("#")[1],
+                "markerId": item["SK"].split("#")[1],
+                "status": status,
+                "error": error,
+            }
+        )
+    return stopped
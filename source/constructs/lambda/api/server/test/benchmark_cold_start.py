@@ -0,0 +1,207 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Cold start benchmark of the API Lambda.
+
+Every handler is measured in a fresh interpreter against a mocked table:
+the time to import lambda_function, with boto3 and the other dependencies
+it loads, as a real cold start pays them, and the latency of the first
+invocation. Results can be saved and compared to a baseline so that cold
+start regressions show up.
+
+Usage:
+```
+cd source/constructs/lambda/api/server
+python test/benchmark_cold_start.py --runs 5 --output cold-start.json
+python test/benchmark_cold_start.py --baseline cold-start.json --tolerance 0.2
+```
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_LIB_DIR = os.path.join(SERVER_DIR, "..", "..", "common-lib")
+TABLE_NAME = "benchmark-table"
+
+EVENTS = {
+    "import": None,
+    "listTestCheckPoints": {"arguments": {"count": 20}},
+    "listTestHistory": {"arguments": {"id": "m-001", "count": 20}},
+    "getTestHistory": {"arguments": {"id": "t-001", "markerId": "m-001"}},
+}
+
+
+def _create_table():
+    import boto3
+
+    ddb = boto3.resource("dynamodb", region_name="us-east-1")
+    table = ddb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+            {"AttributeName": "createdAt", "AttributeType": "S"},
+            {"AttributeName": "entityType", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "sortCreatedAtIndex",
+                "KeySchema": [
+                    {"AttributeName": "SK", "KeyType": "HASH"},
+                    {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            {
+                "IndexName": "entityTypeIndex",
+                "KeySchema": [
+                    {"AttributeName": "entityType", "KeyType": "HASH"},
+                    {"AttributeName": "PK", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    with table.batch_writer() as batch:
+        batch.put_item(
+            Item={
+                "PK": "MARKER#m-001",
+                "SK": "PROJECT#p-001",
+                "entityType": "MARKER",
+                "projectName": "CLO",
+                "modelName": "EC2",
+                "status": "PASS",
+            }
+        )
+        for i in range(20, 0, -1):
+            batch.put_item(
+                Item={
+                    "PK": f"TEST#t-{i:03d}",
+                    "SK": "MARKER#m-001",
+                    "createdAt": f"2024-01-01T00:00:{i:02d}Z",
+                    "status": "PASS",
+                    "duration": 10,
+                }
+            )
+
+
+def run_child(field_name: str) -> dict:
+    """Measure one handler in this (fresh) interpreter."""
+    os.environ.update(
+        {
+            "AWS_ACCESS_KEY_ID": "mocked-aws-access-key-id",
+            "AWS_SECRET_ACCESS_KEY": "mocked-aws-secret-access-key",
+            "AWS_SESSION_TOKEN": "mocked-aws-session-token",
+            "AWS_REGION": "us-east-1",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "REGION": "us-east-1",
+            "TABLE": TABLE_NAME,
+            "CODEBUILD_PROJECT_NAME": "benchmark-project",
+        }
+    )
+    sys.path[:0] = [SERVER_DIR, COMMON_LIB_DIR]
+
+    # imported first, before boto3 and moto are loaded by the benchmark,
+    # the clients are only created on the first invocation
+    start = time.perf_counter()
+    import lambda_function
+
+    import_ms = (time.perf_counter() - start) * 1000
+
+    from moto import mock_dynamodb
+
+    with mock_dynamodb():
+        _create_table()
+
+        invoke_ms = 0.0
+        event = EVENTS[field_name]
+        if event is not None:
+            start = time.perf_counter()
+            lambda_function.lambda_handler(
+                {"info": {"fieldName": field_name}, **event}, None
+            )
+            invoke_ms = (time.perf_counter() - start) * 1000
+
+    return {"import_ms": import_ms, "first_invocation_ms": invoke_ms}
+
+
+def run_benchmark(runs: int) -> dict:
+    results = {}
+    for field_name in EVENTS:
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", field_name],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        results[field_name] = {
+            metric: statistics.median(sample[metric] for sample in samples)
+            for metric in ("import_ms", "first_invocation_ms")
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for field_name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(field_name, {}).get(metric)
+            if base and value > base * (1 + tolerance):
+                regressions.append(
+                    f"{field_name} {metric}: {value:.1f} ms > {base:.1f} ms"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="runs per handler")
+    parser.add_argument("--output", help="save the results to a JSON file")
+    parser.add_argument("--baseline", help="compare to the results in a JSON file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed regression ratio"
+    )
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child)))
+        return
+
+    results = run_benchmark(args.runs)
+    print(f"{'handler':<22}{'import (ms)':>14}{'first invocation (ms)':>24}")
+    for field_name, metrics in results.items():
+        print(
+            f"{field_name:<22}{metrics['import_ms']:>14.1f}"
+            f"{metrics['first_invocation_ms']:>24.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,813 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from moto import mock_dynamodb, mock_s3
+
+from commonlib.exception import APIException
+from commonlib.launch import InMemoryLaunchQueue
+from commonlib.report import ResultStore
+from .conftest import init_table
+
+TABLE_NAME = "mocked-test-table"
+
+
+def get_build_arn(build_id):
+    return f"arn:aws:codebuild:us-east-1:123456789012:build/{build_id}"
+
+
+class FakeCodeBuildClient:
+    """Records the builds started, each build takes a while to start so
+    that concurrent launches overlap."""
+
+    def __init__(self):
+        self.builds = []
+        self.stopped = []
+        self._lock = threading.Lock()
+
+    def start_build(self, projectName, environmentVariablesOverride=None):
+        time.sleep(0.01)
+        with self._lock:
+            build_id = f"{projectName}:{len(self.builds)}"
+            self.builds.append(
+                {
+                    "id": build_id,
+                    "variables": {
+                        variable["name"]: variable["value"]
+                        for variable in environmentVariablesOverride or []
+                    },
+                }
+            )
+        return {"build": {"id": build_id, "arn": get_build_arn(build_id)}}
+
+    def stop_build(self, id):
+        with self._lock:
+            self.stopped.append(id)
+        return {"build": {"id": id, "buildStatus": "STOPPED"}}
+
+    def update_project(self, **kwargs):
+        raise AssertionError("the shared project must not be updated")
+
+
+@pytest.fixture
+def lambda_function(monkeypatch):
+    monkeypatch.setenv("TABLE", TABLE_NAME)
+    monkeypatch.setenv("CODEBUILD_PROJECT_NAME", "mocked-project")
+
+    with mock_dynamodb():
+        ddb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = ddb.create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+                {"AttributeName": "createdAt", "AttributeType": "S"},
+                {"AttributeName": "entityType", "AttributeType": "S"},
+                {"AttributeName": "inFlight", "AttributeType": "S"},
+                {"AttributeName": "nodeid", "AttributeType": "S"},
+                {"AttributeName": "testedAt", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "sortCreatedAtIndex",
+                    "KeySchema": [
+                        {"AttributeName": "SK", "KeyType": "HASH"},
+                        {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": "entityTypeIndex",
+                    "KeySchema": [
+                        {"AttributeName": "entityType", "KeyType": "HASH"},
+                        {"AttributeName": "PK", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": "inFlightIndex",
+                    "KeySchema": [
+                        {"AttributeName": "inFlight", "KeyType": "HASH"},
+                        {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {
+                        "ProjectionType": "INCLUDE",
+                        "NonKeyAttributes": ["codeBuildArn", "shardBuildArns"],
+                    },
+                },
+                {
+                    "IndexName": "nodeIdIndex",
+                    "KeySchema": [
+                        {"AttributeName": "nodeid", "KeyType": "HASH"},
+                        {"AttributeName": "testedAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        with open("./test_tasks.json", "r") as f:
+            init_table(table, json.load(f))
+
+        import lambda_function
+
+        codebuild_client = FakeCodeBuildClient()
+        monkeypatch.setattr(lambda_function, "table_name", TABLE_NAME)
+        monkeypatch.setattr(lambda_function, "codebuild_project", "mocked-project")
+        monkeypatch.setattr(
+            lambda_function, "get_codebuild_client", lambda: codebuild_client
+        )
+        lambda_function.get_table.cache_clear()
+        lambda_function.get_checkpoint_dao.cache_clear()
+        lambda_function.get_in_flight_run_dao.cache_clear()
+        lambda_function.get_project_dao.cache_clear()
+        lambda_function.get_launch_queue_stats_dao.cache_clear()
+        lambda_function.get_case_dao.cache_clear()
+        lambda_function.get_matrix_run_dao.cache_clear()
+        lambda_function.get_run_stats_dao.cache_clear()
+        lambda_function.get_client_token_dao.cache_clear()
+        lambda_function.get_run_recorder.cache_clear()
+        lambda_function.get_project_registry.cache_clear()
+        lambda_function.get_result_store.cache_clear()
+        lambda_function.read_cache.clear()
+        lambda_function.get_project_dao().backfill_projects(
+            lambda_function.LEGACY_PROJECTS
+        )
+        yield lambda_function
+
+
+def test_start_single_test(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    test_id = lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "startSingleTest"},
+            "arguments": {
+                "markerId": marker_id,
+                "parameters": [{"parameterKey": "buffer", "parameterValue": "KDS"}],
+            },
+        },
+        None,
+    )
+
+    builds = lambda_function.get_codebuild_client().builds
+    assert len(builds) == 1
+    assert builds[0]["variables"]["pk"] == f"TEST#{test_id}"
+    assert builds[0]["variables"]["sk"] == f"MARKER#{marker_id}"
+    assert builds[0]["variables"]["mark"] == "EC2"
+    assert builds[0]["variables"]["parameter"] == "[{'buffer_layer': 'KDS'}]"
+
+    item = lambda_function.get_checkpoint_dao().get_test_history(test_id, marker_id)
+    assert item["inFlight"] == "RUNNING"
+
+
+def test_concurrent_launches(lambda_function):
+    with open("./test_tasks.json", "r") as f:
+        markers = {
+            item["PK"].split("#")[1]: item["modelName"] for item in json.load(f)
+        }
+    launches = [marker_id for marker_id in markers for _ in range(3)]
+
+    def launch(marker_id):
+        return marker_id, lambda_function.start_single_task(
+            markerId=marker_id, parameters=[]
+        )
+
+    with ThreadPoolExecutor(max_workers=len(launches)) as executor:
+        test_ids = {
+            test_id: marker_id
+            for marker_id, test_id in executor.map(launch, launches)
+        }
+
+    builds = lambda_function.get_codebuild_client().builds
+    assert len(builds) == len(launches) == len(test_ids)
+    for build in builds:
+        # every build runs with the variables of its own launch
+        test_id = build["variables"]["pk"].split("#")[1]
+        marker_id = test_ids[test_id]
+        assert build["variables"]["sk"] == f"MARKER#{marker_id}"
+        assert build["variables"]["mark"] == markers[marker_id]
+
+        item = lambda_function.get_table().get_item(
+            Key={"PK": build["variables"]["pk"], "SK": build["variables"]["sk"]}
+        )["Item"]
+        assert item["codeBuildArn"] == get_build_arn(build["id"])
+
+
+def test_start_batch_tests(lambda_function):
+    with open("./test_tasks.json", "r") as f:
+        marker_ids = [item["PK"].split("#")[1] for item in json.load(f)]
+
+    runs = lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "startBatchTests"},
+            "arguments": {
+                "markerIds": marker_ids + ["not-found"],
+                "parameters": [{"parameterKey": "logType", "parameterValue": "JSON"}],
+            },
+        },
+        None,
+    )
+
+    assert [run["markerId"] for run in runs] == marker_ids + ["not-found"]
+    assert runs[-1] == {
+        "markerId": "not-found",
+        "testId": None,
+        "error": "Checkpoint is not found",
+    }
+    builds = lambda_function.get_codebuild_client().builds
+    assert len(builds) == len(marker_ids)
+
+    dao = lambda_function.get_checkpoint_dao()
+    for run in runs[:-1]:
+        assert run["error"] is None
+        item = dao.get_test_history(run["testId"], run["markerId"])
+        assert item["status"] == "RUNNING"
+        assert item["parameters"] == [
+            {"parameterKey": "logType", "parameterValue": "JSON"}
+        ]
+        assert dao.get_marker(run["markerId"])["latestTestId"] == run["testId"]
+
+
+def test_start_matrix_test(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    running_test_id = lambda_function.start_single_task(
+        markerId=marker_id,
+        parameters=[
+            {"parameterKey": "buffer", "parameterValue": "KDS"},
+            {"parameterKey": "logType", "parameterValue": "JSON"},
+        ],
+    )
+
+    matrix_run = lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "startMatrixTest"},
+            "arguments": {
+                "markerId": marker_id,
+                "exclude": [[{"parameterKey": "buffer", "parameterValue": "None"}]],
+            },
+        },
+        None,
+    )
+
+    # buffer (KDS, S3) x logType (5 values), one combination already running
+    assert len(matrix_run["cells"]) == 10
+    assert matrix_run["total"] == 9
+    assert matrix_run["status"] == "RUNNING"
+    deduplicated = [cell for cell in matrix_run["cells"] if cell["deduplicated"]]
+    assert [cell["testId"] for cell in deduplicated] == [running_test_id]
+    assert len(lambda_function.get_codebuild_client().builds) == 10
+
+    dao = lambda_function.get_checkpoint_dao()
+    # the runs of the matrix are counted once
+    assert dao.count_test_histories(marker_id) == dao._ddb_util.count(
+        dao._history_query_args(marker_id)
+    )
+    for cell in matrix_run["cells"]:
+        item = dao.get_test_history(cell["testId"], marker_id)
+        assert item["parameters"] == cell["parameters"]
+        if not cell["deduplicated"]:
+            assert item["matrixRunId"] == matrix_run["id"]
+
+    assert lambda_function.lambda_handler(
+        {"info": {"fieldName": "getMatrixRun"}, "arguments": {"id": matrix_run["id"]}},
+        None,
+    ) == matrix_run
+
+
+def test_queued_matrix_test(lambda_function, monkeypatch):
+    queue = InMemoryLaunchQueue()
+    monkeypatch.setattr(lambda_function, "get_launch_queue", lambda: queue)
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    event = {
+        "info": {"fieldName": "startMatrixTest"},
+        "arguments": {
+            "markerId": marker_id,
+            "exclude": [[{"parameterKey": "buffer", "parameterValue": "None"}]],
+        },
+    }
+
+    first = lambda_function.lambda_handler(event, None)
+    assert first["total"] == 10
+    # the runs are still queued, none of them is queued again
+    second = lambda_function.lambda_handler(event, None)
+    assert second["total"] == 0
+    assert all(cell["deduplicated"] for cell in second["cells"])
+    assert sorted(cell["testId"] for cell in second["cells"]) == sorted(
+        cell["testId"] for cell in first["cells"]
+    )
+    assert queue.depth() == 10
+    assert lambda_function.get_codebuild_client().builds == []
+
+
+def test_queued_launches(lambda_function, monkeypatch):
+    queue = InMemoryLaunchQueue()
+    monkeypatch.setattr(lambda_function, "get_launch_queue", lambda: queue)
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+
+    test_id = lambda_function.start_single_task(markerId=marker_id, parameters=[])
+
+    # the build is started by the dispatcher, not by the API
+    assert lambda_function.get_codebuild_client().builds == []
+    item = lambda_function.get_checkpoint_dao().get_test_history(test_id, marker_id)
+    assert item["status"] == "QUEUED"
+    assert lambda_function.get_checkpoint_dao().get_marker(marker_id)["status"] == (
+        "QUEUED"
+    )
+
+    [(_, message, _)] = queue.receive()
+    assert message["testId"] == test_id
+    assert message["markerId"] == marker_id
+    assert message["projectName"] == "CLO"
+    variables = {
+        variable["name"]: variable["value"] for variable in message["variables"]
+    }
+    assert variables["pk"] == f"TEST#{test_id}"
+
+    status = lambda_function.lambda_handler(
+        {"info": {"fieldName": "getLaunchQueueStatus"}, "arguments": {}}, None
+    )
+    assert status["depth"] == 1
+    assert status["inFlight"] == 0
+
+    # the queued run is listed in progress until it is stopped
+    assert item["inFlight"] == "QUEUED"
+    stopped = lambda_function.stop_tests_for_marker(markerId=marker_id)
+    assert [(run["id"], run["status"]) for run in stopped] == [(test_id, "ABORTED")]
+    assert lambda_function.get_codebuild_client().stopped == []
+    item = lambda_function.get_checkpoint_dao().get_test_history(test_id, marker_id)
+    assert "inFlight" not in item
+    assert lambda_function.stop_tests_for_marker(markerId=marker_id) == []
+
+
+def test_client_token(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    event = {
+        "info": {"fieldName": "startSingleTest"},
+        "arguments": {"markerId": marker_id, "clientToken": "token-1"},
+    }
+
+    test_id = lambda_function.lambda_handler(event, None)
+    # a replayed request does not start another build
+    assert lambda_function.lambda_handler(event, None) == test_id
+    assert len(lambda_function.get_codebuild_client().builds) == 1
+
+    event["arguments"]["clientToken"] = "token-2"
+    assert lambda_function.lambda_handler(event, None) != test_id
+    assert len(lambda_function.get_codebuild_client().builds) == 2
+
+
+def test_client_token_of_failed_run(lambda_function, monkeypatch):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    event = {
+        "info": {"fieldName": "startSingleTest"},
+        "arguments": {"markerId": marker_id, "clientToken": "token-1"},
+    }
+    dao = lambda_function.get_checkpoint_dao()
+    put_test_runs = dao.put_test_runs
+
+    def fail_put_test_runs(items):
+        raise RuntimeError("throttled")
+
+    # the build started, but its run could not be recorded
+    monkeypatch.setattr(dao, "put_test_runs", fail_put_test_runs)
+    with pytest.raises(APIException, match="throttled"):
+        lambda_function.lambda_handler(event, None)
+    codebuild_client = lambda_function.get_codebuild_client()
+    assert codebuild_client.stopped == [codebuild_client.builds[0]["id"]]
+
+    # the token is released, so that the request can be retried
+    monkeypatch.setattr(dao, "put_test_runs", put_test_runs)
+    test_id = lambda_function.lambda_handler(event, None)
+    assert dao.get_test_history(test_id, marker_id)["status"] == "RUNNING"
+    assert len(codebuild_client.builds) == 2
+
+
+def test_projects(lambda_function):
+    project_id = "775ab001-rety-ghkl-poiu-123597a8zxcv"
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    [project] = lambda_function.lambda_handler(
+        {"info": {"fieldName": "listProjects"}, "arguments": {}}, None
+    )
+    assert project["id"] == project_id
+    assert project["projectName"] == "CLO"
+
+    # the project is onboarded with another repository and mapping
+    lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "putProject"},
+            "arguments": {
+                "id": project_id,
+                "projectName": "CLO",
+                "codecommitRepo": "https://example.com/repo",
+                "branch": "main",
+                "region": "us-east-1",
+                "parameterMapping": [{"parameterKey": "buffer", "name": "buffer"}],
+            },
+        },
+        None,
+    )
+    lambda_function.start_single_task(
+        markerId=marker_id,
+        parameters=[
+            {"parameterKey": "buffer", "parameterValue": "KDS"},
+            {"parameterKey": "logType", "parameterValue": "JSON"},
+        ],
+    )
+    [build] = lambda_function.get_codebuild_client().builds
+    assert build["variables"]["code_commit_repo"] == "https://example.com/repo"
+    assert build["variables"]["branch"] == "main"
+    assert build["variables"]["region"] == "us-east-1"
+    assert build["variables"]["parameter"] == "[{'buffer': 'KDS'}]"
+
+
+def test_unregistered_project(lambda_function):
+    lambda_function.get_table().delete_item(
+        Key={
+            "PK": "PROJECT#775ab001-rety-ghkl-poiu-123597a8zxcv",
+            "SK": "PROJECT#775ab001-rety-ghkl-poiu-123597a8zxcv",
+        }
+    )
+    runs = lambda_function.start_batch_tests(
+        markerIds=["asdqab125-qwer-4aef-89a1-asdfgertyw"]
+    )
+    assert runs[0]["testId"] is None
+    assert "is not registered" in runs[0]["error"]
+    assert lambda_function.get_codebuild_client().builds == []
+
+
+def test_backfill_legacy_checkpoints(lambda_function):
+    table = lambda_function.get_table()
+    project_key = "PROJECT#775ab001-rety-ghkl-poiu-123597a8zxcv"
+    table.delete_item(Key={"PK": project_key, "SK": project_key})
+    # checkpoints written before the entity type index
+    for item in table.scan()["Items"]:
+        if item["PK"].startswith("MARKER#"):
+            table.update_item(
+                Key={"PK": item["PK"], "SK": item["SK"]},
+                UpdateExpression="REMOVE entityType",
+            )
+
+    # once, by the custom resource of the deployment
+    response = lambda_function.backfill_handler({"RequestType": "Update"}, None)
+    assert "updated" in response["Data"]
+    assert lambda_function.backfill_handler({"RequestType": "Delete"}, None) == {}
+    project = lambda_function.get_project_dao().get_project(
+        "775ab001-rety-ghkl-poiu-123597a8zxcv"
+    )
+    assert project["projectName"] == "CLO"
+    assert lambda_function.start_single_task(
+        markerId="asdqab125-qwer-4aef-89a1-asdfgertyw", parameters=[]
+    )
+
+
+def test_stop_tests(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    test_ids = [
+        lambda_function.start_single_task(markerId=marker_id, parameters=[])
+        for _ in range(3)
+    ]
+    dao = lambda_function.get_checkpoint_dao()
+    lambda_function.get_in_flight_run_dao().finish_runs(
+        [
+            {
+                "PK": f"TEST#{test_ids[0]}",
+                "SK": f"MARKER#{marker_id}",
+                "status": "PASS",
+                "duration": 1,
+            }
+        ]
+    )
+
+    stopped = lambda_function.lambda_handler(
+        {"info": {"fieldName": "stopTest"}, "arguments": {"id": test_ids[1]}}, None
+    )
+    assert stopped == {
+        "id": test_ids[1],
+        "markerId": marker_id,
+        "status": "ABORTED",
+        "error": None,
+    }
+    assert lambda_function.get_codebuild_client().stopped == ["mocked-project:1"]
+
+    stopped = lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "stopTestsForMarker"},
+            "arguments": {"markerId": marker_id},
+        },
+        None,
+    )
+    # the finished and already aborted runs are not listed
+    assert [(run["id"], run["status"]) for run in stopped] == [
+        (test_ids[2], "ABORTED")
+    ]
+    assert lambda_function.get_codebuild_client().stopped == [
+        "mocked-project:1",
+        "mocked-project:2",
+    ]
+    for test_id in test_ids[1:]:
+        item = dao.get_test_history(test_id, marker_id)
+        assert item["status"] == "ABORTED"
+        assert "inFlight" not in item
+    assert dao.get_marker(marker_id)["status"] == "ABORTED"
+    # the stopped runs are counted as failed runs
+    total, _ = lambda_function.get_run_stats_dao().get_run_stats(marker_id)
+    assert (total["runs"], total["failures"]) == (2, 2)
+
+    # a run can not be stopped twice
+    stopped = lambda_function.stop_test(id=test_ids[0])
+    assert stopped["status"] == "PASS"
+    assert stopped["error"] == "Test run is already PASS"
+
+
+def test_stop_test_error(lambda_function, monkeypatch):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    test_id = lambda_function.start_single_task(markerId=marker_id, parameters=[])
+    dao = lambda_function.get_checkpoint_dao()
+
+    def finish_run(*args):
+        raise RuntimeError("throttled")
+
+    monkeypatch.setattr(
+        lambda_function.get_in_flight_run_dao(), "_finish_run", finish_run
+    )
+    stopped = lambda_function.stop_test(id=test_id)
+    assert stopped["status"] == "RUNNING"
+    assert stopped["error"] == "Test run can not be stopped: throttled"
+    assert lambda_function.get_codebuild_client().stopped == []
+    assert dao.get_test_history(test_id, marker_id)["status"] == "RUNNING"
+
+
+def test_sharded_run(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    test_id = lambda_function.lambda_handler(
+        {
+            "info": {"fieldName": "startSingleTest"},
+            "arguments": {"markerId": marker_id, "shards": 3},
+        },
+        None,
+    )
+
+    builds = lambda_function.get_codebuild_client().builds
+    assert [build["variables"]["shard_index"] for build in builds] == ["0", "1", "2"]
+    assert {build["variables"]["shard_total"] for build in builds} == {"3"}
+    assert {build["variables"]["pk"] for build in builds} == {f"TEST#{test_id}"}
+
+    item = lambda_function.get_checkpoint_dao().get_test_history(test_id, marker_id)
+    assert item["shardTotal"] == 3
+    assert item["shardBuildArns"] == [get_build_arn(build["id"]) for build in builds]
+
+    # every shard is stopped
+    lambda_function.stop_test(id=test_id)
+    assert sorted(lambda_function.get_codebuild_client().stopped) == [
+        build["id"] for build in builds
+    ]
+
+    with pytest.raises(APIException, match="number of shards"):
+        lambda_function.start_single_task(markerId=marker_id, shards=100)
+
+
+def test_rerun_failed(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    parameters = [{"parameterKey": "buffer", "parameterValue": "KDS"}]
+    test_id = lambda_function.start_single_task(
+        markerId=marker_id, parameters=parameters
+    )
+    lambda_function.get_table().update_item(
+        Key={"PK": f"TEST#{test_id}", "SK": f"MARKER#{marker_id}"},
+        UpdateExpression="SET #status = :status, #result = :result",
+        ExpressionAttributeNames={"#status": "status", "#result": "result"},
+        ExpressionAttributeValues={
+            ":status": "FAILED",
+            ":result": [
+                {"nodeid": "test_a.py::test_ok", "outcome": "passed"},
+                {"nodeid": "test_a.py::test_ko", "outcome": "failed"},
+                {"nodeid": "test_b.py::test_setup[x y]", "outcome": "error"},
+            ],
+        },
+    )
+
+    rerun_id = lambda_function.lambda_handler(
+        {"info": {"fieldName": "rerunFailed"}, "arguments": {"testId": test_id}},
+        None,
+    )
+
+    build = lambda_function.get_codebuild_client().builds[-1]
+    assert build["variables"]["pk"] == f"TEST#{rerun_id}"
+    assert build["variables"]["parameter"] == "[{'buffer_layer': 'KDS'}]"
+    assert build["variables"]["selected_tests"] == (
+        "test_a.py::test_ko 'test_b.py::test_setup[x y]'"
+    )
+    item = lambda_function.get_checkpoint_dao().get_test_history(rerun_id, marker_id)
+    assert item["rerunOf"] == test_id
+    assert item["parameters"] == parameters
+    assert item["selectedTests"] == [
+        "test_a.py::test_ko",
+        "test_b.py::test_setup[x y]",
+    ]
+
+    # the rerun has no result yet
+    with pytest.raises(APIException, match="no failed test"):
+        lambda_function.rerun_failed(testId=rerun_id)
+
+
+def test_rerun_failed_long_ids(lambda_function, monkeypatch):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    test_id = lambda_function.start_single_task(markerId=marker_id, parameters=[])
+    lambda_function.get_table().update_item(
+        Key={"PK": f"TEST#{test_id}", "SK": f"MARKER#{marker_id}"},
+        UpdateExpression="SET #status = :status, #result = :result",
+        ExpressionAttributeNames={"#status": "status", "#result": "result"},
+        ExpressionAttributeValues={
+            ":status": "FAILED",
+            ":result": [
+                {"nodeid": f"test_a.py::test_p[{'x' * 40}-{i}]", "outcome": "failed"}
+                for i in range(100)
+            ],
+        },
+    )
+
+    # the ids are within the max number of tests, but not within the max size
+    with pytest.raises(APIException, match="exceed 4096 bytes"):
+        lambda_function.rerun_failed(testId=test_id)
+    assert len(lambda_function.get_codebuild_client().builds) == 1
+
+    monkeypatch.setattr(lambda_function, "MAX_RERUN_TESTS_BYTES", 8192)
+    rerun_id = lambda_function.rerun_failed(testId=test_id)
+    build = lambda_function.get_codebuild_client().builds[-1]
+    assert build["variables"]["pk"] == f"TEST#{rerun_id}"
+
+
+def test_stored_results(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    results = [
+        {"nodeid": f"test_a.py::test_{i}", "outcome": "failed", "trace": "E" * 50}
+        for i in range(10)
+    ]
+    with mock_s3():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="central-bucket")
+        store = ResultStore("central-bucket", chunk_size=200, s3_client=s3)
+
+        # results encoded in the item, and results in chunks
+        test_ids = []
+        for max_inline_size in (0, 10):
+            test_id = lambda_function.start_single_task(markerId=marker_id)
+            attributes = store.put(
+                results, f"results/{test_id}/0", max_inline_size=max_inline_size
+            )
+            lambda_function.get_table().update_item(
+                Key={"PK": f"TEST#{test_id}", "SK": f"MARKER#{marker_id}"},
+                UpdateExpression="SET #resultData = :data, #resultChunks = :chunks",
+                ExpressionAttributeNames={
+                    "#resultData": "resultData",
+                    "#resultChunks": "resultChunks",
+                },
+                ExpressionAttributeValues={
+                    ":data": attributes["resultData"],
+                    ":chunks": attributes["resultChunks"],
+                },
+            )
+            test_ids.append(test_id)
+        assert len(attributes["resultChunks"]) == 5
+
+        event = {"info": {"fieldName": "result", "parentTypeName": "TestHistory"}}
+        for test_id in test_ids:
+            item = lambda_function.lambda_handler(
+                {
+                    "info": {"fieldName": "getTestHistory"},
+                    "arguments": {"id": test_id, "markerId": marker_id},
+                },
+                None,
+            )
+            # the results are only decoded when they are selected
+            assert "resultData" not in item
+            responses = lambda_function.lambda_handler(
+                [
+                    {**event, "source": item, "arguments": {}},
+                    {**event, "source": item, "arguments": {"offset": 4, "limit": 3}},
+                    {
+                        **event,
+                        "source": {"id": test_id, "markerId": marker_id},
+                        "arguments": {"offset": 8},
+                    },
+                ],
+                None,
+            )
+            assert [response["data"] for response in responses] == [
+                results,
+                results[4:7],
+                results[8:],
+            ]
+
+            lambda_function.rerun_failed(testId=test_id)
+            build = lambda_function.get_codebuild_client().builds[-1]
+            assert build["variables"]["selected_tests"] == " ".join(
+                result["nodeid"] for result in results
+            )
+
+
+def test_test_case_history(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    results = [
+        {"nodeid": f"test_a.py::test_{i}", "outcome": "failed", "trace": "E" * 50}
+        for i in range(10)
+    ]
+    dao = lambda_function.get_case_dao()
+    with mock_s3():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="central-bucket")
+        store = ResultStore("central-bucket", chunk_size=200, s3_client=s3)
+
+        # a run with its results in the item, then a run with results in chunks
+        test_ids = []
+        for i, max_inline_size in enumerate((0, 10)):
+            test_id = lambda_function.start_single_task(markerId=marker_id)
+            attributes = store.put(
+                results, f"results/{test_id}/0", max_inline_size=max_inline_size
+            )
+            lambda_function.get_table().update_item(
+                Key={"PK": f"TEST#{test_id}", "SK": f"MARKER#{marker_id}"},
+                UpdateExpression="SET #resultData = :data",
+                ExpressionAttributeNames={"#resultData": "resultData"},
+                ExpressionAttributeValues={":data": attributes["resultData"]},
+            )
+            cases = [
+                {**result, "duration": 0.5, "traceRef": ref}
+                for result, ref in zip(results, store.locate(attributes))
+            ]
+            dao.put_test_cases(test_id, marker_id, f"2024-01-0{i + 1}T00:00:00Z", cases)
+            test_ids.append(test_id)
+
+        response = lambda_function.lambda_handler(
+            {
+                "info": {"fieldName": "listTestCaseHistory"},
+                "arguments": {"nodeid": "test_a.py::test_3", "count": 1},
+            },
+            None,
+        )
+        assert len(response["testCases"]) == 1 and response["nextToken"]
+        next_page = lambda_function.list_test_case_history(
+            nodeid="test_a.py::test_3", nextToken=response["nextToken"]
+        )
+        assert {
+            case["testId"] for case in response["testCases"] + next_page["testCases"]
+        } == set(test_ids)
+        # the latest run first
+        cases = lambda_function.list_test_case_history(nodeid="test_a.py::test_3")[
+            "testCases"
+        ]
+        assert [case["testId"] for case in cases] == test_ids[::-1]
+        assert cases[0]["outcome"] == "failed" and cases[0]["duration"] == 0.5
+
+        event = {"info": {"fieldName": "result", "parentTypeName": "TestCase"}}
+        sources = lambda_function.list_test_case_history(nodeid="test_a.py::test_7")[
+            "testCases"
+        ]
+        sources.append({**sources[0], "traceRef": None})
+        responses = lambda_function.lambda_handler(
+            [{**event, "source": source, "arguments": {}} for source in sources],
+            None,
+        )
+        assert [response["data"] for response in responses] == [
+            results[7],
+            results[7],
+            None,
+        ]
+
+
+def test_list_checkpoints(lambda_function):
+    marker_id = "asdqab125-qwer-4aef-89a1-asdfgertyw"
+    dao = lambda_function.get_checkpoint_dao()
+    dao.backfill_markers()
+    test_id = lambda_function.start_single_task(markerId=marker_id, parameters=[])
+    # the run finished, but its result is not materialized on the checkpoint
+    lambda_function.get_in_flight_run_dao().finish_runs(
+        [
+            {
+                "PK": f"TEST#{test_id}",
+                "SK": f"MARKER#{marker_id}",
+                "status": "PASS",
+                "duration": 1,
+            }
+        ]
+    )
+    assert dao.get_marker(marker_id)["status"] == "RUNNING"
+
+    response = lambda_function.lambda_handler(
+        {"info": {"fieldName": "listTestCheckPoints"}, "arguments": {"count": 100}},
+        None,
+    )
+    checkpoint = next(
+        item for item in response["checkPoints"] if item["id"] == marker_id
+    )
+    assert checkpoint["status"] == "PASS"
@@ -4,5 +4,14 @@
 
 # flake8: noqa
 from .aws import *
-from .account import LinkAccountHelper
 from .decorator import *
+
+
+def __getattr__(name):
+    # Helpers not needed by every Lambda are imported on first access,
+    # to keep them out of the cold start.
+    if name == "LinkAccountHelper":
+        from .account import LinkAccountHelper
+
+        return LinkAccountHelper
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
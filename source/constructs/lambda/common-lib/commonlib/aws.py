@@ -4,19 +4,26 @@
 
 import os
 import logging
+import time
 import boto3
 
 from functools import reduce
 
 from botocore import config
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from boto3.dynamodb.conditions import ConditionBase, Key
 from .exception import APIException, ErrorCode
 from .decorator import singleton
+from .utils import decode_next_token, encode_next_token
 
 
 logger = logging.getLogger(__name__)
 
+# Max number of keys in a BatchGetItem request, and of attempts to read its
+# unprocessed keys.
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 8
+
 
 @singleton
 class AWSConnection:
@@ -198,6 +205,93 @@ class DynamoDBUtil:
         resp = self._table.query(**query_args)
         return resp.get("Items")
 
+    def query_page(
+        self, query_args: dict, limit: int = 0, next_token: str = ""
+    ) -> Tuple[List[dict], str]:
+        """Query items, following LastEvaluatedKey until limit is reached.
+
+        Args:
+            query_args (dict): arguments of the query.
+            limit (int, optional): max number of items. Defaults to 0, which is no limit.
+            next_token (str, optional): token returned by the previous page.
+
+        Returns:
+            Tuple[List[dict], str]: The items and the token of the next page.
+        """
+        kwargs = dict(query_args)
+        exclusive_start_key = decode_next_token(next_token)
+        if exclusive_start_key:
+            kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+        items = []
+        while True:
+            if limit:
+                kwargs["Limit"] = limit - len(items)
+            response = self._table.query(**kwargs)
+            items.extend(response.get("Items", []))
+            last_evaluated_key = response.get("LastEvaluatedKey")
+            if not last_evaluated_key or (limit and len(items) >= limit):
+                break
+            kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+        return items, encode_next_token(last_evaluated_key)
+
+    def count(self, query_args: dict) -> int:
+        """Count the items matching a query without reading them back."""
+        kwargs = dict(query_args, Select="COUNT")
+        total = 0
+        while True:
+            response = self._table.query(**kwargs)
+            total += response.get("Count", 0)
+            if "LastEvaluatedKey" not in response:
+                return total
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def batch_get_items(
+        self, keys: List[dict], attributes: Optional[List[str]] = None
+    ) -> List[dict]:
+        """Get items with BatchGetItem, retrying the unprocessed keys.
+
+        Args:
+            keys (List[dict]): keys of the items, at most BATCH_GET_MAX_KEYS.
+            attributes (Optional[List[str]], optional): the attributes to
+                read. Defaults to None, which is all of them.
+
+        Returns:
+            List[dict]: The items found, in no particular order.
+
+        Raises:
+            APIException: If keys are still unprocessed after the retries.
+        """
+        client = self._table.meta.client
+        table_name = self._table.name
+        request_items = {table_name: {"Keys": keys}}
+        if attributes:
+            request_items[table_name].update(
+                ProjectionExpression=",".join(
+                    "#" + attr_name for attr_name in attributes
+                ),
+                ExpressionAttributeNames={
+                    "#" + attr_name: attr_name for attr_name in attributes
+                },
+            )
+        items = []
+        delay = 0.05
+        for _ in range(BATCH_GET_MAX_ATTEMPTS):
+            response = client.batch_get_item(RequestItems=request_items)
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                return items
+            # back off before retrying the unprocessed keys
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+        unprocessed = request_items[table_name]["Keys"]
+        logger.error(f"Unprocessed keys of BatchGetItem: {unprocessed}")
+        raise APIException(
+            ErrorCode.UNKNOWN_ERROR, f"{len(unprocessed)} items could not be read"
+        )
+
     def get_item(self, key: dict, raise_if_not_found: bool = False) -> dict:
         """Get an item from the table.
 
@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from typing import List, Optional
+
+from .launch import get_shard_variables
+from .utils import get_resource_from_arn
+
+logger = logging.getLogger(__name__)
+
+
+def start_build(codebuild_client, project_name: str, variables: List[dict]) -> str:
+    """Start a build of the test project.
+
+    The run specific variables are passed as overrides of this build only,
+    the shared project is never updated, so concurrent launches can not
+    run with the variables of each other.
+
+    Args:
+        codebuild_client: CodeBuild client.
+        project_name (str): name of the CodeBuild project.
+        variables (List[dict]): environment variables, as name and value.
+
+    Returns:
+        str: The ARN of the build.
+    """
+    response = codebuild_client.start_build(
+        projectName=project_name,
+        environmentVariablesOverride=[
+            {"name": variable["name"], "value": variable["value"], "type": "PLAINTEXT"}
+            for variable in variables
+        ],
+    )
+    logger.info(f"CodeBuild triggered: {response['build']['id']}")
+    return response["build"]["arn"]
+
+
+def start_shard_builds(
+    codebuild_client, project_name: str, variables: List[dict], shards: int = 1
+) -> List[str]:
+    """Start the builds of all the shards of a run.
+
+    If a shard can not be started, the builds of the other shards are
+    stopped, so that a run is either fully started or not at all.
+
+    Args:
+        codebuild_client: CodeBuild client.
+        project_name (str): name of the CodeBuild project.
+        variables (List[dict]): environment variables of the run.
+        shards (int, optional): number of shards. Defaults to 1.
+
+    Returns:
+        List[str]: The ARN of the build of each shard, in shard order.
+    """
+    codebuild_arns = []
+    try:
+        for shard_variables in get_shard_variables(variables, shards):
+            codebuild_arns.append(
+                start_build(codebuild_client, project_name, shard_variables)
+            )
+    except Exception:
+        for codebuild_arn in codebuild_arns:
+            stop_build(codebuild_client, codebuild_arn)
+        raise
+    return codebuild_arns
+
+
+def stop_build(codebuild_client, codebuild_arn: str) -> Optional[str]:
+    """Stop a build, and return the error if it can not be stopped"""
+    try:
+        codebuild_client.stop_build(id=get_resource_from_arn(codebuild_arn))
+    except Exception as e:
+        logger.error(f"Failed to stop build {codebuild_arn}: {e}")
+        return str(e)
+    return None
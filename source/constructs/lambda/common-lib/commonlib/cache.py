@@ -0,0 +1,135 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import copy
+import json
+import logging
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """In-process LRU cache with TTL, kept across warm Lambda invocations
+
+    Usage:
+    ```
+    cache = LRUCache(maxsize=256, ttl=30, version_ttl=1)
+
+    cache.put("key", value)
+    value = cache.get("key")
+
+    # cache the results of a function by its arguments, results are
+    # invalidated when the version changes. The version is read at most
+    # once per version_ttl seconds.
+    @cache.cached(get_version=lambda: get_generation())
+    def list_xxx(page=1, count=20):
+        ...
+    ```
+    """
+
+    _missing = object()
+
+    def __init__(
+        self, maxsize: int = 128, ttl: float = 60, version_ttl: float = 0
+    ) -> None:
+        """Constructor.
+
+        Args:
+            maxsize (int, optional): max number of entries. Defaults to 128.
+            ttl (float, optional): time to live of an entry in seconds. Defaults to 60.
+            version_ttl (float, optional): time in seconds during which a
+                version is reused without being read again. Defaults to 0.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get a value, or default if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value) -> None:
+        """Put a value, the least recently used entry is evicted if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all the entries, and forget the versions read."""
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cached(self, get_version: Optional[Callable[[], Any]] = None):
+        """Decorator to cache the results of a function called with keyword arguments.
+
+        The results are copied in and out of the cache, so that a caller
+        modifying a result does not modify the cached one.
+
+        Args:
+            get_version (Callable, optional): returns the current version of
+                the data, which is part of the cache key. Defaults to None.
+        """
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(**kwargs):
+                key = (
+                    func.__name__,
+                    self._get_version(get_version),
+                    json.dumps(kwargs, sort_keys=True, default=str),
+                )
+                value = self.get(key, self._missing)
+                if value is self._missing:
+                    value = func(**kwargs)
+                    self.put(key, copy.deepcopy(value))
+                else:
+                    value = copy.deepcopy(value)
+                logger.info(
+                    f"Read cache of {func.__name__} hits: {self.hits}, "
+                    f"misses: {self.misses}, size: {len(self)}"
+                )
+                return value
+
+            return wrapper
+
+        return decorator
+
+    def _get_version(self, get_version: Optional[Callable[[], Any]]):
+        """Get the version of the data, read again once version_ttl expired."""
+        if get_version is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(get_version)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        version = get_version()
+        with self._lock:
+            self._versions[get_version] = (now + self.version_ttl, version)
+        return version
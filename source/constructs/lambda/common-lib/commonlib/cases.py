@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import List, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+from .aws import DynamoDBUtil
+from .checkpoint import DEFAULT_MAX_WORKERS, ENTITY_TYPE
+from .exception import APIException, ErrorCode
+
+logger = logging.getLogger(__name__)
+
+# Sparse index on the node id of the test cases, only set on CASE items
+NODE_ID_INDEX = "nodeIdIndex"
+
+# Max number of items in a BatchWriteItem request, and of attempts to
+# write its unprocessed items.
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ATTEMPTS = 8
+# Max size in bytes of a node id in the key of a CASE item, longer ids are
+# hashed. Node ids over the max size of an index key are not indexed.
+MAX_CASE_KEY_SIZE = 1000
+MAX_NODE_ID_SIZE = 2048
+
+
+def get_case_key(node_id: str) -> str:
+    """Get the sort key of the CASE item of a test, e.g. CASE#test/a.py::test_b"""
+    if len(node_id.encode("utf-8")) > MAX_CASE_KEY_SIZE:
+        node_id = "sha256:" + hashlib.sha256(node_id.encode("utf-8")).hexdigest()
+    return f"{ENTITY_TYPE.CASE.value}#{node_id}"
+
+
+class CaseDao:
+    """Data Access Layer for the test cases (CASE items) of the runs
+
+    A CASE item shares the partition key of the TEST item of its run, and
+    is indexed by node id, so that the history of a test is one query.
+
+    Usage:
+    ```
+    dao = CaseDao(table_name)
+
+    dao.put_test_cases(test_id, marker_id, tested_at, cases)
+    items, next_token = dao.list_test_case_history("test/a.py::test_b")
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def put_test_cases(
+        self,
+        test_id: str,
+        marker_id: str,
+        tested_at: str,
+        cases: List[dict],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> int:
+        """Write the CASE items of the tests of a run.
+
+        The items are written again when a report is delivered again. They
+        are indexed by node id, so that the history of a test is one query.
+
+        Args:
+            test_id (str): test run id.
+            marker_id (str): checkpoint id of the run.
+            tested_at (str): creation time of the run.
+            cases (List[dict]): the nodeid, outcome, duration and traceRef of
+                each test case.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            int: Number of CASE items written.
+        """
+        items = {}
+        for case in cases:
+            node_id = case["nodeid"]
+            if len(node_id.encode("utf-8")) > MAX_NODE_ID_SIZE:
+                logger.warning(f"Node id is too long to be indexed: {node_id[:100]}")
+                continue
+            sort_key = get_case_key(node_id)
+            items[sort_key] = {
+                "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                "SK": sort_key,
+                "nodeid": node_id,
+                "markerId": marker_id,
+                "testedAt": tested_at,
+                "outcome": case["outcome"],
+                "duration": Decimal(str(round(case.get("duration") or 0, 3))),
+                "traceRef": case.get("traceRef"),
+            }
+        values = list(items.values())
+        batches = [
+            values[i : i + BATCH_WRITE_MAX_ITEMS]
+            for i in range(0, len(values), BATCH_WRITE_MAX_ITEMS)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._batch_write_items, batches))
+        return len(items)
+
+    def _batch_write_items(self, items: List[dict]) -> None:
+        """Put items with BatchWriteItem, retrying the unprocessed items.
+
+        Raises:
+            APIException: If items are still unprocessed after the retries.
+        """
+        client = self._table.meta.client
+        table_name = self._table.name
+        request_items = {
+            table_name: [{"PutRequest": {"Item": item}} for item in items]
+        }
+        delay = 0.05
+        for _ in range(BATCH_WRITE_MAX_ATTEMPTS):
+            response = client.batch_write_item(RequestItems=request_items)
+            request_items = response.get("UnprocessedItems")
+            if not request_items:
+                return
+            # back off before retrying the unprocessed items
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+        raise APIException(
+            ErrorCode.UNKNOWN_ERROR,
+            f"{len(request_items[table_name])} test cases are not written",
+        )
+
+    def list_test_case_history(
+        self, node_id: str, limit: int = 0, next_token: str = ""
+    ) -> Tuple[List[dict], str]:
+        """List the runs of a test case through the node id index.
+
+        Args:
+            node_id (str): the node id of the test, e.g. test/a.py::test_b.
+            limit (int, optional): max number of items. Defaults to 0, which is no limit.
+            next_token (str, optional): token returned by the previous page.
+
+        Returns:
+            Tuple[List[dict], str]: The CASE items, latest first, and the
+                token of the next page.
+        """
+        return self._ddb_util.query_page(
+            {
+                "IndexName": NODE_ID_INDEX,
+                "KeyConditionExpression": Key("nodeid").eq(node_id),
+                "ScanIndexForward": False,
+            },
+            limit,
+            next_token,
+        )
@@ -0,0 +1,635 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from .aws import BATCH_GET_MAX_KEYS, DynamoDBUtil
+from .report import RESULT_CHUNKS_ATTRIBUTE, RESULT_DATA_ATTRIBUTE
+
+logger = logging.getLogger(__name__)
+
+
+class ENTITY_TYPE(Enum):
+    MARKER = "MARKER"
+    PROJECT = "PROJECT"
+    TEST = "TEST"
+    STATS = "STATS"
+    MATRIX = "MATRIX"
+    TOKEN = "TOKEN"
+    CASE = "CASE"
+
+
+ENTITY_TYPE_INDEX = "entityTypeIndex"
+SORT_CREATED_AT_INDEX = "sortCreatedAtIndex"
+
+# Attributes of a TEST item returned in lists, the result is excluded as
+# it holds the message and trace of every test case.
+TEST_SUMMARY_ATTRIBUTES = [
+    "PK",
+    "SK",
+    "createdAt",
+    "updatedAt",
+    "duration",
+    "status",
+    "parameters",
+    "codeBuildArn",
+    "metaData",
+    "passed",
+    "failed",
+    "total",
+]
+
+
+def get_id_from_key(key: str) -> str:
+    """Get the entity id from a key such as MARKER#<id>"""
+    return key.split("#", 1)[1] if "#" in key else key
+
+
+# Key of the item holding the generation of the table, which is increased
+# on every write to checkpoints or test history, to invalidate read caches.
+GENERATION_KEY = {"PK": "META#GENERATION", "SK": "META#GENERATION"}
+
+# Default number of concurrent requests, botocore keeps up to 10 connections
+# in the pool of a client.
+DEFAULT_MAX_WORKERS = 10
+
+
+class CheckPointDao:
+    """Data Access Layer for the checkpoint (MARKER) items
+
+    The latest run of a checkpoint is materialized onto its MARKER item,
+    so that listing checkpoints does not need one extra query per marker.
+
+    Usage:
+    ```
+    dao = CheckPointDao(table_name)
+
+    dao.update_latest_run(
+        marker_id, test_id, status="RUNNING", tested_at="2024-01-01T00:00:00Z"
+    )
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def get_generation(self) -> int:
+        """Get the generation of the table with a strongly consistent read."""
+        response = self._table.get_item(Key=GENERATION_KEY, ConsistentRead=True)
+        return int(response.get("Item", {}).get("generation", 0))
+
+    def bump_generation(self) -> int:
+        """Increase the generation of the table, returns the new generation."""
+        response = self._table.update_item(
+            Key=GENERATION_KEY,
+            UpdateExpression="ADD #generation :one",
+            ExpressionAttributeNames={"#generation": "generation"},
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+        return int(response["Attributes"]["generation"])
+
+    def get_marker(self, marker_id: str) -> Optional[dict]:
+        """Get the MARKER item of a checkpoint.
+
+        Args:
+            marker_id (str): checkpoint id.
+
+        Returns:
+            dict: The MARKER item, or None if not found.
+        """
+        items = self._ddb_util.query_items(
+            {"PK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}"}, limit=1
+        )
+        return items[0] if items else None
+
+    def batch_get_markers(
+        self,
+        marker_ids: List[str],
+        project_ids: List[str],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> Dict[str, Optional[dict]]:
+        """Get the MARKER items of many checkpoints.
+
+        The sort key of a MARKER item is its project, which callers do not
+        know, so the items are read with BatchGetItem on the keys of every
+        checkpoint in every registered project. Checkpoints of projects not
+        registered yet are queried by id concurrently.
+
+        Args:
+            marker_ids (List[str]): checkpoint ids.
+            project_ids (List[str]): ids of the registered projects, see
+                ProjectDao.list_projects.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            Dict[str, Optional[dict]]: The MARKER item, or None if not found,
+                by checkpoint id.
+        """
+        markers = {marker_id: None for marker_id in marker_ids}
+        if not markers:
+            return markers
+
+        keys = [
+            {
+                "PK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+                "SK": f"{ENTITY_TYPE.PROJECT.value}#{project_id}",
+            }
+            for marker_id in markers
+            for project_id in project_ids
+        ]
+        key_chunks = [
+            keys[i : i + BATCH_GET_MAX_KEYS]
+            for i in range(0, len(keys), BATCH_GET_MAX_KEYS)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for items in executor.map(self._ddb_util.batch_get_items, key_chunks):
+                for item in items:
+                    markers[get_id_from_key(item["PK"])] = item
+
+            missing_ids = [marker_id for marker_id, item in markers.items() if not item]
+            for marker_id, item in zip(
+                missing_ids, executor.map(self._query_marker, missing_ids)
+            ):
+                markers[marker_id] = item
+
+        return markers
+
+    def _query_marker(self, marker_id: str) -> Optional[dict]:
+        try:
+            response = self._table.meta.client.query(
+                TableName=self._table.name,
+                KeyConditionExpression=Key("PK").eq(
+                    f"{ENTITY_TYPE.MARKER.value}#{marker_id}"
+                ),
+                Limit=1,
+            )
+        except Exception as e:
+            logger.error(f"Failed to get checkpoint {marker_id}: {e}")
+            return None
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    def put_test_runs(self, items: List[dict]) -> None:
+        """Write many TEST items through a batch writer."""
+        self._ddb_util.batch_put_items(items)
+
+    def _markers_query_args(self) -> dict:
+        return {
+            "IndexName": ENTITY_TYPE_INDEX,
+            "KeyConditionExpression": Key("entityType").eq(ENTITY_TYPE.MARKER.value),
+            "ScanIndexForward": False,
+        }
+
+    def _history_query_args(self, marker_id: str, summary: bool = False) -> dict:
+        query_args = {
+            "IndexName": SORT_CREATED_AT_INDEX,
+            "KeyConditionExpression": Key("SK").eq(
+                f"{ENTITY_TYPE.MARKER.value}#{marker_id}"
+            ),
+            "ScanIndexForward": False,
+        }
+        if summary:
+            query_args["ProjectionExpression"] = ",".join(
+                "#" + attr_name for attr_name in TEST_SUMMARY_ATTRIBUTES
+            )
+            query_args["ExpressionAttributeNames"] = {
+                "#" + attr_name: attr_name for attr_name in TEST_SUMMARY_ATTRIBUTES
+            }
+        return query_args
+
+    def list_markers(
+        self, limit: int = 0, next_token: str = ""
+    ) -> Tuple[List[dict], str]:
+        """List MARKER items through the sparse entity type index.
+
+        Checkpoints are returned in descending order of id. If limit is not
+        provided, all checkpoints are returned.
+
+        Args:
+            limit (int, optional): max number of items. Defaults to 0, which is no limit.
+            next_token (str, optional): token returned by the previous page.
+
+        Returns:
+            Tuple[List[dict], str]: The items and the token of the next page.
+        """
+        return self._ddb_util.query_page(self._markers_query_args(), limit, next_token)
+
+    def count_markers(self) -> int:
+        """Count MARKER items through the sparse entity type index."""
+        return self._ddb_util.count(self._markers_query_args())
+
+    def list_test_histories(
+        self,
+        marker_id: str,
+        limit: int = 0,
+        next_token: str = "",
+        summary: bool = False,
+    ) -> Tuple[List[dict], str]:
+        """List the TEST items of a checkpoint, latest first.
+
+        Args:
+            marker_id (str): checkpoint id.
+            limit (int, optional): max number of items. Defaults to 0, which is no limit.
+            next_token (str, optional): token returned by the previous page.
+            summary (bool, optional): only return the summary attributes,
+                without the result. Defaults to False.
+
+        Returns:
+            Tuple[List[dict], str]: The items and the token of the next page.
+        """
+        return self._ddb_util.query_page(
+            self._history_query_args(marker_id, summary), limit, next_token
+        )
+
+    def batch_get_latest_runs(
+        self,
+        marker_ids: List[str],
+        latest_test_ids: Optional[Dict[str, str]] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> Dict[str, Optional[dict]]:
+        """Get the latest TEST item of many checkpoints concurrently.
+
+        The TEST items are read with BatchGetItem when the latest test id of
+        a checkpoint is known, otherwise the latest run is queried from the
+        index. Requests are sent by a bounded thread pool. A request which
+        fails, or keys left unprocessed, raise an error rather than
+        reporting the checkpoints without run.
+
+        Args:
+            marker_ids (List[str]): checkpoint ids.
+            latest_test_ids (Optional[Dict[str, str]], optional): latest test
+                id of the checkpoints, by checkpoint id. Defaults to None.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            Dict[str, Optional[dict]]: The summary of the latest TEST item, or
+                None if not found, by checkpoint id.
+        """
+        latest_test_ids = latest_test_ids or {}
+        keys = [
+            {
+                "PK": f"{ENTITY_TYPE.TEST.value}#{latest_test_ids[marker_id]}",
+                "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+            }
+            for marker_id in marker_ids
+            if latest_test_ids.get(marker_id)
+        ]
+        key_chunks = [
+            keys[i : i + BATCH_GET_MAX_KEYS]
+            for i in range(0, len(keys), BATCH_GET_MAX_KEYS)
+        ]
+        query_marker_ids = [
+            marker_id for marker_id in marker_ids if not latest_test_ids.get(marker_id)
+        ]
+
+        latest_runs = {marker_id: None for marker_id in marker_ids}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch_futures = [
+                executor.submit(
+                    self._ddb_util.batch_get_items, chunk, TEST_SUMMARY_ATTRIBUTES
+                )
+                for chunk in key_chunks
+            ]
+            query_futures = {
+                marker_id: executor.submit(self._get_latest_run, marker_id)
+                for marker_id in query_marker_ids
+            }
+            for future in batch_futures:
+                for item in future.result():
+                    latest_runs[get_id_from_key(item["SK"])] = item
+            for marker_id, future in query_futures.items():
+                latest_runs[marker_id] = future.result()
+
+        return latest_runs
+
+    def batch_get_latest_status(
+        self,
+        marker_ids: List[str],
+        latest_test_ids: Optional[Dict[str, str]] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> Dict[str, str]:
+        """Get the latest status of many checkpoints concurrently.
+
+        See batch_get_latest_runs, the status is UNKNOWN if a checkpoint
+        has no run.
+
+        Returns:
+            Dict[str, str]: The latest status by checkpoint id.
+        """
+        latest_runs = self.batch_get_latest_runs(
+            marker_ids, latest_test_ids, max_workers
+        )
+        return {
+            marker_id: (latest_run or {}).get("status", "UNKNOWN")
+            for marker_id, latest_run in latest_runs.items()
+        }
+
+    def _get_latest_run(self, marker_id: str) -> Optional[dict]:
+        query_args = self._history_query_args(marker_id, summary=True)
+        response = self._table.meta.client.query(
+            TableName=self._table.name, Limit=1, **query_args
+        )
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    def batch_get_test_results(
+        self, run_keys: List[Tuple[str, str]], max_workers: int = DEFAULT_MAX_WORKERS
+    ) -> List[dict]:
+        """Get the result of many runs with BatchGetItem.
+
+        Args:
+            run_keys (List[Tuple[str, str]]): (test id, checkpoint id) of the runs.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            List[dict]: The result, resultData and resultChunks attributes of
+                each run, in the order of run_keys, read them with a
+                ResultStore.
+        """
+        keys = [
+            {
+                "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+            }
+            for test_id, marker_id in dict.fromkeys(run_keys)
+        ]
+        key_chunks = [
+            keys[i : i + BATCH_GET_MAX_KEYS]
+            for i in range(0, len(keys), BATCH_GET_MAX_KEYS)
+        ]
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for items in executor.map(
+                lambda chunk: self._ddb_util.batch_get_items(
+                    chunk,
+                    [
+                        "PK",
+                        "SK",
+                        "result",
+                        RESULT_DATA_ATTRIBUTE,
+                        RESULT_CHUNKS_ATTRIBUTE,
+                    ],
+                ),
+                key_chunks,
+            ):
+                for item in items:
+                    results[(item["PK"], item["SK"])] = {
+                        "result": item.get("result", []),
+                        RESULT_DATA_ATTRIBUTE: item.get(RESULT_DATA_ATTRIBUTE, []),
+                        RESULT_CHUNKS_ATTRIBUTE: item.get(RESULT_CHUNKS_ATTRIBUTE, []),
+                    }
+
+        return [
+            results.get(
+                (
+                    f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                    f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+                ),
+                {"result": [], RESULT_DATA_ATTRIBUTE: [], RESULT_CHUNKS_ATTRIBUTE: []},
+            )
+            for test_id, marker_id in run_keys
+        ]
+
+    def get_test_history(self, test_id: str, marker_id: str = "") -> Optional[dict]:
+        """Get a TEST item.
+
+        If the checkpoint id is provided, the item is read with a strongly
+        consistent GetItem on its full key. Otherwise it is queried by the
+        partition key, which is kept for callers only knowing the test id.
+
+        Args:
+            test_id (str): test run id.
+            marker_id (str, optional): checkpoint id of the run.
+
+        Returns:
+            dict: The TEST item, or None if not found.
+        """
+        if marker_id:
+            response = self._table.get_item(
+                Key={
+                    "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                    "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+                },
+                ConsistentRead=True,
+            )
+            return response.get("Item")
+
+        # the CASE items of the run share its partition key
+        response = self._table.query(
+            KeyConditionExpression=Key("PK").eq(f"{ENTITY_TYPE.TEST.value}#{test_id}")
+            & Key("SK").begins_with(f"{ENTITY_TYPE.MARKER.value}#"),
+            Limit=1,
+        )
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    def get_test_result(self, test_id: str, marker_id: str) -> list:
+        """Get the result of a run, i.e. the message and trace of each test.
+
+        Args:
+            test_id (str): test run id.
+            marker_id (str): checkpoint id.
+
+        Returns:
+            list: The result, or an empty list if the run has no result yet.
+        """
+        response = self._table.get_item(
+            Key={
+                "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+            },
+            ProjectionExpression="#result",
+            ExpressionAttributeNames={"#result": "result"},
+        )
+        return response.get("Item", {}).get("result", [])
+
+    def count_test_histories(self, marker_id: str) -> int:
+        """Get the number of runs of a checkpoint.
+
+        The run counter maintained on the MARKER item is used if present,
+        otherwise the checkpoint has no run counted yet, and its TEST items
+        are counted.
+        """
+        marker = self.get_marker(marker_id)
+        if marker and "totalRuns" in marker:
+            return int(marker["totalRuns"])
+        return self._ddb_util.count(self._history_query_args(marker_id))
+
+    def increment_run_count(
+        self, marker_id: str, marker_sk: str, runs: int = 1
+    ) -> None:
+        """Increase the run counter of a checkpoint.
+
+        The TEST items of the runs must be written first. A checkpoint which
+        has no counter yet, e.g. created after the backfill, gets its counter
+        from the TEST items once, then the counter is only increased. The
+        TEST items are counted from the eventually consistent index, so the
+        initial count is approximate, it may miss the runs written just
+        before. A checkpoint which does not exist is not counted.
+
+        Args:
+            marker_id (str): checkpoint id.
+            marker_sk (str): sort key of the MARKER item.
+            runs (int, optional): number of runs started. Defaults to 1.
+        """
+        key = {"PK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}", "SK": marker_sk}
+        try:
+            self._table.update_item(
+                Key=key,
+                UpdateExpression="ADD #totalRuns :runs",
+                ConditionExpression=Attr("totalRuns").exists(),
+                ExpressionAttributeNames={"#totalRuns": "totalRuns"},
+                ExpressionAttributeValues={":runs": runs},
+            )
+            return
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.info(f"Initialize the run counter of checkpoint {marker_id}")
+
+        # the count includes the new runs, a counter set meanwhile by the
+        # backfill or another start is increased instead
+        total = self._ddb_util.count(self._history_query_args(marker_id))
+        try:
+            self._table.update_item(
+                Key=key,
+                UpdateExpression=(
+                    "SET #totalRuns = if_not_exists(#totalRuns, :base) + :runs"
+                ),
+                ConditionExpression=Attr("PK").exists(),
+                ExpressionAttributeNames={"#totalRuns": "totalRuns"},
+                ExpressionAttributeValues={
+                    ":base": max(total - runs, 0),
+                    ":runs": runs,
+                },
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.warning(f"Checkpoint {marker_id} is not found, runs not counted")
+
+    def update_latest_run(
+        self,
+        marker_id: str,
+        test_id: str,
+        status: str,
+        tested_at: str,
+        duration="-",
+        marker_sk: str = "",
+    ) -> bool:
+        """Write the status of a run onto the MARKER item.
+
+        The update is skipped if the MARKER item already records a newer run,
+        so that a late result of an old run can not overwrite the latest one.
+
+        Args:
+            marker_id (str): checkpoint id.
+            test_id (str): test run id.
+            status (str): run status, e.g. RUNNING, PASS, FAILED.
+            tested_at (str): creation time of the run.
+            duration (optional): run duration. Defaults to "-".
+            marker_sk (str, optional): sort key of the MARKER item. Will be
+                looked up if not provided.
+
+        Returns:
+            bool: True if the MARKER item is updated.
+        """
+        if not marker_sk:
+            marker = self.get_marker(marker_id)
+            if not marker:
+                logger.warning(f"No checkpoint found for marker id: {marker_id}")
+                return False
+            marker_sk = marker["SK"]
+
+        try:
+            self._table.update_item(
+                Key={"PK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}", "SK": marker_sk},
+                UpdateExpression=(
+                    "SET #status = :status, #latestTestId = :latestTestId, "
+                    "#lastTestedAt = :lastTestedAt, #duration = :duration"
+                ),
+                ConditionExpression=Attr("lastTestedAt").not_exists()
+                | Attr("lastTestedAt").lte(tested_at),
+                ExpressionAttributeNames={
+                    "#status": "status",
+                    "#latestTestId": "latestTestId",
+                    "#lastTestedAt": "lastTestedAt",
+                    "#duration": "duration",
+                },
+                ExpressionAttributeValues={
+                    ":status": status,
+                    ":latestTestId": test_id,
+                    ":lastTestedAt": tested_at,
+                    ":duration": duration,
+                },
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.info(
+                f"Checkpoint {marker_id} already has a newer run, skip test {test_id}"
+            )
+            return False
+        return True
+
+    def backfill_markers(self) -> int:
+        """Backfill the attributes added to existing MARKER items.
+
+        The entity type used by the sparse index, the run counter and the
+        latest run are materialized onto every MARKER item. This is only
+        needed once for tables created before they are written by the API
+        and the parser.
+
+        Returns:
+            int: Number of MARKER items updated with the latest run.
+        """
+        kwargs = {
+            "FilterExpression": Attr("PK").begins_with(f"{ENTITY_TYPE.MARKER.value}#")
+        }
+        updated = 0
+        while True:
+            response = self._table.scan(**kwargs)
+            for marker in response.get("Items", []):
+                marker_id = get_id_from_key(marker["PK"])
+                if marker.get("entityType") != ENTITY_TYPE.MARKER.value:
+                    self._ddb_util.update_item(
+                        {"PK": marker["PK"], "SK": marker["SK"]},
+                        {"entityType": ENTITY_TYPE.MARKER.value},
+                    )
+                if "totalRuns" not in marker:
+                    self._backfill_run_count(marker)
+                latest_test, _ = self.list_test_histories(marker_id, limit=1)
+                if not latest_test:
+                    continue
+                if self.update_latest_run(
+                    marker_id,
+                    get_id_from_key(latest_test[0]["PK"]),
+                    status=latest_test[0].get("status", "UNKNOWN"),
+                    tested_at=latest_test[0]["createdAt"],
+                    duration=latest_test[0].get("duration", "-"),
+                    marker_sk=marker["SK"],
+                ):
+                    updated += 1
+
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        logger.info(f"Backfilled latest run for {updated} checkpoints")
+        self.bump_generation()
+        return updated
+
+    def _backfill_run_count(self, marker: dict) -> None:
+        total = self._ddb_util.count(self._history_query_args(get_id_from_key(marker["PK"])))
+        try:
+            self._table.update_item(
+                Key={"PK": marker["PK"], "SK": marker["SK"]},
+                UpdateExpression="SET #totalRuns = :total",
+                ConditionExpression=Attr("totalRuns").not_exists(),
+                ExpressionAttributeNames={"#totalRuns": "totalRuns"},
+                ExpressionAttributeValues={":total": total},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.info(f"Run counter of {marker['PK']} is already set")
@@ -74,6 +74,20 @@ class AppSyncRouter:
         ...
 
 
+    # field resolver of a type, the parent object is passed as source
+    @router.route(field_name="xxx", type_name="XXX")
+    def resolve_xxx(source):
+        ...
+
+
+    # batch handler, used when AppSync invokes the Lambda with a list of
+    # events (BatchInvoke). It receives the source and arguments of all the
+    # events at once, and returns one result (or exception) per event.
+    @router.route(field_name="yyy", type_name="XXX", batch=True)
+    def resolve_yyy(sources: list, arguments: list):
+        ...
+
+
     def lambda_handler(event, _):
         return router.resolve(event)
 
@@ -81,27 +95,119 @@ class AppSyncRouter:
 
     def __init__(self) -> None:
         self.fields = {}
+        self.type_fields = {}
+        self.batch_fields = set()
 
-    def route(self, field_name):
+    def route(self, field_name, type_name=None, batch=False):
         def wraper(func):
-            self.fields[field_name] = func
+            if type_name:
+                self.type_fields[(type_name, field_name)] = func
+            else:
+                self.fields[field_name] = func
+            if batch:
+                self.batch_fields.add((type_name, field_name))
             return func
 
         return wraper
 
-    def resolve(self, event):
-        # AppSync event
+    def _get_route(self, event):
         try:
             field_name = event["info"]["fieldName"]
-            args = event["arguments"]
-        except KeyError:
+        except (KeyError, TypeError):
+            raise APIException(ErrorCode.UNKNOWN_ERROR, "Unknown Event Message")
+        if "arguments" not in event:
             raise APIException(ErrorCode.UNKNOWN_ERROR, "Unknown Event Message")
 
-        if field_name in self.fields.keys():
-            return self.fields[field_name](**args)
+        type_name = event["info"].get("parentTypeName")
+        if (type_name, field_name) in self.type_fields.keys():
+            return (type_name, field_name), self.type_fields[(type_name, field_name)]
+        elif field_name in self.fields.keys():
+            return (None, field_name), self.fields[field_name]
         else:
             raise APIException(ErrorCode.UNSUPPORTED_ACTION)
 
+    def _call(self, key, func, event):
+        type_name, _ = key
+        args = event["arguments"] or {}
+        if key in self.batch_fields:
+            return func([event.get("source") or {}], [args])[0]
+        if type_name:
+            return func(event.get("source") or {}, **args)
+        return func(**args)
+
+    def resolve(self, event):
+        # AppSync batch invoke
+        if isinstance(event, list):
+            return self.resolve_batch(event)
+
+        # AppSync event
+        key, func = self._get_route(event)
+        result = self._call(key, func, event)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def resolve_batch(self, events: list) -> list:
+        """Resolve a list of AppSync events (BatchInvoke).
+
+        The events are grouped by field, a batch handler is called once per
+        field and other handlers once per event. Results are returned in the
+        order of the events, as {"data": ...}, or with errorMessage and
+        errorType if the event failed, without failing the other events.
+        """
+        results = [None] * len(events)
+        groups = {}
+        for i, event in enumerate(events):
+            try:
+                key, func = self._get_route(event)
+            except APIException as e:
+                results[i] = e
+                continue
+            groups.setdefault(key, (func, []))[1].append(i)
+
+        for key, (func, indexes) in groups.items():
+            if key in self.batch_fields:
+                try:
+                    batch_results = func(
+                        [events[i].get("source") or {} for i in indexes],
+                        [events[i]["arguments"] or {} for i in indexes],
+                    )
+                    if len(batch_results) != len(indexes):
+                        raise RuntimeError(
+                            f"Batch handler of {key[1]} returned "
+                            f"{len(batch_results)} results for {len(indexes)} events"
+                        )
+                except Exception as e:
+                    logger.error(e, exc_info=True)
+                    batch_results = [e] * len(indexes)
+                for i, result in zip(indexes, batch_results):
+                    results[i] = result
+            else:
+                for i in indexes:
+                    try:
+                        results[i] = self._call(key, func, events[i])
+                    except Exception as e:
+                        logger.error(e, exc_info=True)
+                        results[i] = e
+
+        return [self._to_batch_result(result) for result in results]
+
+    @staticmethod
+    def _to_batch_result(result):
+        if isinstance(result, APIException):
+            return {
+                "data": None,
+                "errorMessage": result.message,
+                "errorType": result.type,
+            }
+        if isinstance(result, Exception):
+            return {
+                "data": None,
+                "errorMessage": "Unknown exception, please check Lambda log for more details",
+                "errorType": ErrorCode.UNKNOWN_ERROR.name,
+            }
+        return {"data": result}
+
 
 def singleton(cls):
     """Singleton decoractor for Classes
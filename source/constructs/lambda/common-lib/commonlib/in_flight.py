@@ -0,0 +1,260 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple, Union
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from .aws import BATCH_GET_MAX_KEYS, DynamoDBUtil
+from .checkpoint import DEFAULT_MAX_WORKERS, ENTITY_TYPE, TEST_SUMMARY_ATTRIBUTES
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_INDEX = "inFlightIndex"
+
+# Attribute of the sparse in flight index, set to the status of the TEST
+# items of QUEUED and RUNNING runs and removed once the run is finished.
+IN_FLIGHT_ATTRIBUTE = "inFlight"
+IN_FLIGHT_STATUS = "RUNNING"
+IN_FLIGHT_STATUSES = ("QUEUED", IN_FLIGHT_STATUS)
+
+
+class InFlightRunDao:
+    """Data Access Layer for the QUEUED and RUNNING runs (TEST items)
+
+    Runs in progress are kept in the sparse in flight index, so that they
+    are listed without reading the history of every checkpoint.
+
+    Usage:
+    ```
+    dao = InFlightRunDao(table_name)
+
+    runs, next_token = dao.list_in_flight_runs(limit=100)
+    previous_runs = dao.finish_runs(
+        [{"PK": run["PK"], "SK": run["SK"], "status": "TIMEOUT", "duration": 0}]
+    )
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def update_queued_run(self, test_id: str, marker_id: str, attributes: dict) -> bool:
+        """Update a TEST item only while it is QUEUED.
+
+        Args:
+            test_id (str): test run id.
+            marker_id (str): checkpoint id.
+            attributes (dict): attributes to set.
+
+        Returns:
+            bool: True if updated, False if the run is not QUEUED or not found.
+        """
+        names = {f"#{name}": name for name in attributes}
+        values = {f":{name}": value for name, value in attributes.items()}
+        values[":queued"] = "QUEUED"
+        try:
+            self._table.update_item(
+                Key={
+                    "PK": f"{ENTITY_TYPE.TEST.value}#{test_id}",
+                    "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+                },
+                UpdateExpression="SET "
+                + ", ".join(f"#{name} = :{name}" for name in attributes),
+                ConditionExpression="#status = :queued",
+                ExpressionAttributeNames={**names, "#status": "status"},
+                ExpressionAttributeValues=values,
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def list_running_runs(
+        self,
+        marker_id: str,
+        since: str = "",
+        statuses: Tuple[str, ...] = (IN_FLIGHT_STATUS,),
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> List[dict]:
+        """List the runs of a checkpoint started since a time and still in progress.
+
+        The runs are queried from the partitions of the sparse in flight
+        index, which only hold the runs in progress, rather than from the
+        history of the checkpoint.
+
+        Args:
+            marker_id (str): checkpoint id.
+            since (str, optional): start time, e.g. 2024-01-01T00:00:00Z.
+                Defaults to all the runs.
+            statuses (Tuple[str, ...], optional): the statuses of the runs in
+                progress, among QUEUED and RUNNING. Defaults to RUNNING only.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            List[dict]: The summary of the TEST items, latest first.
+        """
+        keys = []
+        for status in statuses:
+            key_condition = Key(IN_FLIGHT_ATTRIBUTE).eq(status)
+            if since:
+                key_condition = key_condition & Key("createdAt").gte(since)
+            items, _ = self._ddb_util.query_page(
+                {
+                    "IndexName": IN_FLIGHT_INDEX,
+                    "KeyConditionExpression": key_condition,
+                    "FilterExpression": Attr("SK").eq(
+                        f"{ENTITY_TYPE.MARKER.value}#{marker_id}"
+                    ),
+                    "ProjectionExpression": "PK, SK",
+                }
+            )
+            keys.extend(items)
+
+        key_chunks = [
+            keys[i : i + BATCH_GET_MAX_KEYS]
+            for i in range(0, len(keys), BATCH_GET_MAX_KEYS)
+        ]
+        runs = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for items in executor.map(
+                lambda chunk: self._ddb_util.batch_get_items(
+                    chunk, TEST_SUMMARY_ATTRIBUTES
+                ),
+                key_chunks,
+            ):
+                # the index is eventually consistent, a run may be finished
+                runs.extend(item for item in items if item["status"] in statuses)
+        return sorted(runs, key=lambda item: item["createdAt"], reverse=True)
+
+    def list_in_flight_runs(
+        self, limit: int = 0, next_token: str = "", created_before: str = ""
+    ) -> Tuple[List[dict], str]:
+        """List the RUNNING runs of all checkpoints through the sparse in
+        flight index.
+
+        Args:
+            limit (int, optional): max number of items. Defaults to 0, which is no limit.
+            next_token (str, optional): token returned by the previous page.
+            created_before (str, optional): only the runs created before this
+                time, e.g. 2024-01-01T00:00:00Z.
+
+        Returns:
+            Tuple[List[dict], str]: The keys, createdAt and codeBuildArn of
+                the TEST items, oldest first, and the token of the next page.
+        """
+        key_condition = Key(IN_FLIGHT_ATTRIBUTE).eq(IN_FLIGHT_STATUS)
+        if created_before:
+            key_condition = key_condition & Key("createdAt").lt(created_before)
+        return self._ddb_util.query_page(
+            {"IndexName": IN_FLIGHT_INDEX, "KeyConditionExpression": key_condition},
+            limit,
+            next_token,
+        )
+
+    def finish_runs(
+        self,
+        runs: List[dict],
+        from_statuses: Tuple[str, ...] = (IN_FLIGHT_STATUS,),
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        return_exceptions: bool = False,
+    ) -> List[Union[dict, Exception, None]]:
+        """Set the terminal status of many RUNNING runs concurrently.
+
+        Every update is conditioned on the run being still RUNNING, so that
+        a result written by the parser meanwhile is never overwritten.
+
+        Args:
+            runs (List[dict]): the PK, SK, status and duration of each run.
+            from_statuses (Tuple[str, ...], optional): the statuses a run
+                can be finished from. Defaults to RUNNING only.
+            max_workers (int, optional): max number of concurrent requests.
+            return_exceptions (bool, optional): return the error of a run
+                which can not be updated in its place, rather than raising
+                it once all the updates are done. Defaults to False.
+
+        Returns:
+            List[Union[dict, Exception, None]]: The previous TEST item of
+                each run, or None if the run is already finished, in order.
+        """
+        updated_at = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        def finish_run(run: dict):
+            try:
+                return self._finish_run(run, from_statuses, updated_at)
+            except Exception as e:
+                logger.error(f"Failed to finish run {run['PK']}: {e}")
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(finish_run, runs))
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def _finish_run(
+        self, run: dict, from_statuses: Tuple[str, ...], updated_at: str
+    ) -> Optional[dict]:
+        client = self._table.meta.client
+        try:
+            response = client.update_item(
+                TableName=self._table.name,
+                Key={"PK": run["PK"], "SK": run["SK"]},
+                UpdateExpression=(
+                    "SET #status = :status, #duration = :duration, "
+                    "#updatedAt = :updatedAt REMOVE #inFlight"
+                ),
+                ConditionExpression=Attr("status").is_in(list(from_statuses)),
+                ExpressionAttributeNames={
+                    "#status": "status",
+                    "#duration": "duration",
+                    "#updatedAt": "updatedAt",
+                    "#inFlight": IN_FLIGHT_ATTRIBUTE,
+                },
+                ExpressionAttributeValues={
+                    ":status": run["status"],
+                    ":duration": run["duration"],
+                    ":updatedAt": updated_at,
+                },
+                ReturnValues="ALL_OLD",
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            logger.info(f"Run {run['PK']} is already finished")
+            return None
+        return response["Attributes"]
+
+    def backfill_in_flight_runs(self) -> int:
+        """Add the QUEUED and RUNNING runs written before the in flight index
+        to it.
+
+        Returns:
+            int: Number of TEST items updated.
+        """
+        kwargs = {
+            "FilterExpression": Attr("PK").begins_with(f"{ENTITY_TYPE.TEST.value}#")
+            & Attr("status").is_in(list(IN_FLIGHT_STATUSES))
+            & Attr(IN_FLIGHT_ATTRIBUTE).not_exists(),
+            "ProjectionExpression": "PK, SK, #status",
+            "ExpressionAttributeNames": {"#status": "status"},
+        }
+        updated = 0
+        while True:
+            response = self._table.scan(**kwargs)
+            for item in response.get("Items", []):
+                self._ddb_util.update_item(
+                    {"PK": item["PK"], "SK": item["SK"]},
+                    {IN_FLIGHT_ATTRIBUTE: item["status"]},
+                )
+                updated += 1
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        logger.info(f"Backfilled {updated} runs in flight")
+        return updated
@@ -0,0 +1,483 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+
+from .aws import AWSConnection, DynamoDBUtil
+
+logger = logging.getLogger(__name__)
+
+# Scope of the launch slots shared by all projects of the account
+ACCOUNT_SCOPE = "ACCOUNT"
+
+# Attribute of a TEST item holding the number of launch slots of each scope
+# held by the run, one per shard. Runs without it hold one slot.
+LAUNCH_SLOT_COUNT_ATTRIBUTE = "launchSlotCount"
+
+# Number of times a launch is tried before it is given up
+DEFAULT_MAX_ATTEMPTS = 3
+
+# A received message, as (receipt, message, receive count)
+ReceivedMessage = Tuple[str, dict, int]
+
+
+def get_project_scope(project_name: str) -> str:
+    """Get the scope of the launch slots of a project"""
+    return f"PROJECT#{project_name}"
+
+
+def get_shard_variables(variables: List[dict], shards: int = 1) -> List[List[dict]]:
+    """Get the environment variables of the build of each shard of a run.
+
+    The builds of a sharded run share the variables of the run, with the
+    index of their shard and the total number of shards added. A run which
+    is not sharded has a single build with the variables of the run.
+
+    Args:
+        variables (List[dict]): the variables of the run, as name and value.
+        shards (int, optional): number of shards. Defaults to 1.
+
+    Returns:
+        List[List[dict]]: The variables of each build, in shard order.
+    """
+    if shards <= 1:
+        return [variables]
+    return [
+        variables
+        + [
+            {"name": "shard_index", "value": str(shard_index)},
+            {"name": "shard_total", "value": str(shards)},
+        ]
+        for shard_index in range(shards)
+    ]
+
+
+class TokenBucket:
+    """Token bucket limiting the rate of launches
+
+    Usage:
+    ```
+    bucket = TokenBucket(rate=2, capacity=5)
+
+    if bucket.acquire(timeout=1):
+        start_build()
+    ```
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            rate (float): tokens added per second.
+            capacity (float): max number of tokens, i.e. the max burst.
+            clock (Callable, optional): monotonic clock. Defaults to time.monotonic.
+            sleep (Callable, optional): sleep function. Defaults to time.sleep.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """Take a token, waiting up to timeout seconds for one."""
+        deadline = self._clock() + timeout
+        while not self.try_acquire():
+            wait = (1 - self._tokens) / self.rate
+            if self._clock() + wait > deadline:
+                return False
+            self._sleep(wait)
+        return True
+
+    def refund(self) -> None:
+        """Give back a token which was not used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class InMemoryLaunchQueue:
+    """Launch queue kept in memory, used to run the dispatcher locally.
+
+    Messages behave as in SQS: a received message is invisible until it is
+    deleted or released, and a message released with a delay is received
+    again only after the delay.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._messages = []
+        self._in_flight = {}
+        self._receive_counts = {}
+        self._next_receipt = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def put(self, messages: List[dict]) -> None:
+        with self._lock:
+            for message in messages:
+                self._messages.append((0, self._next_receipt, message))
+                self._receive_counts[self._next_receipt] = 0
+                self._next_receipt += 1
+
+    def receive(self, max_messages: int = 10) -> List[ReceivedMessage]:
+        received = []
+        now = self._clock()
+        with self._lock:
+            for visible_at, receipt, message in list(self._messages):
+                if len(received) >= max_messages:
+                    break
+                if visible_at > now:
+                    continue
+                self._messages.remove((visible_at, receipt, message))
+                self._in_flight[receipt] = message
+                self._receive_counts[receipt] += 1
+                received.append((str(receipt), message, self._receive_counts[receipt]))
+        return received
+
+    def delete(self, receipt: str) -> None:
+        with self._lock:
+            self._in_flight.pop(int(receipt), None)
+            self._receive_counts.pop(int(receipt), None)
+
+    def release(self, receipt: str, delay: int = 0) -> None:
+        """Make a received message visible again after delay seconds."""
+        with self._lock:
+            message = self._in_flight.pop(int(receipt), None)
+            if message is not None:
+                self._messages.append((self._clock() + delay, int(receipt), message))
+
+    def depth(self) -> int:
+        return len(self._messages) + len(self._in_flight)
+
+
+class SQSLaunchQueue:
+    """Launch queue backed by an SQS queue."""
+
+    def __init__(self, queue_url: str) -> None:
+        self.queue_url = queue_url
+        self._sqs = AWSConnection().get_client("sqs")
+
+    def put(self, messages: List[dict]) -> None:
+        for i in range(0, len(messages), 10):
+            response = self._sqs.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(j), "MessageBody": json.dumps(message)}
+                    for j, message in enumerate(messages[i : i + 10])
+                ],
+            )
+            if response.get("Failed"):
+                raise RuntimeError(f"Failed to enqueue launches: {response['Failed']}")
+
+    def receive(self, max_messages: int = 10) -> List[ReceivedMessage]:
+        response = self._sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, 10),
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            (
+                message["ReceiptHandle"],
+                json.loads(message["Body"]),
+                int(message["Attributes"]["ApproximateReceiveCount"]),
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def delete(self, receipt: str) -> None:
+        self._sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+    def release(self, receipt: str, delay: int = 0) -> None:
+        """Make a received message visible again after delay seconds."""
+        self._sqs.change_message_visibility(
+            QueueUrl=self.queue_url, ReceiptHandle=receipt, VisibilityTimeout=delay
+        )
+
+    def depth(self) -> int:
+        attributes = self._sqs.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+            ],
+        )["Attributes"]
+        return int(attributes["ApproximateNumberOfMessages"]) + int(
+            attributes["ApproximateNumberOfMessagesNotVisible"]
+        )
+
+
+class InMemoryLaunchSlots:
+    """Counters of the builds in flight, kept in memory."""
+
+    def __init__(self) -> None:
+        self.in_flight = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scope: str, limit: int, count: int = 1) -> bool:
+        with self._lock:
+            if self.in_flight.get(scope, 0) + count > limit:
+                return False
+            self.in_flight[scope] = self.in_flight.get(scope, 0) + count
+            return True
+
+    def release(self, scope: str, count: int = 1) -> None:
+        with self._lock:
+            self.in_flight[scope] = max(self.in_flight.get(scope, 0) - count, 0)
+
+
+class DynamoDBLaunchSlots:
+    """Counters of the builds in flight, kept in the table as
+    LAUNCH_SLOTS#<scope> items.
+
+    A slot is acquired by the dispatcher before a build is started, and
+    released by the result parser once the run finished. A sharded run
+    holds a slot per shard.
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._table = DynamoDBUtil(table_name)._table
+
+    @staticmethod
+    def _key(scope: str) -> dict:
+        return {"PK": f"LAUNCH_SLOTS#{scope}", "SK": "LAUNCH_SLOTS"}
+
+    def acquire(self, scope: str, limit: int, count: int = 1) -> bool:
+        if count > limit:
+            return False
+        try:
+            self._table.update_item(
+                Key=self._key(scope),
+                UpdateExpression="ADD #inFlight :count",
+                ConditionExpression=Attr("inFlight").not_exists()
+                | Attr("inFlight").lte(limit - count),
+                ExpressionAttributeNames={"#inFlight": "inFlight"},
+                ExpressionAttributeValues={":count": count},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def release(self, scope: str, count: int = 1) -> None:
+        try:
+            self._table.update_item(
+                Key=self._key(scope),
+                UpdateExpression="ADD #inFlight :minus_count",
+                ConditionExpression=Attr("inFlight").gte(count),
+                ExpressionAttributeNames={"#inFlight": "inFlight"},
+                ExpressionAttributeValues={":minus_count": -count},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.warning(f"No {count} launch slots of {scope} to release")
+
+    def get_in_flight(self, scope: str) -> int:
+        item = self._table.get_item(Key=self._key(scope)).get("Item", {})
+        return int(item.get("inFlight", 0))
+
+
+class LaunchDispatcher:
+    """Drain a launch queue under a rate and in-flight budget.
+
+    Every message is a run to start, with the project of its checkpoint. A
+    run is started only if a token of the rate limit is available and a
+    launch slot per shard of both the account and its project can be
+    acquired, otherwise it is left in the queue for a later drain. A run
+    with more shards than the limits is given up.
+
+    Usage:
+    ```
+    dispatcher = LaunchDispatcher(
+        queue=InMemoryLaunchQueue(),
+        slots=InMemoryLaunchSlots(),
+        start=start_run,
+        project_limit=5,
+        account_limit=20,
+        rate=1,
+        burst=5,
+    )
+    stats = dispatcher.drain(time_budget=60)
+    ```
+    """
+
+    def __init__(
+        self,
+        queue,
+        slots,
+        start: Callable[[dict, List[str]], Optional[bool]],
+        project_limit: int,
+        account_limit: int,
+        rate: float,
+        burst: float,
+        on_error: Optional[Callable[[dict, Exception], None]] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        defer_seconds: int = 30,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        now: Callable[[], float] = time.time,
+    ) -> None:
+        """Constructor.
+
+        Args:
+            queue: launch queue, e.g. InMemoryLaunchQueue or SQSLaunchQueue.
+            slots: launch slots, e.g. InMemoryLaunchSlots or DynamoDBLaunchSlots.
+            start (Callable): starts the run of a message, with the scopes of
+                the slots acquired for it, a slot per shard of each scope.
+                The run is skipped if it returns False.
+            project_limit (int): max number of builds in flight per project.
+            account_limit (int): max number of builds in flight in the account.
+            rate (float): max number of builds started per second.
+            burst (float): max number of builds started at once.
+            on_error (Callable, optional): called when a run is given up.
+            max_attempts (int, optional): times a run is tried. Defaults to 3.
+            defer_seconds (int, optional): delay before a deferred run is
+                received again. Defaults to 30.
+        """
+        self.queue = queue
+        self.slots = slots
+        self.start = start
+        self.project_limit = project_limit
+        self.account_limit = account_limit
+        self.on_error = on_error
+        self.max_attempts = max_attempts
+        self.defer_seconds = defer_seconds
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self._clock = clock
+        self._now = now
+
+    def _acquire_slots(self, project_name: str, count: int) -> Tuple[List[str], str]:
+        """Acquire count launch slots of the account and of the project.
+
+        Returns:
+            Tuple[List[str], str]: The scopes acquired, and the scope which
+                is full if the slots can not be acquired.
+        """
+        if not self.slots.acquire(ACCOUNT_SCOPE, self.account_limit, count):
+            return [], ACCOUNT_SCOPE
+        project_scope = get_project_scope(project_name)
+        if not self.slots.acquire(project_scope, self.project_limit, count):
+            self.slots.release(ACCOUNT_SCOPE, count)
+            return [], project_scope
+        return [ACCOUNT_SCOPE, project_scope], ""
+
+    def drain(self, time_budget: float = 60) -> Dict[str, float]:
+        """Start the queued runs until the queue is empty, the budget is
+        exhausted, or time_budget seconds passed.
+
+        Returns:
+            Dict[str, float]: The number of runs dispatched, deferred, failed
+                and skipped, the queue depth left, and the max and average time
+                the dispatched runs waited in the queue, in seconds.
+        """
+        deadline = self._clock() + time_budget
+        dispatched, deferred, failed, skipped = 0, 0, 0, 0
+        waits = []
+        account_full = False
+        full_projects = set()
+
+        while not account_full and self._clock() < deadline:
+            messages = self.queue.receive(10)
+            if not messages:
+                break
+            for receipt, message, receive_count in messages:
+                project_name = message.get("projectName", "")
+                count = message.get("shards", 1)
+                if count > min(self.account_limit, self.project_limit):
+                    # the run would never get its launch slots
+                    error = ValueError(
+                        f"{count} shards exceed the limit of builds in flight"
+                    )
+                    logger.error(
+                        f"Failed to start run {message.get('testId')}: {error}"
+                    )
+                    failed += 1
+                    if self.on_error:
+                        self.on_error(message, error)
+                    self.queue.delete(receipt)
+                    continue
+                if account_full or project_name in full_projects:
+                    self.queue.release(receipt, self.defer_seconds)
+                    deferred += 1
+                    continue
+                if not self.bucket.acquire(timeout=max(deadline - self._clock(), 0)):
+                    self.queue.release(receipt)
+                    deferred += 1
+                    continue
+
+                scopes, full_scope = self._acquire_slots(project_name, count)
+                if full_scope:
+                    # backpressure, the run waits in the queue for a build
+                    # of the same scope to finish
+                    self.bucket.refund()
+                    self.queue.release(receipt, self.defer_seconds)
+                    deferred += 1
+                    if full_scope == ACCOUNT_SCOPE:
+                        account_full = True
+                    else:
+                        full_projects.add(project_name)
+                    continue
+
+                try:
+                    started = self.start(message, scopes)
+                except Exception as e:
+                    logger.error(f"Failed to start run {message.get('testId')}: {e}")
+                    for scope in scopes:
+                        self.slots.release(scope, count)
+                    failed += 1
+                    if receive_count >= self.max_attempts:
+                        if self.on_error:
+                            self.on_error(message, e)
+                        self.queue.delete(receipt)
+                    else:
+                        self.queue.release(receipt, self.defer_seconds)
+                    continue
+
+                self.queue.delete(receipt)
+                if started is False:
+                    # the run is no longer waiting to start
+                    for scope in scopes:
+                        self.slots.release(scope, count)
+                    skipped += 1
+                    continue
+                dispatched += 1
+                waits.append(max(self._now() - message.get("enqueuedAt", 0), 0))
+
+        stats = {
+            "dispatched": dispatched,
+            "deferred": deferred,
+            "failed": failed,
+            "skipped": skipped,
+            "depth": self.queue.depth(),
+            "maxWaitSeconds": max(waits) if waits else 0,
+            "avgWaitSeconds": sum(waits) / len(waits) if waits else 0,
+        }
+        logger.info(f"Launch queue drained: {stats}")
+        return stats
@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from decimal import Decimal
+from typing import Optional
+
+from .aws import DynamoDBUtil
+
+# Key of the item holding the statistics of the last drain of the launch queue
+LAUNCH_QUEUE_KEY = {"PK": "META#LAUNCH_QUEUE", "SK": "META#LAUNCH_QUEUE"}
+
+
+class LaunchQueueStatsDao:
+    """Data Access Layer for the statistics of the launch queue
+
+    Usage:
+    ```
+    dao = LaunchQueueStatsDao(table_name)
+
+    dao.put_launch_queue_stats({"dispatched": 2, "avgWaitSeconds": 1.5})
+    stats = dao.get_launch_queue_stats()
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def put_launch_queue_stats(self, stats: dict) -> None:
+        """Save the statistics of the last drain of the launch queue."""
+        self._ddb_util.put_item(
+            {
+                **LAUNCH_QUEUE_KEY,
+                **{
+                    name: Decimal(str(value)) if isinstance(value, float) else value
+                    for name, value in stats.items()
+                },
+            }
+        )
+
+    def get_launch_queue_stats(self) -> Optional[dict]:
+        """Get the statistics of the last drain of the launch queue."""
+        return self._table.get_item(Key=LAUNCH_QUEUE_KEY).get("Item")
@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import itertools
+import logging
+import math
+from enum import Enum
+from typing import Dict, List, Optional
+
+from .exception import APIException, ErrorCode
+
+logger = logging.getLogger(__name__)
+
+# Max number of cells of a matrix, to protect the account from a launch
+# of an unexpected number of builds.
+MAX_MATRIX_CELLS = 256
+# Max size of the cartesian product expanded before the rules are applied
+MAX_PRODUCT_SIZE = 10000
+
+
+class MATRIX_MODE(Enum):
+    FULL = "FULL"
+    PAIRWISE = "PAIRWISE"
+
+
+def to_combination(parameters: Optional[List[dict]]) -> Dict[str, str]:
+    """Convert a list of ParameterInput to a combination, e.g.
+    [{"parameterKey": "buffer", "parameterValue": "KDS"}] to {"buffer": "KDS"}
+    """
+    return {
+        param["parameterKey"]: param["parameterValue"]
+        for param in parameters or []
+        if param.get("parameterKey") and param.get("parameterValue")
+    }
+
+
+def to_parameters(combination: Dict[str, str]) -> List[dict]:
+    """Convert a combination back to a list of ParameterInput"""
+    return [
+        {"parameterKey": key, "parameterValue": value}
+        for key, value in combination.items()
+    ]
+
+
+def _matches(combination: Dict[str, str], rule: Dict[str, str]) -> bool:
+    return all(combination.get(key) == value for key, value in rule.items())
+
+
+def _pairs(combination: Dict[str, str]) -> set:
+    return set(itertools.combinations(sorted(combination.items()), 2))
+
+
+def _pairwise(combinations: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Select a subset of combinations covering every pair of values.
+
+    Combinations are picked greedily, the one covering most of the pairs not
+    covered yet first, which is not minimal but close for small matrices.
+    """
+    uncovered = set().union(*(_pairs(combination) for combination in combinations))
+    candidates = list(combinations)
+    selected = []
+    while uncovered and candidates:
+        best = max(candidates, key=lambda c: len(_pairs(c) & uncovered))
+        if not _pairs(best) & uncovered:
+            break
+        selected.append(best)
+        candidates.remove(best)
+        uncovered -= _pairs(best)
+    return selected
+
+
+def expand_matrix(
+    allowed_parameters: List[dict],
+    mode: str = MATRIX_MODE.FULL.value,
+    include: Optional[List[Dict[str, str]]] = None,
+    exclude: Optional[List[Dict[str, str]]] = None,
+) -> List[Dict[str, str]]:
+    """Expand the allowed values of the parameters of a checkpoint.
+
+    The rules work as the matrix of GitHub Actions: the combinations
+    matching all the values of an exclude rule are removed, then every
+    include rule is added as a combination if not already present.
+
+    Args:
+        allowed_parameters (List[dict]): the parameters of a checkpoint, e.g.
+            [{"parameterKey": "buffer", "allowedValues": ["KDS", "S3"]}].
+        mode (str, optional): FULL for the cartesian product, PAIRWISE for a
+            subset covering every pair of values. Defaults to FULL.
+        include (List[Dict[str, str]], optional): combinations to add.
+        exclude (List[Dict[str, str]], optional): combinations to remove.
+
+    Returns:
+        List[Dict[str, str]]: The combinations, without duplicates.
+    """
+    keys = [param["parameterKey"] for param in allowed_parameters]
+    values = [param.get("allowedValues") or [] for param in allowed_parameters]
+    if math.prod(len(value) for value in values) > MAX_PRODUCT_SIZE:
+        raise APIException(
+            ErrorCode.VALUE_ERROR,
+            f"The matrix of {keys} has more than {MAX_PRODUCT_SIZE} combinations",
+        )
+    combinations = [
+        dict(zip(keys, combination)) for combination in itertools.product(*values)
+    ]
+
+    exclude = exclude or []
+    combinations = [
+        combination
+        for combination in combinations
+        if not any(_matches(combination, rule) for rule in exclude)
+    ]
+    if mode == MATRIX_MODE.PAIRWISE.value and len(keys) > 2:
+        combinations = _pairwise(combinations)
+    elif mode not in (MATRIX_MODE.FULL.value, MATRIX_MODE.PAIRWISE.value):
+        raise APIException(ErrorCode.VALUE_ERROR, f"Unsupported matrix mode {mode}")
+
+    for rule in include or []:
+        if rule and rule not in combinations:
+            combinations.append(dict(rule))
+
+    if len(combinations) > MAX_MATRIX_CELLS:
+        raise APIException(
+            ErrorCode.VALUE_ERROR,
+            f"The matrix has {len(combinations)} cells, "
+            f"the max is {MAX_MATRIX_CELLS}",
+        )
+    logger.info(f"Expanded {mode} matrix of {keys} to {len(combinations)} cells")
+    return combinations
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from typing import Optional
+
+from boto3.dynamodb.conditions import Attr
+
+from .aws import DynamoDBUtil
+from .checkpoint import ENTITY_TYPE
+
+logger = logging.getLogger(__name__)
+
+
+class MatrixRunDao:
+    """Data Access Layer for the matrix runs (MATRIX items) of the checkpoints
+
+    Usage:
+    ```
+    dao = MatrixRunDao(table_name)
+
+    dao.record_matrix_result(matrix_id, marker_id, status="PASS")
+    matrix_run = dao.get_matrix_run(matrix_id)
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def put_matrix_run(self, item: dict) -> None:
+        """Write the parent item of the runs of a parameter matrix.
+
+        The item is keyed MATRIX#<id> / MARKER#<marker id>, and has no
+        createdAt so that it is not listed with the TEST items.
+        """
+        self._ddb_util.put_item(item)
+
+    def get_matrix_run(self, matrix_id: str) -> Optional[dict]:
+        """Get the parent item of the runs of a parameter matrix."""
+        items = self._ddb_util.query_items(
+            {"PK": f"{ENTITY_TYPE.MATRIX.value}#{matrix_id}"}, limit=1
+        )
+        return items[0] if items else None
+
+    def update_matrix_cells(self, matrix_id: str, marker_id: str, cells: list) -> None:
+        """Set the cells of a matrix run once they are started.
+
+        Cells which failed to start, or which reference a run already in
+        progress, are not part of the total. The status of the matrix run is
+        completed if all other cells already finished.
+        """
+        response = self._table.update_item(
+            Key={
+                "PK": f"{ENTITY_TYPE.MATRIX.value}#{matrix_id}",
+                "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+            },
+            UpdateExpression="SET #cells = :cells, #total = :total",
+            ExpressionAttributeNames={"#cells": "cells", "#total": "total"},
+            ExpressionAttributeValues={
+                ":cells": cells,
+                ":total": len(
+                    [
+                        cell
+                        for cell in cells
+                        if cell.get("testId") and not cell.get("deduplicated")
+                    ]
+                ),
+            },
+            ReturnValues="ALL_NEW",
+        )
+        self._complete_matrix_run(response["Attributes"])
+
+    def record_matrix_result(self, matrix_id: str, marker_id: str, status: str) -> None:
+        """Add a finished run to the counters of its matrix run.
+
+        The status of the matrix run is set once all its runs finished,
+        PASS if they all passed, FAILED otherwise.
+        """
+        passed = 1 if status == "PASS" else 0
+        response = self._table.update_item(
+            Key={
+                "PK": f"{ENTITY_TYPE.MATRIX.value}#{matrix_id}",
+                "SK": f"{ENTITY_TYPE.MARKER.value}#{marker_id}",
+            },
+            UpdateExpression="ADD #finished :one, #passes :passes, #failures :failures",
+            ExpressionAttributeNames={
+                "#finished": "finished",
+                "#passes": "passes",
+                "#failures": "failures",
+            },
+            ExpressionAttributeValues={
+                ":one": 1,
+                ":passes": passed,
+                ":failures": 1 - passed,
+            },
+            ReturnValues="ALL_NEW",
+        )
+        self._complete_matrix_run(response["Attributes"])
+
+    def _complete_matrix_run(self, matrix_run: dict) -> None:
+        # the total is only known once all the cells are started
+        if "total" not in matrix_run:
+            return
+        if matrix_run.get("finished", 0) < matrix_run["total"]:
+            return
+        status = "PASS" if not matrix_run.get("failures") else "FAILED"
+        try:
+            self._table.update_item(
+                Key={"PK": matrix_run["PK"], "SK": matrix_run["SK"]},
+                UpdateExpression="SET #status = :status",
+                ConditionExpression=Attr("status").eq("RUNNING"),
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={":status": status},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.info(f"Matrix run {matrix_run['PK']} is already completed")
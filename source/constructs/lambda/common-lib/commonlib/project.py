@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from typing import Dict, List, Optional
+
+from .cache import LRUCache
+from .project_dao import ProjectDao
+
+logger = logging.getLogger(__name__)
+
+# Projects are read from the table at most once per this number of seconds
+# in a warm container, so that a project onboarded or updated in the table
+# is used without a redeployment.
+DEFAULT_PROJECT_TTL = 300
+
+
+def map_parameters(
+    parameters: Optional[List[dict]],
+    parameter_mapping: Optional[List[dict]] = None,
+    pass_unmapped: bool = False,
+) -> Dict[str, str]:
+    """Map the parameters of a run to the variables of the test project.
+
+    Args:
+        parameters (List[dict]): the parameters of a run, e.g.
+            [{"parameterKey": "buffer", "parameterValue": "KDS"}].
+        parameter_mapping (List[dict], optional): the mapping spec of the
+            project, e.g. [{"parameterKey": "buffer", "name": "buffer_layer"}].
+        pass_unmapped (bool, optional): whether the parameters not in the
+            mapping are passed with their own key. Defaults to False.
+
+    Returns:
+        Dict[str, str]: The variables, e.g. {"buffer_layer": "KDS"}.
+    """
+    names = {rule["parameterKey"]: rule["name"] for rule in parameter_mapping or []}
+    variables = {}
+    for param in parameters or []:
+        parameter_key = param.get("parameterKey")
+        parameter_value = param.get("parameterValue")
+        if parameter_key in names:
+            variables[names[parameter_key]] = parameter_value
+        elif pass_unmapped:
+            variables[parameter_key] = parameter_value
+    return variables
+
+
+class ProjectRegistry:
+    """Projects of the table, cached in the warm container.
+
+    Usage:
+    ```
+    registry = ProjectRegistry(project_dao, ttl=300)
+
+    project = registry.get("775ab001-rety-ghkl-poiu-123597a8zxcv")
+    ```
+    """
+
+    def __init__(
+        self, dao: ProjectDao, ttl: float = DEFAULT_PROJECT_TTL, maxsize: int = 128
+    ) -> None:
+        self._dao = dao
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, project_id: str) -> Optional[dict]:
+        """Get a project, or None if it is not registered.
+
+        Missing projects are not cached, so that a project is used as soon
+        as it is registered.
+        """
+        project = self._cache.get(project_id)
+        if project is None:
+            project = self._dao.get_project(project_id)
+            if project is not None:
+                self._cache.put(project_id, project)
+        return project
+
+    def invalidate(self) -> None:
+        """Drop the cached projects, e.g. once a project is updated."""
+        self._cache.clear()
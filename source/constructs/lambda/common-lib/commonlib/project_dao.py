@@ -0,0 +1,120 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from .aws import DynamoDBUtil
+from .checkpoint import ENTITY_TYPE, ENTITY_TYPE_INDEX, get_id_from_key
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectDao:
+    """Data Access Layer for the test projects (PROJECT items)
+
+    Usage:
+    ```
+    dao = ProjectDao(table_name)
+
+    dao.put_project(project_id, {"projectName": "CLO", "branch": "main"})
+    project = dao.get_project(project_id)
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def get_project(self, project_id: str) -> Optional[dict]:
+        """Get the PROJECT item of a project.
+
+        The item is keyed PROJECT#<id> / PROJECT#<id>, the sort key of the
+        MARKER items of its checkpoints. It has no createdAt so that it is
+        not listed with the checkpoints of the project.
+
+        Args:
+            project_id (str): project id.
+
+        Returns:
+            dict: The PROJECT item, or None if not registered.
+        """
+        key = f"{ENTITY_TYPE.PROJECT.value}#{project_id}"
+        return self._ddb_util.get_item({"PK": key, "SK": key})
+
+    def put_project(self, project_id: str, attributes: dict) -> dict:
+        """Register a project, or replace its settings.
+
+        Args:
+            project_id (str): project id.
+            attributes (dict): the settings of the project, such as its
+                codecommitRepo, branch, region and parameterMapping.
+
+        Returns:
+            dict: The PROJECT item.
+        """
+        key = f"{ENTITY_TYPE.PROJECT.value}#{project_id}"
+        item = {
+            **attributes,
+            "PK": key,
+            "SK": key,
+            "entityType": ENTITY_TYPE.PROJECT.value,
+            "updatedAt": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        self._ddb_util.put_item(item)
+        return item
+
+    def list_projects(self) -> List[dict]:
+        """List PROJECT items through the sparse entity type index."""
+        items, _ = self._ddb_util.query_page(
+            {
+                "IndexName": ENTITY_TYPE_INDEX,
+                "KeyConditionExpression": Key("entityType").eq(
+                    ENTITY_TYPE.PROJECT.value
+                ),
+            }
+        )
+        return items
+
+    def backfill_projects(self, projects: Dict[str, dict]) -> int:
+        """Register the projects of existing checkpoints by their name.
+
+        Projects already registered are not replaced. The MARKER items are
+        scanned rather than listed through the entity type index, as the
+        checkpoints of existing tables are not backfilled with it yet.
+
+        Args:
+            projects (Dict[str, dict]): the settings of the projects by name.
+
+        Returns:
+            int: Number of projects registered.
+        """
+        kwargs = {
+            "FilterExpression": Attr("PK").begins_with(f"{ENTITY_TYPE.MARKER.value}#"),
+            "ProjectionExpression": "SK, projectName",
+        }
+        project_names = {}
+        while True:
+            response = self._table.scan(**kwargs)
+            for marker in response.get("Items", []):
+                project_names[get_id_from_key(marker["SK"])] = marker.get(
+                    "projectName", ""
+                )
+            if "LastEvaluatedKey" not in response:
+                break
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        registered = 0
+        for project_id, project_name in project_names.items():
+            if project_name not in projects or self.get_project(project_id):
+                continue
+            self.put_project(
+                project_id, {"projectName": project_name, **projects[project_name]}
+            )
+            registered += 1
+        logger.info(f"Registered {registered} projects of existing checkpoints")
+        return registered
@@ -0,0 +1,410 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import codecs
+import gzip
+import json
+import logging
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .aws import AWSConnection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# The results of a run are stored in its TEST item up to this size, larger
+# results overflow to S3, as an item is limited to 400 KB.
+MAX_INLINE_RESULT_SIZE = 256 * 1024
+# Max size of the results in a chunk object, before compression
+RESULT_CHUNK_SIZE = 1024 * 1024
+RESULT_CHUNKS_ATTRIBUTE = "resultChunks"
+# The results kept in the item are encoded in a list of binary values, one
+# per shard. The first byte of a value is the version of its format:
+# 1: zlib compressed JSON array of the results.
+RESULT_DATA_ATTRIBUTE = "resultData"
+RESULT_FORMAT_VERSION = 1
+DEFAULT_MAX_WORKERS = 10
+# Phases of a test in a report, the duration of a test is the sum of them
+TEST_PHASES = ("setup", "call", "teardown")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# characters which may follow a value in an object or an array
+_DELIMITERS = ",:]} \t\n\r"
+
+
+class _StreamReader:
+    """Buffer of a stream, which keeps only the text not decoded yet."""
+
+    def __init__(self, stream, chunk_size: int) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._eof = False
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self, size: int = 0) -> bool:
+        """Read the next chunk, returns False at the end of the stream."""
+        if self._eof:
+            return False
+        chunk = self._stream.read(max(self._chunk_size, size))
+        self._eof = not chunk
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk, final=self._eof)
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Get the next character which is not a whitespace, '' at the end."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expecting one of {chars!r}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value is not complete, read at least as much again
+                # so that a large value is not decoded once per chunk.
+                if not self._fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            # a number at the end of the buffer may go on in the next chunk,
+            # e.g. "12" of "12.5", it is complete once a delimiter follows.
+            if (
+                end == len(self.buffer) or self.buffer[end] not in _DELIMITERS
+            ) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_report(
+    stream, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Tuple[str, Any]]:
+    """Read a JSON object incrementally, e.g. a pytest json report.
+
+    The members are yielded as they are read, and the elements of an array
+    are yielded one by one with the prefix "<key>.item", so only one
+    element is held in memory at a time, e.g.
+    ("duration", 12.5), ("tests.item", {...}), ("tests.item", {...}).
+
+    Args:
+        stream: a binary or text file-like object, e.g. the StreamingBody
+            of an S3 object.
+        chunk_size (int, optional): the number of bytes read at a time.
+
+    Returns:
+        Iterator[Tuple[str, Any]]: The prefixes and values of the members.
+    """
+    reader = _StreamReader(stream, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expecting a property name, got {key!r}")
+        reader.expect(":")
+        if reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield f"{key}.item", reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            yield key, reader.value()
+        if reader.expect(",}") == "}":
+            break
+
+
+def parse_test_case(test: dict) -> dict:
+    """Parse the result of a test of a report, as stored by the parser.
+
+    Args:
+        test (dict): a test of a pytest json report.
+
+    Returns:
+        dict: The nodeid, outcome, duration, message and trace of the test.
+    """
+    # a test failing in its setup has no call phase
+    call = test.get("call", {})
+    # the id and outcome of a test allow to rerun the failed ones
+    return {
+        "nodeid": test["nodeid"],
+        "outcome": test.get("outcome") or call["outcome"],
+        "duration": round(
+            sum(test.get(phase, {}).get("duration", 0) for phase in TEST_PHASES), 3
+        ),
+        "message": call["crash"]["message"] if "crash" in call else "-",
+        "trace": call.get("longrepr", "-"),
+    }
+
+
+def encode_results(results: List[dict], level: int = 6) -> bytes:
+    """Encode results in the latest format.
+
+    Args:
+        results (List[dict]): the results of the tests.
+        level (int, optional): the zlib compression level.
+
+    Returns:
+        bytes: The version of the format, then the compressed results.
+    """
+    content = json.dumps(results, separators=(",", ":")).encode("utf-8")
+    return bytes([RESULT_FORMAT_VERSION]) + zlib.compress(content, level)
+
+
+def decode_results(data) -> List[dict]:
+    """Decode results encoded by encode_results.
+
+    Args:
+        data (bytes): the encoded results, or a boto3 Binary.
+
+    Returns:
+        List[dict]: The results of the tests.
+    """
+    data = bytes(getattr(data, "value", data))
+    if not data or data[0] != RESULT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported result format {data[:1]!r}")
+    return json.loads(zlib.decompress(data[1:]))
+
+
+class ResultStore:
+    """Results of the runs, encoded in the TEST item or in chunks in S3.
+
+    Results are encoded in the resultData attribute of the item while they
+    fit. Larger results are written as gzip compressed JSON lines objects,
+    and the item keeps the list of its chunks, e.g.
+    [{"bucket": "central", "key": "results/t-001/0/00000.jsonl.gz", "count": 800}].
+
+    Usage:
+    ```
+    store = ResultStore("central-bucket")
+
+    attributes = store.put(results, "results/t-001/0")
+    results = store.read(item, offset=0, limit=100)
+
+    # a pointer to each result, e.g. for the items of the test cases
+    refs = store.locate(attributes)
+    [result] = store.read_refs([refs[0]], [item])
+    ```
+    """
+
+    def __init__(
+        self,
+        bucket: str = "",
+        max_inline_size: int = MAX_INLINE_RESULT_SIZE,
+        chunk_size: int = RESULT_CHUNK_SIZE,
+        s3_client=None,
+    ) -> None:
+        self.bucket = bucket
+        self.max_inline_size = max_inline_size
+        self.chunk_size = chunk_size
+        self._s3 = s3_client or AWSConnection().get_client("s3")
+
+    def put(self, results: List[dict], prefix: str, max_inline_size: int = 0) -> dict:
+        """Store the results of a run.
+
+        The keys of the chunks only depend on the prefix, so a report
+        delivered again overwrites the chunks of its first delivery.
+
+        Args:
+            results (List[dict]): the results of the tests.
+            prefix (str): the prefix of the chunk objects in the bucket.
+            max_inline_size (int, optional): the max size of the encoded
+                results kept in the item. Defaults to the size of the store.
+
+        Returns:
+            dict: The resultData and resultChunks attributes of the item,
+                the encoded results if they are small enough, otherwise
+                the chunks.
+        """
+        max_inline_size = max_inline_size or self.max_inline_size
+        data = encode_results(results)
+        if len(data) <= max_inline_size:
+            return {RESULT_DATA_ATTRIBUTE: [data], RESULT_CHUNKS_ATTRIBUTE: []}
+
+        chunks = []
+        lines = []
+        size = 0
+        for result in results:
+            line = json.dumps(result).encode("utf-8")
+            lines.append(line)
+            size += len(line) + 1
+            if size >= self.chunk_size:
+                chunks.append(self._put_chunk(prefix, len(chunks), lines))
+                lines = []
+                size = 0
+        if lines:
+            chunks.append(self._put_chunk(prefix, len(chunks), lines))
+        logger.info(f"Stored {len(results)} results in {len(chunks)} chunks")
+        return {RESULT_DATA_ATTRIBUTE: [], RESULT_CHUNKS_ATTRIBUTE: chunks}
+
+    def _put_chunk(self, prefix: str, index: int, lines: List[bytes]) -> dict:
+        key = f"{prefix}/{index:05d}.jsonl.gz"
+        self._s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=gzip.compress(b"\n".join(lines)),
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )
+        return {"bucket": self.bucket, "key": key, "count": len(lines)}
+
+    def _get_chunk(self, chunk: dict) -> List[dict]:
+        response = self._s3.get_object(Bucket=chunk["bucket"], Key=chunk["key"])
+        content = gzip.decompress(response["Body"].read())
+        return [json.loads(line) for line in content.splitlines() if line]
+
+    def read(
+        self,
+        item: dict,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> List[dict]:
+        """Read a page of the results of a run.
+
+        The results are decoded only here, and only the chunks of the page
+        are read from S3, concurrently.
+
+        Args:
+            item (dict): the run, with its result, resultData and
+                resultChunks attributes.
+            offset (int, optional): the index of the first result.
+            limit (int, optional): the max number of results, all by default.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            List[dict]: The results.
+        """
+        offset = max(offset or 0, 0)
+        end = None if limit is None else offset + max(limit, 0)
+        # the shards of a run may be stored inline or in chunks, the inline
+        # results come first. Runs parsed before the results were encoded
+        # have them in the result attribute.
+        inline = list(item.get("result") or [])
+        for data in item.get(RESULT_DATA_ATTRIBUTE) or []:
+            inline.extend(decode_results(data))
+        results = inline[offset:end]
+        pages = []
+        start = len(inline)
+        for chunk in item.get(RESULT_CHUNKS_ATTRIBUTE) or []:
+            count = int(chunk["count"])
+            if start + count > offset and (end is None or start < end):
+                pages.append((chunk, start))
+            start += count
+        if not pages:
+            return results
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            contents = executor.map(self._get_chunk, [chunk for chunk, _ in pages])
+            chunk_results = [result for content in contents for result in content]
+        first = pages[0][1]
+        return results + chunk_results[
+            max(offset - first, 0) : None if end is None else end - first
+        ]
+
+    def locate(self, attributes: dict, data_index: int = 0) -> List[dict]:
+        """Get a pointer to each result stored by put.
+
+        A result encoded in the item is pointed by the index of its value in
+        resultData and its index in the value, a result in a chunk by the
+        chunk object and its index in the chunk, e.g. {"dataIndex": 0,
+        "index": 12} or {"bucket": "central", "key": "results/...", "index": 3}.
+
+        Args:
+            attributes (dict): the attributes returned by put.
+            data_index (int, optional): the index of the encoded results in
+                the resultData of the item, e.g. for the shard of a run.
+
+        Returns:
+            List[dict]: The pointers, in the order of the results.
+        """
+        refs = []
+        for data in attributes.get(RESULT_DATA_ATTRIBUTE) or []:
+            refs.extend(
+                {"dataIndex": data_index, "index": index}
+                for index in range(len(decode_results(data)))
+            )
+        for chunk in attributes.get(RESULT_CHUNKS_ATTRIBUTE) or []:
+            refs.extend(
+                {"bucket": chunk["bucket"], "key": chunk["key"], "index": index}
+                for index in range(int(chunk["count"]))
+            )
+        return refs
+
+    def read_refs(
+        self,
+        refs: List[Optional[dict]],
+        items: List[dict],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ) -> List[Optional[dict]]:
+        """Read the results of pointers returned by locate.
+
+        Every chunk is read once, concurrently, and every encoded value is
+        decoded once.
+
+        Args:
+            refs (List[dict]): the pointers, None for no result.
+            items (List[dict]): the run of each pointer, with its resultData
+                attribute, only used by the pointers to encoded results.
+            max_workers (int, optional): max number of concurrent requests.
+
+        Returns:
+            List[Optional[dict]]: The results, None if a result is not found.
+        """
+        chunks = list(
+            dict.fromkeys(
+                (ref["bucket"], ref["key"]) for ref in refs if ref and "key" in ref
+            )
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            contents = executor.map(
+                lambda chunk: self._get_chunk({"bucket": chunk[0], "key": chunk[1]}),
+                chunks,
+            )
+            chunk_results = dict(zip(chunks, contents))
+
+        decoded = {}
+        results = []
+        for ref, item in zip(refs, items):
+            content = []
+            if ref and "key" in ref:
+                content = chunk_results[(ref["bucket"], ref["key"])]
+            elif ref:
+                data = item.get(RESULT_DATA_ATTRIBUTE) or []
+                data_index = int(ref["dataIndex"])
+                if data_index < len(data):
+                    key = (id(item), data_index)
+                    if key not in decoded:
+                        decoded[key] = decode_results(data[data_index])
+                    content = decoded[key]
+            index = int(ref["index"]) if ref else 0
+            results.append(content[index] if index < len(content) else None)
+        return results
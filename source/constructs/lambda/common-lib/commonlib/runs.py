@@ -0,0 +1,70 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+
+from .checkpoint import CheckPointDao, get_id_from_key
+from .launch import LAUNCH_SLOT_COUNT_ATTRIBUTE, DynamoDBLaunchSlots
+from .matrix_dao import MatrixRunDao
+from .stats import RunStatsDao
+
+logger = logging.getLogger(__name__)
+
+
+class FinishedRunRecorder:
+    """Record the runs which finished on their checkpoint, statistics,
+    launch slots and matrix run.
+
+    A run is finished by the result parser, the reconciler or the
+    dispatcher, with an update conditioned on its previous status, so that
+    only the one which finished it records it.
+
+    Usage:
+    ```
+    recorder = FinishedRunRecorder(table_name)
+
+    [previous_run] = in_flight_run_dao.finish_runs([run])
+    if previous_run is not None:
+        recorder.record(previous_run, status="FAILED", duration=60)
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self.checkpoint_dao = CheckPointDao(table_name)
+        self.run_stats_dao = RunStatsDao(table_name)
+        self.matrix_run_dao = MatrixRunDao(table_name)
+        self.launch_slots = DynamoDBLaunchSlots(table_name)
+
+    def record(self, previous_run: dict, status: str, duration="-") -> None:
+        """Record a finished run.
+
+        Args:
+            previous_run (dict): the TEST item of the run before it finished.
+            status (str): final status of the run.
+            duration (optional): run duration in seconds. Defaults to "-".
+        """
+        marker_id = get_id_from_key(previous_run["SK"])
+        logger.info(f"Record run {previous_run['PK']} finished as {status}")
+        self.checkpoint_dao.update_latest_run(
+            marker_id,
+            get_id_from_key(previous_run["PK"]),
+            status=status,
+            tested_at=previous_run["createdAt"],
+            duration=duration,
+        )
+        self.run_stats_dao.record_run_stats(
+            marker_id,
+            status=status,
+            tested_at=previous_run["createdAt"],
+            duration=duration,
+        )
+        # the builds are finished, their launch slots are free
+        for scope in previous_run.get("launchSlots", []):
+            self.launch_slots.release(
+                scope, int(previous_run.get(LAUNCH_SLOT_COUNT_ATTRIBUTE, 1))
+            )
+        if previous_run.get("matrixRunId"):
+            self.matrix_run_dao.record_matrix_result(
+                previous_run["matrixRunId"], marker_id, status=status
+            )
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+from .aws import DynamoDBUtil
+from .checkpoint import ENTITY_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the buckets of the duration histogram, runs
+# longer than the last bound are counted in an overflow bucket.
+DURATION_BUCKETS = [60, 300, 600, 1200, 1800, 3600]
+
+# Sort keys of the run statistics of a checkpoint, kept under the partition
+# key STATS#<marker id>. The total sorts after every day, so that a range of
+# days and the total are read back by a single query.
+STATS_DAY_PREFIX = "DAY#"
+STATS_TOTAL_SK = "TOTAL"
+
+
+def get_bucket_name(duration: int) -> str:
+    """Get the attribute name of the histogram bucket of a duration"""
+    for upper_bound in DURATION_BUCKETS:
+        if duration <= upper_bound:
+            return f"bucketLe{upper_bound}"
+    return "bucketInf"
+
+
+class RunStatsDao:
+    """Data Access Layer for the run statistics (STATS) items of the checkpoints
+
+    Usage:
+    ```
+    dao = RunStatsDao(table_name)
+
+    dao.record_run_stats(
+        marker_id, status="PASS", tested_at="2024-01-01T00:00:00Z", duration=60
+    )
+    total, daily = dao.get_run_stats(marker_id, days=30)
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def record_run_stats(
+        self, marker_id: str, status: str, tested_at: str, duration=None
+    ) -> None:
+        """Add a finished run to the statistics of a checkpoint.
+
+        The counters of the total and of the day of the run are increased
+        with atomic ADD updates, so concurrent results are never lost. The
+        min and max durations are only written when they change.
+
+        Args:
+            marker_id (str): checkpoint id.
+            status (str): run status, a run is passed if PASS, failed otherwise.
+            tested_at (str): creation time of the run, e.g. 2024-01-01T00:00:00Z.
+            duration (int, optional): run duration in seconds. Defaults to None.
+        """
+        passed = 1 if status == "PASS" else 0
+        has_duration = isinstance(duration, (int, float))
+        update_expression = "ADD #runs :one, #passes :passes, #failures :failures"
+        expression_attribute_names = {
+            "#runs": "runs",
+            "#passes": "passes",
+            "#failures": "failures",
+        }
+        expression_attribute_values = {
+            ":one": 1,
+            ":passes": passed,
+            ":failures": 1 - passed,
+        }
+        if has_duration:
+            duration = int(duration)
+            update_expression += ", #durationSum :duration, #bucket :one"
+            expression_attribute_names["#durationSum"] = "durationSum"
+            expression_attribute_names["#bucket"] = get_bucket_name(duration)
+            expression_attribute_values[":duration"] = duration
+
+        for sk in (STATS_TOTAL_SK, f"{STATS_DAY_PREFIX}{tested_at[:10]}"):
+            key = {"PK": f"{ENTITY_TYPE.STATS.value}#{marker_id}", "SK": sk}
+            response = self._table.update_item(
+                Key=key,
+                UpdateExpression=update_expression,
+                ExpressionAttributeNames=expression_attribute_names,
+                ExpressionAttributeValues=expression_attribute_values,
+                ReturnValues="ALL_NEW",
+            )
+            if not has_duration:
+                continue
+            stats = response["Attributes"]
+            if "durationMin" not in stats or stats["durationMin"] > duration:
+                self._set_duration_bound(key, "durationMin", "<", duration)
+            if "durationMax" not in stats or stats["durationMax"] < duration:
+                self._set_duration_bound(key, "durationMax", ">", duration)
+
+    def _set_duration_bound(
+        self, key: dict, attr_name: str, operator: str, duration: int
+    ) -> None:
+        try:
+            self._table.update_item(
+                Key=key,
+                UpdateExpression=f"SET #{attr_name} = :duration",
+                ConditionExpression=(
+                    f"attribute_not_exists(#{attr_name}) "
+                    f"OR :duration {operator} #{attr_name}"
+                ),
+                ExpressionAttributeNames={f"#{attr_name}": attr_name},
+                ExpressionAttributeValues={":duration": duration},
+            )
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            logger.info(f"{attr_name} of {key['PK']} {key['SK']} is already updated")
+
+    def get_run_stats(
+        self, marker_id: str, days: int = 30, today: Optional[date] = None
+    ) -> Tuple[Optional[dict], List[dict]]:
+        """Get the statistics of a checkpoint with a single query.
+
+        Args:
+            marker_id (str): checkpoint id.
+            days (int, optional): number of days, including today. Defaults to 30.
+            today (date, optional): last day. Defaults to the current UTC date.
+
+        Returns:
+            Tuple[Optional[dict], List[dict]]: The total, or None if the
+                checkpoint has no finished run, and the days with runs in
+                ascending order.
+        """
+        today = today or datetime.utcnow().date()
+        start = today - timedelta(days=max(days, 1) - 1)
+        items, _ = self._ddb_util.query_page(
+            {
+                "KeyConditionExpression": Key("PK").eq(
+                    f"{ENTITY_TYPE.STATS.value}#{marker_id}"
+                )
+                & Key("SK").gte(f"{STATS_DAY_PREFIX}{start.isoformat()}"),
+            }
+        )
+        total = None
+        daily = []
+        for item in items:
+            if item["SK"] == STATS_TOTAL_SK:
+                total = item
+            elif item["SK"] <= f"{STATS_DAY_PREFIX}{today.isoformat()}":
+                daily.append(item)
+        return total, daily
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import logging
+import time
+
+from boto3.dynamodb.conditions import Attr
+
+from .aws import DynamoDBUtil
+from .checkpoint import ENTITY_TYPE
+from .exception import APIException, ErrorCode
+
+logger = logging.getLogger(__name__)
+
+
+class ClientTokenDao:
+    """Data Access Layer for the idempotency tokens (TOKEN items) of the runs
+
+    Usage:
+    ```
+    dao = ClientTokenDao(table_name)
+
+    test_id = dao.claim_client_token(client_token, marker_id, new_test_id, 3600)
+    ```
+    """
+
+    def __init__(self, table_name: str) -> None:
+        self._ddb_util = DynamoDBUtil(table_name)
+        self._table = self._ddb_util._table
+
+    def claim_client_token(
+        self, client_token: str, marker_id: str, test_id: str, ttl_seconds: int
+    ) -> str:
+        """Record the run started for a client token, unless the token is
+        already used.
+
+        The token is written with a conditional put before the run is
+        started, and expires through the ttl attribute of the table. As
+        DynamoDB deletes expired items lazily, an expired token is treated
+        as absent.
+
+        Args:
+            client_token (str): idempotency token provided by the client.
+            marker_id (str): checkpoint id of the run.
+            test_id (str): id of the run to start.
+            ttl_seconds (int): time to live of the token.
+
+        Returns:
+            str: The test id recorded for the token, which is test_id if the
+                token is new.
+
+        Raises:
+            APIException: If the token was used for another checkpoint.
+        """
+        now = int(time.time())
+        key = {"PK": f"{ENTITY_TYPE.TOKEN.value}#{client_token}", "SK": "TOKEN"}
+        try:
+            self._table.put_item(
+                Item={
+                    **key,
+                    "markerId": marker_id,
+                    "testId": test_id,
+                    "ttl": now + ttl_seconds,
+                },
+                ConditionExpression=Attr("PK").not_exists() | Attr("ttl").lt(now),
+            )
+            return test_id
+        except self._table.meta.client.exceptions.ConditionalCheckFailedException:
+            item = self._table.get_item(Key=key, ConsistentRead=True)["Item"]
+
+        if item["markerId"] != marker_id:
+            raise APIException(
+                ErrorCode.VALUE_ERROR,
+                "The clientToken is already used for another checkpoint",
+            )
+        logger.info(f"Client token is already used by test {item['testId']}")
+        return item["testId"]
+
+    def release_client_token(self, client_token: str) -> None:
+        """Delete a client token, when the run of the token failed to start."""
+        self._table.delete_item(
+            Key={"PK": f"{ENTITY_TYPE.TOKEN.value}#{client_token}", "SK": "TOKEN"}
+        )
@@ -4,8 +4,12 @@
 
 import os
 import re
+import json
+import base64
 import logging
 
+from .exception import APIException, ErrorCode
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,6 +41,28 @@ def paginate(
     return total, items[start:end]
 
 
+def encode_next_token(last_evaluated_key) -> str:
+    """Encode a DynamoDB LastEvaluatedKey into an opaque pagination token"""
+    if not last_evaluated_key:
+        return ""
+    return base64.urlsafe_b64encode(
+        json.dumps(last_evaluated_key, separators=(",", ":")).encode("utf-8")
+    ).decode("utf-8")
+
+
+def decode_next_token(next_token: str):
+    """Decode a pagination token back to a DynamoDB ExclusiveStartKey"""
+    if not next_token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(next_token.encode("utf-8")))
+    except ValueError:
+        key = None
+    if not isinstance(key, dict):
+        raise APIException(ErrorCode.VALUE_ERROR, "Invalid nextToken")
+    return key
+
+
 def get_name_from_tags(tags):
     """Get resource name from tags
 
@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark of the parse of pytest json reports.
+
+Synthetic reports with 10k and 100k tests, 10% of which failed with a
+traceback, are parsed by the parser Lambda's former path, which reads and
+decodes the whole object before json.loads, and by the incremental reader
+of commonlib.report. Each parse runs in a fresh interpreter, so that its
+peak RSS is measured alone.
+
+Usage:
+```
+cd source/constructs/lambda/common-lib
+python test/benchmark_report.py --tests 10000 100000 --runs 3
+```
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMON_LIB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COMMON_LIB_DIR)
+
+# imported here, so that the import is not measured with the parse
+from commonlib.report import iter_report, parse_test_case  # noqa: E402
+
+FAILURE_RATE = 0.1
+TRACE = (
+    "self = <test_pipeline.TestPipeline object at 0x7f0a2c1d5e50>\n\n"
+    "    def test_ingestion(self):\n"
+    ">       assert self.count_documents() == 100\n"
+    "E       AssertionError: assert 99 == 100\n\n"
+    "test/test_pipeline.py:42: AssertionError\n"
+) * 8
+
+
+def write_report(path: str, tests: int) -> None:
+    """Write a report in the format of pytest-json-report, test by test."""
+    failed = int(tests * FAILURE_RATE)
+    with open(path, "w") as f:
+        f.write('{"created": 1700000000.0, "duration": 3600.5, "exitcode": 1, ')
+        f.write('"environment": {"Python": "3.11.6", "Platform": "Linux"}, ')
+        summary = {"passed": tests - failed, "failed": failed, "total": tests}
+        f.write(f'"summary": {json.dumps(summary)}, "tests": [')
+        for i in range(tests):
+            outcome = "failed" if i % int(1 / FAILURE_RATE) == 0 else "passed"
+            phase = {"duration": 0.001, "outcome": "passed"}
+            call = {"duration": 1.5, "outcome": outcome}
+            if outcome == "failed":
+                call["crash"] = {
+                    "path": "test/test_pipeline.py",
+                    "lineno": 42,
+                    "message": "AssertionError: assert 99 == 100",
+                }
+                call["longrepr"] = TRACE
+            test = {
+                "nodeid": f"test/test_pipeline.py::TestPipeline::test_{i}",
+                "lineno": i,
+                "outcome": outcome,
+                "keywords": [f"test_{i}", "TestPipeline", "test_pipeline.py"],
+                "setup": phase,
+                "call": call,
+                "teardown": phase,
+            }
+            f.write(("," if i else "") + json.dumps(test, indent=2))
+        f.write('], "pk": "TEST#t-001", "sk": "MARKER#m-001"}')
+
+
+def parse_loads(f) -> int:
+    report = json.loads(f.read().decode("utf-8"))
+    results = [parse_test_case(test) for test in report["tests"]]
+    return len(results)
+
+
+def parse_stream(f) -> int:
+    results = [
+        parse_test_case(value)
+        for prefix, value in iter_report(f)
+        if prefix == "tests.item"
+    ]
+    return len(results)
+
+
+PARSERS = {"json.loads": parse_loads, "iter_report": parse_stream}
+
+
+def run_child(parser_name: str, path: str) -> dict:
+    """Parse a report in this (fresh) interpreter."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        count = PARSERS[parser_name](f)
+    parse_ms = (time.perf_counter() - start) * 1000
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    return {
+        "tests": count,
+        "parse_ms": parse_ms,
+        "peak_rss_mb": rss_after / 1024,
+        "rss_growth_mb": (rss_after - rss_before) / 1024,
+    }
+
+
+def run_benchmark(tests: list, runs: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in tests:
+            path = os.path.join(directory, f"report-{count}.json")
+            write_report(path, count)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            for parser_name in PARSERS:
+                samples = []
+                for _ in range(runs):
+                    output = subprocess.run(
+                        [sys.executable, __file__, "--child", parser_name, path],
+                        check=True,
+                        capture_output=True,
+                        text=True,
+                    ).stdout
+                    samples.append(json.loads(output.strip().splitlines()[-1]))
+                results[f"{count}/{parser_name}"] = {
+                    "report_mb": size_mb,
+                    **{
+                        metric: statistics.median(sample[metric] for sample in samples)
+                        for metric in ("parse_ms", "peak_rss_mb", "rss_growth_mb")
+                    },
+                }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tests", type=int, nargs="+", default=[10000, 100000], help="report sizes"
+    )
+    parser.add_argument("--runs", type=int, default=3, help="runs per parser")
+    parser.add_argument("--output", help="save the results to a JSON file")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(*args.child)))
+        return
+
+    results = run_benchmark(args.tests, args.runs)
+    print(
+        f"{'report/parser':<22}{'size (MB)':>11}{'parse (ms)':>12}"
+        f"{'peak RSS (MB)':>15}{'RSS growth (MB)':>17}"
+    )
+    for name, metrics in results.items():
+        print(
+            f"{name:<22}{metrics['report_mb']:>11.1f}{metrics['parse_ms']:>12.1f}"
+            f"{metrics['peak_rss_mb']:>15.1f}{metrics['rss_growth_mb']:>17.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
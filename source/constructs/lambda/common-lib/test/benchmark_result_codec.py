@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Benchmark of the encoding of the results stored in the TEST items.
+
+The results of report fixtures, as the parser Lambda stores them, are
+encoded with encode_results at several zlib levels. The size of the JSON
+results, the size of the encoded results, the compression ratio and the
+encode and decode times are reported for each fixture. The tests of a
+fixture can be repeated to measure larger runs.
+
+Usage:
+```
+cd source/constructs/lambda/common-lib
+python test/benchmark_result_codec.py --runs 20
+python test/benchmark_result_codec.py --scale 100 --output codec.json
+```
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+COMMON_LIB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(COMMON_LIB_DIR, "test", "data", "*.json")
+LEVELS = [1, 6, 9]
+
+
+def load_results(path: str, scale: int) -> list:
+    """Load the results of a report, as stored by the parser."""
+    from commonlib.report import iter_report, parse_test_case
+
+    with open(path, "rb") as f:
+        results = [
+            parse_test_case(test)
+            for prefix, test in iter_report(f)
+            if prefix == "tests.item"
+        ]
+    return results * scale
+
+
+def measure(results: list, level: int, runs: int) -> dict:
+    from commonlib.report import decode_results, encode_results
+
+    encode_samples = []
+    decode_samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        data = encode_results(results, level=level)
+        encode_samples.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        decode_results(data)
+        decode_samples.append((time.perf_counter() - start) * 1000)
+
+    json_size = len(json.dumps(results, separators=(",", ":")).encode("utf-8"))
+    return {
+        "json_kb": json_size / 1024,
+        "encoded_kb": len(data) / 1024,
+        "ratio": json_size / len(data),
+        "encode_ms": statistics.median(encode_samples),
+        "decode_ms": statistics.median(decode_samples),
+    }
+
+
+def run_benchmark(paths: list, scale: int, runs: int) -> dict:
+    results = {}
+    for path in paths:
+        fixture = load_results(path, scale)
+        name = os.path.basename(path)
+        for level in LEVELS:
+            results[f"{name}/zlib-{level}"] = {
+                "tests": len(fixture),
+                **measure(fixture, level, runs),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", nargs="*", help="report files, test/data/*.json")
+    parser.add_argument("--scale", type=int, default=1, help="repeat the tests")
+    parser.add_argument("--runs", type=int, default=10, help="runs per level")
+    parser.add_argument("--output", help="save the results to a JSON file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, COMMON_LIB_DIR)
+    paths = args.fixtures or sorted(glob.glob(FIXTURES))
+    results = run_benchmark(paths, args.scale, args.runs)
+    print(
+        f"{'fixture/codec':<28}{'tests':>8}{'JSON (KB)':>11}{'encoded (KB)':>14}"
+        f"{'ratio':>8}{'encode (ms)':>13}{'decode (ms)':>13}"
+    )
+    for name, metrics in results.items():
+        print(
+            f"{name:<28}{metrics['tests']:>8}{metrics['json_kb']:>11.1f}"
+            f"{metrics['encoded_kb']:>14.1f}{metrics['ratio']:>8.1f}"
+            f"{metrics['encode_ms']:>13.2f}{metrics['decode_ms']:>13.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,10 @@
 
 
 import os
+
+import boto3
 import pytest
+from moto import mock_dynamodb
 
 
 @pytest.fixture(autouse=True)
@@ -39,3 +42,107 @@ def default_environment_variables():
     os.environ[
         "INSTANCE_INGESTION_DETAIL_TABLE_NAME"
     ] = "mocked-instance_ingestion_detail_table_name"
+
+
+DDB_TABLE_NAME = "DDB_TABLE_NAME"
+
+
+@pytest.fixture
+def ddb_client():
+    with mock_dynamodb():
+        ddb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = ddb.create_table(
+            TableName=DDB_TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+                {"AttributeName": "createdAt", "AttributeType": "S"},
+                {"AttributeName": "entityType", "AttributeType": "S"},
+                {"AttributeName": "inFlight", "AttributeType": "S"},
+                {"AttributeName": "nodeid", "AttributeType": "S"},
+                {"AttributeName": "testedAt", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "sortCreatedAtIndex",
+                    "KeySchema": [
+                        {"AttributeName": "SK", "KeyType": "HASH"},
+                        {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": "entityTypeIndex",
+                    "KeySchema": [
+                        {"AttributeName": "entityType", "KeyType": "HASH"},
+                        {"AttributeName": "PK", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+                {
+                    "IndexName": "inFlightIndex",
+                    "KeySchema": [
+                        {"AttributeName": "inFlight", "KeyType": "HASH"},
+                        {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {
+                        "ProjectionType": "INCLUDE",
+                        "NonKeyAttributes": ["codeBuildArn", "shardBuildArns"],
+                    },
+                },
+                {
+                    "IndexName": "nodeIdIndex",
+                    "KeySchema": [
+                        {"AttributeName": "nodeid", "KeyType": "HASH"},
+                        {"AttributeName": "testedAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                },
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        data_list = [
+            {
+                "PK": "MARKER#m-003",
+                "SK": "PROJECT#p-001",
+                "entityType": "MARKER",
+                "projectName": "CLO",
+                "modelName": "Lambda",
+            },
+            {
+                "PK": "MARKER#m-002",
+                "SK": "PROJECT#p-001",
+                "entityType": "MARKER",
+                "projectName": "CLO",
+                "modelName": "EKS",
+            },
+            {
+                "PK": "MARKER#m-001",
+                "SK": "PROJECT#p-001",
+                "projectName": "CLO",
+                "modelName": "EC2",
+            },
+            {
+                "PK": "TEST#t-002",
+                "SK": "MARKER#m-001",
+                "createdAt": "2024-01-02T00:00:00Z",
+                "status": "PASS",
+                "duration": 20,
+                "result": [{"message": "-", "trace": "-"}],
+            },
+            {
+                "PK": "TEST#t-001",
+                "SK": "MARKER#m-001",
+                "createdAt": "2024-01-01T00:00:00Z",
+                "status": "FAILED",
+                "duration": 10,
+            },
+        ]
+        with table.batch_writer() as batch:
+            for data in data_list:
+                batch.put_item(Item=data)
+        yield table
@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+from commonlib.builds import start_shard_builds, stop_build
+
+
+class FakeCodeBuildClient:
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.builds = []
+        self.stopped = []
+
+    def start_build(self, projectName, environmentVariablesOverride):
+        if len(self.builds) == self.fail_at:
+            raise RuntimeError("throttled")
+        build_id = f"{projectName}:{len(self.builds)}"
+        self.builds.append(environmentVariablesOverride)
+        return {
+            "build": {
+                "id": build_id,
+                "arn": f"arn:aws:codebuild:us-east-1:123456789012:build/{build_id}",
+            }
+        }
+
+    def stop_build(self, id):
+        if id == "p:404":
+            raise RuntimeError("not found")
+        self.stopped.append(id)
+
+
+def test_start_shard_builds():
+    client = FakeCodeBuildClient()
+    variables = [{"name": "mark", "value": "EC2"}]
+
+    arns = start_shard_builds(client, "p", variables, shards=2)
+    assert [arn.split("/")[-1] for arn in arns] == ["p:0", "p:1"]
+    assert client.builds[1] == [
+        {"name": "mark", "value": "EC2", "type": "PLAINTEXT"},
+        {"name": "shard_index", "value": "1", "type": "PLAINTEXT"},
+        {"name": "shard_total", "value": "2", "type": "PLAINTEXT"},
+    ]
+
+    # the builds started are stopped if a shard can not be started
+    client = FakeCodeBuildClient(fail_at=2)
+    with pytest.raises(RuntimeError, match="throttled"):
+        start_shard_builds(client, "p", variables, shards=3)
+    assert client.stopped == ["p:0", "p:1"]
+
+
+def test_stop_build():
+    client = FakeCodeBuildClient()
+    assert stop_build(client, "arn:aws:codebuild:us-east-1:1:build/p:0") is None
+    assert stop_build(client, "arn:aws:codebuild:us-east-1:1:build/p:404") == (
+        "not found"
+    )
+    assert client.stopped == ["p:0"]
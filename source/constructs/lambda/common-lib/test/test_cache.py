@@ -0,0 +1,105 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from commonlib.cache import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    # b is the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.hits == 3
+    assert cache.misses == 1
+
+    cache.clear()
+    assert cache.get("a", "default") == "default"
+
+
+def test_lru_cache_ttl(mocker):
+    mocked_time = mocker.patch("commonlib.cache.time.monotonic", return_value=100)
+    cache = LRUCache(ttl=10)
+    cache.put("a", 1)
+
+    mocked_time.return_value = 109
+    assert cache.get("a") == 1
+
+    mocked_time.return_value = 110
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_cached():
+    cache = LRUCache()
+    calls = []
+    version = {"value": 1}
+
+    @cache.cached(get_version=lambda: version["value"])
+    def list_items(page=1, count=20):
+        calls.append((page, count))
+        return [page, count]
+
+    assert list_items(page=1, count=10) == [1, 10]
+    assert list_items(count=10, page=1) == [1, 10]
+    assert list_items(page=2, count=10) == [2, 10]
+    assert calls == [(1, 10), (2, 10)]
+
+    # a new version invalidates the cached results
+    version["value"] = 2
+    assert list_items(page=1, count=10) == [1, 10]
+    assert calls == [(1, 10), (2, 10), (1, 10)]
+
+
+def test_cached_copies():
+    cache = LRUCache()
+
+    @cache.cached()
+    def get_item(id=1):
+        return {"id": id, "tags": ["a"]}
+
+    item = get_item(id=1)
+    item["tags"].append("b")
+    assert get_item(id=1) == {"id": 1, "tags": ["a"]}
+
+    item = get_item(id=1)
+    item["id"] = 2
+    assert get_item(id=1)["id"] == 1
+
+
+def test_cached_version_ttl(mocker):
+    mocked_time = mocker.patch("commonlib.cache.time.monotonic", return_value=100)
+    cache = LRUCache(ttl=60, version_ttl=5)
+    reads = []
+    version = {"value": 1}
+
+    def get_version():
+        reads.append(version["value"])
+        return version["value"]
+
+    @cache.cached(get_version=get_version)
+    def list_items(page=1):
+        return [page, version["value"]]
+
+    assert list_items(page=1) == [1, 1]
+    version["value"] = 2
+    # the version is not read again within its ttl
+    mocked_time.return_value = 104
+    assert list_items(page=1) == [1, 1]
+    assert reads == [1]
+
+    mocked_time.return_value = 105
+    assert list_items(page=1) == [1, 2]
+    assert reads == [1, 2]
+
+    # the versions read are forgotten with the entries
+    version["value"] = 3
+    cache.clear()
+    assert list_items(page=1) == [1, 3]
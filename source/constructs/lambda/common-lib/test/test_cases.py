@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from decimal import Decimal
+
+from commonlib.cases import CaseDao, get_case_key
+from commonlib.checkpoint import CheckPointDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_test_cases(ddb_client, monkeypatch):
+    dao = CaseDao(DDB_TABLE_NAME)
+    client = dao._table.meta.client
+    batch_write_item = client.batch_write_item
+    requests = []
+
+    def throttled_batch_write_item(RequestItems):
+        # the last item of the first request is not processed
+        items = RequestItems[DDB_TABLE_NAME]
+        requests.append(len(items))
+        if len(requests) > 1:
+            return batch_write_item(RequestItems=RequestItems)
+        batch_write_item(RequestItems={DDB_TABLE_NAME: items[:-1]})
+        return {"UnprocessedItems": {DDB_TABLE_NAME: items[-1:]}}
+
+    monkeypatch.setattr(client, "batch_write_item", throttled_batch_write_item)
+
+    cases = [
+        {
+            "nodeid": f"test/a.py::test_{i}",
+            "outcome": "failed" if i % 10 == 0 else "passed",
+            "duration": i / 3,
+            "traceRef": {"dataIndex": 0, "index": i},
+        }
+        for i in range(30)
+    ]
+    cases.append({"nodeid": "x" * 3000, "outcome": "passed", "duration": 1})
+    tested_at = "2024-01-01T00:00:00Z"
+    assert dao.put_test_cases("t-001", "m-001", tested_at, cases, max_workers=1) == 30
+    assert requests == [25, 1, 5]
+
+    cases[0]["outcome"] = "passed"
+    tested_at = "2024-01-02T00:00:00Z"
+    assert dao.put_test_cases("t-002", "m-001", tested_at, cases[:1]) == 1
+
+    items, next_token = dao.list_test_case_history("test/a.py::test_0", limit=1)
+    assert len(items) == 1 and next_token
+    next_items, _ = dao.list_test_case_history(
+        "test/a.py::test_0", next_token=next_token
+    )
+    assert len(items + next_items) == 2
+    items, _ = dao.list_test_case_history("test/a.py::test_0")
+    assert [(item["PK"], item["outcome"]) for item in items[:1]] == [
+        ("TEST#t-002", "passed")
+    ]
+    assert items[1:] == [
+        {
+            "PK": "TEST#t-001",
+            "SK": "CASE#test/a.py::test_0",
+            "nodeid": "test/a.py::test_0",
+            "markerId": "m-001",
+            "testedAt": "2024-01-01T00:00:00Z",
+            "outcome": "failed",
+            "duration": 0,
+            "traceRef": {"dataIndex": 0, "index": 0},
+        }
+    ]
+    assert dao.list_test_case_history("test/a.py::test_2")[0][0]["duration"] == (
+        Decimal("0.667")
+    )
+
+    # the CASE items share the partition of the run
+    run = CheckPointDao(DDB_TABLE_NAME).get_test_history("t-001")
+    assert run["SK"] == "MARKER#m-001"
+    assert get_case_key("a" * 2000).startswith("CASE#sha256:")
@@ -0,0 +1,269 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import time
+
+import pytest
+
+from commonlib import aws
+from commonlib.checkpoint import CheckPointDao, get_id_from_key
+from commonlib.exception import APIException
+from .conftest import DDB_TABLE_NAME
+
+
+def test_get_id_from_key():
+    assert get_id_from_key("MARKER#m-001") == "m-001"
+    assert get_id_from_key("m-001") == "m-001"
+
+
+def test_update_latest_run(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    assert dao.update_latest_run(
+        "m-001", "t-003", status="RUNNING", tested_at="2024-01-03T00:00:00Z"
+    )
+    marker = dao.get_marker("m-001")
+    assert marker["status"] == "RUNNING"
+    assert marker["latestTestId"] == "t-003"
+    assert marker["lastTestedAt"] == "2024-01-03T00:00:00Z"
+    assert marker["duration"] == "-"
+
+    # a late result of an older run must not overwrite the latest run
+    assert not dao.update_latest_run(
+        "m-001", "t-002", status="PASS", tested_at="2024-01-02T00:00:00Z"
+    )
+    assert dao.get_marker("m-001")["latestTestId"] == "t-003"
+
+    assert dao.update_latest_run(
+        "m-001", "t-003", status="PASS", tested_at="2024-01-03T00:00:00Z", duration=30
+    )
+    marker = dao.get_marker("m-001")
+    assert marker["status"] == "PASS"
+    assert marker["duration"] == 30
+
+    assert not dao.update_latest_run(
+        "not-found", "t-004", status="PASS", tested_at="2024-01-03T00:00:00Z"
+    )
+
+
+def test_backfill_markers(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    assert dao.backfill_markers() == 1
+
+    marker = dao.get_marker("m-001")
+    assert marker["status"] == "PASS"
+    assert marker["latestTestId"] == "t-002"
+    assert marker["lastTestedAt"] == "2024-01-02T00:00:00Z"
+    assert marker["duration"] == 20
+    assert marker["entityType"] == "MARKER"
+    assert "status" not in dao.get_marker("m-002")
+
+
+def test_list_markers(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    items, next_token = dao.list_markers()
+    assert [item["PK"] for item in items] == ["MARKER#m-003", "MARKER#m-002"]
+    assert next_token == ""
+    assert dao.count_markers() == 2
+
+    items, next_token = dao.list_markers(limit=1)
+    assert [item["PK"] for item in items] == ["MARKER#m-003"]
+    assert next_token
+
+    items, next_token = dao.list_markers(limit=1, next_token=next_token)
+    assert [item["PK"] for item in items] == ["MARKER#m-002"]
+
+    dao.backfill_markers()
+    items, next_token = dao.list_markers()
+    assert len(items) == 3
+    assert dao.count_markers() == 3
+
+
+def test_list_test_histories(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    items, next_token = dao.list_test_histories("m-001")
+    assert [item["PK"] for item in items] == ["TEST#t-002", "TEST#t-001"]
+    assert next_token == ""
+
+    items, next_token = dao.list_test_histories("m-001", limit=1)
+    assert [item["PK"] for item in items] == ["TEST#t-002"]
+
+    items, next_token = dao.list_test_histories(
+        "m-001", limit=1, next_token=next_token
+    )
+    assert [item["PK"] for item in items] == ["TEST#t-001"]
+
+    assert dao.list_test_histories("m-002") == ([], "")
+
+
+def test_run_count(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    # counted from the TEST items until the counter is backfilled
+    assert dao.count_test_histories("m-001") == 2
+
+    dao.backfill_markers()
+    assert dao.get_marker("m-001")["totalRuns"] == 2
+    assert dao.get_marker("m-002")["totalRuns"] == 0
+
+    dao.increment_run_count("m-001", "PROJECT#p-001")
+    assert dao.count_test_histories("m-001") == 3
+
+    # the counter is not reset by another backfill
+    dao.backfill_markers()
+    assert dao.count_test_histories("m-001") == 3
+
+
+def test_run_count_after_backfill(ddb_client, monkeypatch):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+    dao.backfill_markers()
+    # a checkpoint created after the backfill, and its first runs
+    ddb_client.put_item(Item={"PK": "MARKER#m-004", "SK": "PROJECT#p-001"})
+    for i in range(3):
+        ddb_client.put_item(
+            Item={
+                "PK": f"TEST#t-10{i}",
+                "SK": "MARKER#m-004",
+                "createdAt": f"2024-02-0{i + 1}T00:00:00Z",
+            }
+        )
+    dao.increment_run_count("m-004", "PROJECT#p-001", runs=3)
+    assert dao.get_marker("m-004")["totalRuns"] == 3
+
+    # then the runs are not counted again
+    def count(query_args):
+        raise AssertionError("the runs must not be counted")
+
+    monkeypatch.setattr(dao._ddb_util, "count", count)
+    dao.increment_run_count("m-004", "PROJECT#p-001")
+    assert dao.count_test_histories("m-004") == 4
+
+    # no checkpoint is created for a run of an unknown checkpoint
+    monkeypatch.undo()
+    dao.increment_run_count("m-404", "PROJECT#p-001")
+    assert dao.get_marker("m-404") is None
+
+
+def test_summary_and_result(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    items, _ = dao.list_test_histories("m-001", summary=True)
+    assert items[0] == {
+        "PK": "TEST#t-002",
+        "SK": "MARKER#m-001",
+        "createdAt": "2024-01-02T00:00:00Z",
+        "status": "PASS",
+        "duration": 20,
+    }
+
+    assert dao.get_test_result("t-002", "m-001") == [{"message": "-", "trace": "-"}]
+    assert dao.get_test_result("t-001", "m-001") == []
+
+
+def test_batch_get_latest_status(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    status = dao.batch_get_latest_status(["m-001", "m-002", "m-003"])
+    assert status == {"m-001": "PASS", "m-002": "UNKNOWN", "m-003": "UNKNOWN"}
+
+    # the latest test id is used as a pointer to the TEST item
+    latest_runs = dao.batch_get_latest_runs(
+        ["m-001", "m-002"],
+        latest_test_ids={"m-001": "t-001", "m-002": "t-404"},
+        max_workers=2,
+    )
+    assert latest_runs["m-001"]["PK"] == "TEST#t-001"
+    assert "result" not in latest_runs["m-001"]
+    assert latest_runs["m-002"] is None
+
+    assert dao.batch_get_latest_status([]) == {}
+
+
+def test_batch_get_unprocessed_keys(ddb_client, monkeypatch):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+    requests = []
+
+    def batch_get_item(RequestItems):
+        requests.append(RequestItems)
+        return {"Responses": {}, "UnprocessedKeys": RequestItems}
+
+    monkeypatch.setattr(dao._table.meta.client, "batch_get_item", batch_get_item)
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+
+    # the keys left unprocessed are an error, not an unknown status
+    with pytest.raises(APIException):
+        dao.batch_get_latest_status(["m-001"], latest_test_ids={"m-001": "t-001"})
+    assert len(requests) == aws.BATCH_GET_MAX_ATTEMPTS
+
+
+def test_generation(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    assert dao.get_generation() == 0
+    assert dao.bump_generation() == 1
+    assert dao.bump_generation() == 2
+    assert dao.get_generation() == 2
+
+
+def test_get_test_history(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    item = dao.get_test_history("t-002", "m-001")
+    assert item["status"] == "PASS"
+    assert item["result"] == [{"message": "-", "trace": "-"}]
+
+    # legacy ids without the checkpoint id
+    assert dao.get_test_history("t-002") == item
+
+    assert dao.get_test_history("t-002", "m-002") is None
+    assert dao.get_test_history("t-404") is None
+
+
+def test_batch_get_test_results(ddb_client):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    results = dao.batch_get_test_results(
+        [("t-002", "m-001"), ("t-001", "m-001"), ("t-404", "m-001"), ("t-002", "m-001")]
+    )
+    item = {
+        "result": [{"message": "-", "trace": "-"}],
+        "resultData": [],
+        "resultChunks": [],
+    }
+    empty = {"result": [], "resultData": [], "resultChunks": []}
+    assert results == [item, empty, empty, item]
+    assert dao.batch_get_test_results([]) == []
+
+
+def test_batch_get_markers(ddb_client, monkeypatch):
+    dao = CheckPointDao(DDB_TABLE_NAME)
+
+    # the project is not registered, the checkpoints are queried by id
+    markers = dao.batch_get_markers(["m-003", "m-001", "m-404"], project_ids=[])
+    assert markers["m-003"]["modelName"] == "Lambda"
+    # not backfilled with its entity type yet
+    assert markers["m-001"]["modelName"] == "EC2"
+    assert markers["m-404"] is None
+    assert list(markers) == ["m-003", "m-001", "m-404"]
+
+    assert dao.batch_get_markers([], project_ids=["p-001"]) == {}
+
+    # the checkpoints of registered projects are read by key
+    queried = []
+    query_marker = dao._query_marker
+    monkeypatch.setattr(
+        dao,
+        "_query_marker",
+        lambda marker_id: queried.append(marker_id) or query_marker(marker_id),
+    )
+    markers = dao.batch_get_markers(["m-003", "m-001", "m-404"], project_ids=["p-001"])
+    assert markers["m-001"]["modelName"] == "EC2"
+    assert markers["m-404"] is None
+    assert queried == ["m-404"]
+    assert dao.batch_get_markers(["m-002"], project_ids=["p-404"])["m-002"][
+        "modelName"
+    ] == "EKS"
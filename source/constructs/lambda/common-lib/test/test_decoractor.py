@@ -30,6 +30,20 @@ class TestAppSyncRouter:
         def _multiply(a, b):
             return a * b
 
+        @self._router.route(field_name="total", type_name="Numbers")
+        def _total(source, c=0):
+            return source["a"] + source["b"] + c
+
+        self.batch_calls = []
+
+        @self._router.route(field_name="product", type_name="Numbers", batch=True)
+        def _product(sources, arguments):
+            self.batch_calls.append(len(sources))
+            return [
+                source["a"] * source["b"] if source["b"] else ValueError("b is 0")
+                for source in sources
+            ]
+
     def tearDown(self):
         pass
 
@@ -57,6 +71,67 @@ class TestAppSyncRouter:
         }
         assert self._router.resolve(event) == 6
 
+    def test_type_field(self):
+        event = {
+            "info": {
+                "fieldName": "total",
+                "parentTypeName": "Numbers",
+            },
+            "arguments": {
+                "c": 1,
+            },
+            "source": {
+                "a": 2,
+                "b": 3,
+            },
+        }
+        assert self._router.resolve(event) == 6
+
+        event["info"]["parentTypeName"] = "Query"
+        with pytest.raises(APIException) as excinfo:
+            self._router.resolve(event)
+        assert excinfo.value.type == "UNSUPPORTED_ACTION"
+
+    def test_batch(self):
+        def event(field_name, a, b):
+            return {
+                "info": {"fieldName": field_name, "parentTypeName": "Numbers"},
+                "arguments": {},
+                "source": {"a": a, "b": b},
+            }
+
+        events = [
+            event("product", 2, 3),
+            event("total", 2, 3),
+            event("product", 4, 0),
+            event("product", 4, 5),
+            event("subtract", 4, 5),
+            {"info": {"fieldName": "add"}, "arguments": {"a": 1, "b": 1}},
+        ]
+        assert self._router.resolve(events) == [
+            {"data": 6},
+            {"data": 5},
+            {
+                "data": None,
+                "errorMessage": "Unknown exception, please check Lambda log for more details",
+                "errorType": "UNKNOWN_ERROR",
+            },
+            {"data": 20},
+            {
+                "data": None,
+                "errorMessage": "Unsupported action specified",
+                "errorType": "UNSUPPORTED_ACTION",
+            },
+            {"data": 2},
+        ]
+        # the batch handler is called once for all the events of the field
+        assert self.batch_calls == [3]
+
+        # a batch handler can also resolve a single event
+        assert self._router.resolve(event("product", 2, 5)) == 10
+        with pytest.raises(ValueError):
+            self._router.resolve(event("product", 2, 0))
+
     def test_unknown_action(self):
         event = {
             "info": {
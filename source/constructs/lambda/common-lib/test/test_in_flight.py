@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import pytest
+
+from commonlib.checkpoint import CheckPointDao
+from commonlib.in_flight import InFlightRunDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_list_running_runs(ddb_client):
+    dao = InFlightRunDao(DDB_TABLE_NAME)
+    for test_id, marker_id, created_at, status in [
+        ("t-003", "m-001", "2024-01-03T00:00:00Z", "RUNNING"),
+        ("t-004", "m-001", "2024-01-04T00:00:00Z", "QUEUED"),
+        ("t-005", "m-002", "2024-01-05T00:00:00Z", "RUNNING"),
+    ]:
+        ddb_client.put_item(
+            Item={
+                "PK": f"TEST#{test_id}",
+                "SK": f"MARKER#{marker_id}",
+                "createdAt": created_at,
+                "status": status,
+                "inFlight": status,
+            }
+        )
+    # finished, or written before the in flight index
+    ddb_client.put_item(
+        Item={
+            "PK": "TEST#t-006",
+            "SK": "MARKER#m-001",
+            "createdAt": "2024-01-06T00:00:00Z",
+            "status": "RUNNING",
+        }
+    )
+
+    items = dao.list_running_runs("m-001", since="2024-01-01T00:00:00Z")
+    assert [item["PK"] for item in items] == ["TEST#t-003"]
+    assert items[0]["status"] == "RUNNING"
+    assert dao.list_running_runs("m-001", since="2024-01-04T00:00:00Z") == []
+    items = dao.list_running_runs("m-001", statuses=("QUEUED", "RUNNING"))
+    assert [item["PK"] for item in items] == ["TEST#t-004", "TEST#t-003"]
+
+    assert dao.backfill_in_flight_runs() == 1
+    items = dao.list_running_runs("m-001", statuses=("QUEUED", "RUNNING"))
+    assert [item["PK"] for item in items] == ["TEST#t-006", "TEST#t-004", "TEST#t-003"]
+
+
+def test_update_queued_run(ddb_client):
+    dao = InFlightRunDao(DDB_TABLE_NAME)
+    checkpoint_dao = CheckPointDao(DDB_TABLE_NAME)
+    ddb_client.put_item(
+        Item={
+            "PK": "TEST#t-003",
+            "SK": "MARKER#m-001",
+            "createdAt": "2024-01-03T00:00:00Z",
+            "status": "QUEUED",
+        }
+    )
+
+    assert dao.update_queued_run("t-003", "m-001", {"launchSlots": ["ACCOUNT"]})
+    assert dao.update_queued_run("t-003", "m-001", {"status": "RUNNING"})
+    item = checkpoint_dao.get_test_history("t-003", "m-001")
+    assert item["status"] == "RUNNING"
+    assert item["launchSlots"] == ["ACCOUNT"]
+
+    assert not dao.update_queued_run("t-003", "m-001", {"status": "ERROR"})
+    assert not dao.update_queued_run("t-404", "m-001", {"status": "ERROR"})
+    assert checkpoint_dao.get_test_history("t-404", "m-001") is None
+
+
+def test_in_flight_runs(ddb_client):
+    dao = InFlightRunDao(DDB_TABLE_NAME)
+    checkpoint_dao = CheckPointDao(DDB_TABLE_NAME)
+    table = ddb_client
+    for i in (1, 2, 3):
+        table.put_item(
+            Item={
+                "PK": f"TEST#r-00{i}",
+                "SK": "MARKER#m-002",
+                "createdAt": f"2024-02-0{i}T00:00:00Z",
+                "status": "RUNNING",
+                "codeBuildArn": f"arn:aws:codebuild:build/p:r-00{i}",
+                "launchSlots": ["ACCOUNT"],
+            }
+        )
+
+    assert dao.list_in_flight_runs()[0] == []
+    assert dao.backfill_in_flight_runs() == 3
+    runs, next_token = dao.list_in_flight_runs(
+        limit=1, created_before="2024-02-03T00:00:00Z"
+    )
+    assert [run["PK"] for run in runs] == ["TEST#r-001"]
+    assert runs[0]["codeBuildArn"] == "arn:aws:codebuild:build/p:r-001"
+    runs, _ = dao.list_in_flight_runs(
+        next_token=next_token, created_before="2024-02-03T00:00:00Z"
+    )
+    assert [run["PK"] for run in runs] == ["TEST#r-002"]
+
+    # r-002 got its result meanwhile
+    table.update_item(
+        Key={"PK": "TEST#r-002", "SK": "MARKER#m-002"},
+        UpdateExpression="SET #status = :status REMOVE inFlight",
+        ExpressionAttributeNames={"#status": "status"},
+        ExpressionAttributeValues={":status": "PASS"},
+    )
+    previous_runs = dao.finish_runs(
+        [
+            {
+                "PK": f"TEST#r-00{i}",
+                "SK": "MARKER#m-002",
+                "status": "FAILED",
+                "duration": 60,
+            }
+            for i in (1, 2)
+        ]
+    )
+    assert previous_runs[0]["launchSlots"] == ["ACCOUNT"]
+    assert previous_runs[1] is None
+
+    assert checkpoint_dao.get_test_history("r-001", "m-002")["status"] == "FAILED"
+    assert checkpoint_dao.get_test_history("r-001", "m-002")["duration"] == 60
+    assert checkpoint_dao.get_test_history("r-002", "m-002")["status"] == "PASS"
+    assert [run["PK"] for run in dao.list_in_flight_runs()[0]] == ["TEST#r-003"]
+
+    # an update which fails is raised, or returned in place of the run
+    run = {"PK": "TEST#r-003", "SK": "MARKER#m-002", "status": "ERROR"}
+    with pytest.raises(KeyError):
+        dao.finish_runs([run])
+    [error] = dao.finish_runs([run], return_exceptions=True)
+    assert isinstance(error, KeyError)
+    assert checkpoint_dao.get_test_history("r-003", "m-002")["status"] == "RUNNING"
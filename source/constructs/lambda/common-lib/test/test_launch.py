@@ -0,0 +1,220 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import boto3
+import pytest
+from moto import mock_dynamodb
+
+from commonlib.launch import (
+    ACCOUNT_SCOPE,
+    DynamoDBLaunchSlots,
+    InMemoryLaunchQueue,
+    InMemoryLaunchSlots,
+    LaunchDispatcher,
+    TokenBucket,
+    get_project_scope,
+    get_shard_variables,
+)
+
+DDB_TABLE_NAME = "DDB_TABLE_NAME"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def create_dispatcher(clock, queue, slots, start, **kwargs):
+    args = dict(
+        queue=queue,
+        slots=slots,
+        start=start,
+        project_limit=2,
+        account_limit=3,
+        rate=1,
+        burst=2,
+        clock=clock,
+        sleep=clock.sleep,
+        now=clock,
+    )
+    args.update(kwargs)
+    return LaunchDispatcher(**args)
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+    clock.now += 0.5
+    assert bucket.try_acquire()
+
+    # waits for the next token
+    assert bucket.acquire(timeout=1)
+    assert clock.now == 1.0
+    assert not bucket.acquire(timeout=0.1)
+
+    bucket.refund()
+    assert bucket.try_acquire()
+
+
+def test_in_memory_queue(clock):
+    queue = InMemoryLaunchQueue(clock=clock)
+    queue.put([{"testId": "t-001"}, {"testId": "t-002"}])
+    assert queue.depth() == 2
+
+    received = queue.receive(1)
+    assert [(message, count) for _, message, count in received] == [
+        ({"testId": "t-001"}, 1)
+    ]
+    queue.release(received[0][0], delay=10)
+    assert [message for _, message, _ in queue.receive()] == [{"testId": "t-002"}]
+    assert queue.receive() == []
+
+    clock.now += 10
+    receipt, message, count = queue.receive()[0]
+    assert (message, count) == ({"testId": "t-001"}, 2)
+    queue.delete(receipt)
+    assert queue.depth() == 1
+
+
+def test_dispatcher_limits(clock):
+    queue = InMemoryLaunchQueue(clock=clock)
+    slots = InMemoryLaunchSlots()
+    started = []
+    queue.put(
+        [
+            {"testId": f"t-{i}", "projectName": project_name, "enqueuedAt": 0}
+            for i, project_name in enumerate(["CLO", "CLO", "CLO", "ATP", "ATP"])
+        ]
+    )
+    dispatcher = create_dispatcher(
+        clock, queue, slots, lambda message, scopes: started.append(message["testId"])
+    )
+
+    clock.now = 5
+    stats = dispatcher.drain(time_budget=60)
+
+    # 2 builds of CLO, then the account is full with 1 build of ATP
+    assert started == ["t-0", "t-1", "t-3"]
+    assert slots.in_flight == {
+        ACCOUNT_SCOPE: 3,
+        get_project_scope("CLO"): 2,
+        get_project_scope("ATP"): 1,
+    }
+    assert stats["dispatched"] == 3
+    assert stats["deferred"] == 2
+    assert stats["depth"] == 2
+    # the rate limit is 1 build per second after a burst of 2
+    assert stats["maxWaitSeconds"] == 6
+    assert stats["avgWaitSeconds"] == pytest.approx(16 / 3)
+
+    # the deferred runs start once builds finished
+    slots.release(ACCOUNT_SCOPE)
+    slots.release(get_project_scope("CLO"))
+    clock.now += 30
+    stats = dispatcher.drain(time_budget=60)
+    assert started == ["t-0", "t-1", "t-3", "t-2"]
+    assert stats["depth"] == 1
+
+
+def test_dispatcher_failures(clock):
+    queue = InMemoryLaunchQueue(clock=clock)
+    slots = InMemoryLaunchSlots()
+    errors = []
+    queue.put(
+        [
+            {"testId": "t-fail", "projectName": "CLO"},
+            {"testId": "t-skip", "projectName": "CLO"},
+        ]
+    )
+
+    def start(message, scopes):
+        if message["testId"] == "t-fail":
+            raise RuntimeError("throttled")
+        return False
+
+    dispatcher = create_dispatcher(
+        clock,
+        queue,
+        slots,
+        start,
+        max_attempts=2,
+        defer_seconds=0,
+        on_error=lambda message, error: errors.append((message["testId"], str(error))),
+    )
+    stats = dispatcher.drain(time_budget=60)
+
+    assert stats["failed"] == 2
+    assert stats["skipped"] == 1
+    assert stats["dispatched"] == 0
+    assert errors == [("t-fail", "throttled")]
+    assert queue.depth() == 0
+    assert slots.in_flight == {ACCOUNT_SCOPE: 0, get_project_scope("CLO"): 0}
+
+
+@mock_dynamodb
+def test_dynamodb_launch_slots():
+    ddb = boto3.resource("dynamodb", region_name="us-east-1")
+    ddb.create_table(
+        TableName=DDB_TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    slots = DynamoDBLaunchSlots(DDB_TABLE_NAME)
+
+    assert slots.acquire(ACCOUNT_SCOPE, 2)
+    assert slots.acquire(ACCOUNT_SCOPE, 2)
+    assert not slots.acquire(ACCOUNT_SCOPE, 2)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 2
+
+    slots.release(ACCOUNT_SCOPE)
+    slots.release(ACCOUNT_SCOPE)
+    # never released below zero
+    slots.release(ACCOUNT_SCOPE)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 0
+    assert slots.get_in_flight("PROJECT#CLO") == 0
+
+    # a slot per shard of a run
+    assert slots.acquire(ACCOUNT_SCOPE, 4, count=3)
+    assert not slots.acquire(ACCOUNT_SCOPE, 4, count=2)
+    assert not slots.acquire("PROJECT#CLO", 4, count=5)
+    slots.release(ACCOUNT_SCOPE, count=3)
+    assert slots.get_in_flight(ACCOUNT_SCOPE) == 0
+
+
+def test_shard_variables():
+    variables = [{"name": "mark", "value": "EC2"}]
+    assert get_shard_variables(variables) == [variables]
+    assert get_shard_variables(variables, 2) == [
+        variables
+        + [
+            {"name": "shard_index", "value": "0"},
+            {"name": "shard_total", "value": "2"},
+        ],
+        variables
+        + [
+            {"name": "shard_index", "value": "1"},
+            {"name": "shard_total", "value": "2"},
+        ],
+    ]
@@ -0,0 +1,16 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from commonlib.launch_stats import LaunchQueueStatsDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_launch_queue_stats(ddb_client):
+    dao = LaunchQueueStatsDao(DDB_TABLE_NAME)
+
+    assert dao.get_launch_queue_stats() is None
+    dao.put_launch_queue_stats({"dispatched": 2, "avgWaitSeconds": 1.5})
+    stats = dao.get_launch_queue_stats()
+    assert stats["dispatched"] == 2
+    assert stats["avgWaitSeconds"] == 1.5
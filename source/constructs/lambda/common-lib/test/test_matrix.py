@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import itertools
+
+import pytest
+
+from commonlib.exception import APIException
+from commonlib.matrix import expand_matrix, to_combination, to_parameters
+
+PARAMETERS = [
+    {"parameterKey": "buffer", "allowedValues": ["KDS", "S3", "None"]},
+    {"parameterKey": "logType", "allowedValues": ["JSON", "Apache", "Nginx"]},
+    {"parameterKey": "compression", "allowedValues": ["gzip", "none"]},
+]
+
+
+def test_full_matrix():
+    combinations = expand_matrix(PARAMETERS)
+    assert len(combinations) == 18
+    assert combinations[0] == {
+        "buffer": "KDS",
+        "logType": "JSON",
+        "compression": "gzip",
+    }
+
+    assert expand_matrix([]) == [{}]
+
+
+def test_pairwise_matrix():
+    combinations = expand_matrix(PARAMETERS, mode="PAIRWISE")
+    assert len(combinations) < 18
+
+    # every pair of values of two parameters is covered
+    for first, second in itertools.combinations(PARAMETERS, 2):
+        pairs = itertools.product(first["allowedValues"], second["allowedValues"])
+        for values in pairs:
+            assert any(
+                combination[first["parameterKey"]] == values[0]
+                and combination[second["parameterKey"]] == values[1]
+                for combination in combinations
+            )
+
+
+def test_matrix_rules():
+    combinations = expand_matrix(
+        PARAMETERS[:2],
+        exclude=[{"buffer": "None"}, {"buffer": "S3", "logType": "Nginx"}],
+        include=[
+            {"buffer": "None", "logType": "JSON"},
+            {"buffer": "KDS", "logType": "JSON"},
+        ],
+    )
+    assert combinations == [
+        {"buffer": "KDS", "logType": "JSON"},
+        {"buffer": "KDS", "logType": "Apache"},
+        {"buffer": "KDS", "logType": "Nginx"},
+        {"buffer": "S3", "logType": "JSON"},
+        {"buffer": "S3", "logType": "Apache"},
+        {"buffer": "None", "logType": "JSON"},
+    ]
+
+
+def test_matrix_limits():
+    with pytest.raises(APIException):
+        expand_matrix(PARAMETERS, mode="RANDOM")
+
+    with pytest.raises(APIException):
+        expand_matrix(
+            [
+                {"parameterKey": str(i), "allowedValues": [str(j) for j in range(10)]}
+                for i in range(3)
+            ]
+        )
+
+
+def test_combination():
+    parameters = [
+        {"parameterKey": "buffer", "parameterValue": "KDS"},
+        {"parameterKey": "logType", "parameterValue": ""},
+    ]
+    assert to_combination(parameters) == {"buffer": "KDS"}
+    assert to_parameters({"buffer": "KDS"}) == parameters[:1]
+    assert to_combination(None) == {}
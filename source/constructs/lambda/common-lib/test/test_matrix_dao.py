@@ -0,0 +1,47 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from commonlib.matrix_dao import MatrixRunDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_matrix_run(ddb_client):
+    dao = MatrixRunDao(DDB_TABLE_NAME)
+    dao.put_matrix_run(
+        {
+            "PK": "MATRIX#x-001",
+            "SK": "MARKER#m-001",
+            "status": "RUNNING",
+            "finished": 0,
+            "passes": 0,
+            "failures": 0,
+        }
+    )
+
+    # a run finishing before all the cells are started
+    dao.record_matrix_result("x-001", "m-001", "PASS")
+    assert dao.get_matrix_run("x-001")["status"] == "RUNNING"
+
+    dao.update_matrix_cells(
+        "x-001",
+        "m-001",
+        [
+            {"testId": "t-101"},
+            {"testId": "t-102"},
+            {"testId": None, "error": "failed to start"},
+            {"testId": "t-003", "deduplicated": True},
+        ],
+    )
+    matrix_run = dao.get_matrix_run("x-001")
+    assert matrix_run["total"] == 2
+    assert matrix_run["status"] == "RUNNING"
+
+    dao.record_matrix_result("x-001", "m-001", "FAILED")
+    matrix_run = dao.get_matrix_run("x-001")
+    assert matrix_run["finished"] == 2
+    assert matrix_run["passes"] == 1
+    assert matrix_run["failures"] == 1
+    assert matrix_run["status"] == "FAILED"
+
+    assert dao.get_matrix_run("x-404") is None
@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import boto3
+from moto import mock_dynamodb
+
+from commonlib.project_dao import ProjectDao
+from commonlib.project import ProjectRegistry, map_parameters
+
+DDB_TABLE_NAME = "DDB_TABLE_NAME"
+
+
+def test_map_parameters():
+    parameters = [
+        {"parameterKey": "buffer", "parameterValue": "KDS"},
+        {"parameterKey": "logType", "parameterValue": "JSON"},
+        {"parameterKey": "engine", "parameterValue": "OpenSearch"},
+    ]
+    parameter_mapping = [
+        {"parameterKey": "buffer", "name": "buffer_layer"},
+        {"parameterKey": "logType", "name": "log_type"},
+    ]
+
+    assert map_parameters(parameters, parameter_mapping, pass_unmapped=True) == {
+        "buffer_layer": "KDS",
+        "log_type": "JSON",
+        "engine": "OpenSearch",
+    }
+    assert map_parameters(parameters, parameter_mapping) == {
+        "buffer_layer": "KDS",
+        "log_type": "JSON",
+    }
+    assert map_parameters(parameters) == {}
+    assert map_parameters(None, parameter_mapping) == {}
+
+
+@mock_dynamodb
+def test_project_registry():
+    ddb = boto3.resource("dynamodb", region_name="us-east-1")
+    ddb.create_table(
+        TableName=DDB_TABLE_NAME,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dao = ProjectDao(DDB_TABLE_NAME)
+    registry = ProjectRegistry(dao, ttl=60)
+
+    # missing projects are not cached
+    assert registry.get("p-001") is None
+    dao.put_project("p-001", {"projectName": "CLO", "branch": "develop"})
+    assert registry.get("p-001")["branch"] == "develop"
+
+    # the cached project is used until it expires or is invalidated
+    dao.put_project("p-001", {"projectName": "CLO", "branch": "main"})
+    assert registry.get("p-001")["branch"] == "develop"
+    registry.invalidate()
+    assert registry.get("p-001")["branch"] == "main"
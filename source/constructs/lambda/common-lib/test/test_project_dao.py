@@ -0,0 +1,26 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from commonlib.checkpoint import CheckPointDao
+from commonlib.project_dao import ProjectDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_projects(ddb_client):
+    dao = ProjectDao(DDB_TABLE_NAME)
+    assert dao.get_project("p-001") is None
+
+    settings = {"branch": "develop", "region": "us-east-1", "codecommitRepo": "repo"}
+    assert dao.backfill_projects({"CLO": settings, "ATP": settings}) == 1
+    project = dao.get_project("p-001")
+    assert project["projectName"] == "CLO"
+    assert project["branch"] == "develop"
+    # the project is not listed with the checkpoints
+    assert len(CheckPointDao(DDB_TABLE_NAME).list_markers()[0]) == 2
+    assert [item["PK"] for item in dao.list_projects()] == ["PROJECT#p-001"]
+
+    dao.put_project("p-001", {**settings, "projectName": "CLO", "branch": "main"})
+    # projects already registered are not replaced
+    assert dao.backfill_projects({"CLO": settings}) == 0
+    assert dao.get_project("p-001")["branch"] == "main"
@@ -0,0 +1,253 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import hashlib
+import io
+import json
+import os
+import zlib
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from commonlib.report import (
+    ResultStore,
+    decode_results,
+    encode_results,
+    iter_report,
+    parse_test_case,
+)
+
+BUCKET_NAME = "central-bucket"
+REPORT_PATH = os.path.join(os.path.dirname(__file__), "data", "test-report.json")
+
+REPORT = {
+    "created": 1700000000.123,
+    "duration": 12345.678,
+    "exitcode": 1,
+    "environment": {"Python": "3.11", "Platform": "Linux"},
+    "summary": {"passed": 2, "failed": 1, "total": 3, "collected": 3},
+    "collectors": [],
+    "tests": [
+        {"nodeid": "test/test_a.py::test_one", "outcome": "passed"},
+        {
+            "nodeid": "test/test_a.py::test_two[é]",
+            "outcome": "failed",
+            "call": {
+                "crash": {"message": "AssertionError: 😀 != 1"},
+                "longrepr": "def test_two():\n>       assert 1 == 2\n" * 50,
+            },
+        },
+        {"nodeid": "test/test_b.py::test_three", "outcome": "passed"},
+    ],
+    "pk": "TEST#t-001",
+    "sk": "MARKER#m-001",
+    "shardIndex": 10,
+}
+
+
+def read(report: dict, chunk_size: int, indent=None):
+    stream = io.BytesIO(json.dumps(report, indent=indent).encode("utf-8"))
+    return list(iter_report(stream, chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64 * 1024])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_report(chunk_size, indent):
+    events = read(REPORT, chunk_size, indent)
+
+    assert events == [
+        ("created", 1700000000.123),
+        ("duration", 12345.678),
+        ("exitcode", 1),
+        ("environment", REPORT["environment"]),
+        ("summary", REPORT["summary"]),
+        ("tests.item", REPORT["tests"][0]),
+        ("tests.item", REPORT["tests"][1]),
+        ("tests.item", REPORT["tests"][2]),
+        ("pk", "TEST#t-001"),
+        ("sk", "MARKER#m-001"),
+        ("shardIndex", 10),
+    ]
+
+
+def test_iter_report_text_stream():
+    stream = io.StringIO(json.dumps({"tests": [1, [2, 3]], "total": 42}))
+
+    assert list(iter_report(stream, chunk_size=2)) == [
+        ("tests.item", 1),
+        ("tests.item", [2, 3]),
+        ("total", 42),
+    ]
+
+
+def test_iter_report_fixture():
+    with open(REPORT_PATH, "rb") as f:
+        report = json.load(f)
+    with open(REPORT_PATH, "rb") as f:
+        events = list(iter_report(f, chunk_size=1024))
+
+    assert [value for prefix, value in events if prefix == "tests.item"] == (
+        report["tests"]
+    )
+    assert dict(events)["summary"] == report["summary"]
+
+
+def test_iter_report_empty():
+    assert read({}, 1) == []
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"",
+        b"[]",
+        b'{"a": 1',
+        b'{"a": [1, 2}',
+        b'{"a" 1}',
+        b'{"a": 1 "b": 2}',
+        b"{1: 2}",
+    ],
+)
+def test_iter_report_invalid(content):
+    with pytest.raises(ValueError):
+        list(iter_report(io.BytesIO(content), chunk_size=2))
+
+
+def test_parse_test_case():
+    assert parse_test_case(REPORT["tests"][0]) == {
+        "nodeid": "test/test_a.py::test_one",
+        "outcome": "passed",
+        "duration": 0,
+        "message": "-",
+        "trace": "-",
+    }
+    result = parse_test_case(REPORT["tests"][1])
+    assert result["message"] == "AssertionError: 😀 != 1"
+    assert result["trace"].startswith("def test_two():")
+
+    # a test failing in its setup has no call phase
+    result = parse_test_case(
+        {
+            "nodeid": "test/test_a.py::test_four",
+            "outcome": "error",
+            "setup": {"duration": 0.5004, "outcome": "failed"},
+            "teardown": {"duration": 0.25, "outcome": "passed"},
+        }
+    )
+    assert (result["outcome"], result["duration"]) == ("error", 0.75)
+
+
+@pytest.fixture
+def s3_client():
+    with mock_s3():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        yield s3
+
+
+def test_encode_results():
+    with open(REPORT_PATH, "rb") as f:
+        results = [
+            {"nodeid": test["nodeid"], "trace": test.get("call", {}).get("longrepr")}
+            for test in json.load(f)["tests"]
+        ]
+
+    data = encode_results(results)
+    assert data[0] == 1
+    assert len(data) < len(json.dumps(results)) / 5
+    assert decode_results(data) == results
+    assert decode_results(bytearray(data)) == results
+
+    with pytest.raises(ValueError, match="Unsupported result format"):
+        decode_results(b"\x02" + zlib.compress(b"[]"))
+    with pytest.raises(ValueError):
+        decode_results(b"")
+
+
+def test_result_store(s3_client):
+    store = ResultStore(
+        BUCKET_NAME, max_inline_size=1000, chunk_size=500, s3_client=s3_client
+    )
+    small = [{"nodeid": "t.py::test_0", "outcome": "passed"}]
+    attributes = store.put(small, "results/t-001/0")
+    assert attributes["resultChunks"] == []
+    assert store.read(attributes) == small
+    # runs parsed before the results were encoded
+    assert store.read({"result": small}) == small
+
+    # traces which do not compress
+    results = [
+        {
+            "nodeid": f"t.py::test_{i}",
+            "outcome": "failed",
+            "trace": "".join(
+                hashlib.sha256(f"{i}-{j}".encode()).hexdigest() for j in range(2)
+            ),
+        }
+        for i in range(20)
+    ]
+    attributes = store.put(results, "results/t-002/0")
+    assert attributes["resultData"] == []
+    chunks = attributes["resultChunks"]
+    assert [chunk["count"] for chunk in chunks] == [3, 3, 3, 3, 3, 3, 2]
+    assert chunks[0] == {
+        "bucket": BUCKET_NAME,
+        "key": "results/t-002/0/00000.jsonl.gz",
+        "count": 3,
+    }
+    assert len(s3_client.list_objects_v2(Bucket=BUCKET_NAME)["Contents"]) == 7
+
+    assert store.read(attributes) == results
+    assert store.read(attributes, offset=3, limit=6) == results[3:9]
+    assert store.read(attributes, offset=18, limit=10) == results[18:]
+    assert store.read(attributes, offset=20) == []
+    assert store.read(attributes, limit=0) == []
+
+    # a smaller inline size, e.g. for a shard of a run
+    attributes = store.put(small * 10, "results/t-003/1", max_inline_size=10)
+    assert attributes["resultData"] == []
+
+    # the shards of a run stored inline and in chunks
+    item = {"resultData": store.put(small * 2, "results/t-004/0")["resultData"]}
+    item["resultData"] += store.put(small, "results/t-004/1")["resultData"]
+    item["resultChunks"] = chunks
+    assert store.read(item) == small * 3 + results
+    assert store.read(item, offset=0, limit=4) == small * 3 + results[:1]
+    assert store.read(item, offset=5, limit=2) == results[2:4]
+
+
+def test_result_refs(s3_client):
+    store = ResultStore(
+        BUCKET_NAME, max_inline_size=200, chunk_size=300, s3_client=s3_client
+    )
+    small = [{"nodeid": f"t.py::test_{i}", "outcome": "passed"} for i in range(2)]
+    large = [
+        {
+            "nodeid": f"t.py::test_{i}",
+            "outcome": "failed",
+            "trace": hashlib.sha256(str(i).encode()).hexdigest(),
+        }
+        for i in range(10)
+    ]
+    # the second shard of a run, in the item, and the first one in chunks
+    shard_1 = store.put(small, "results/t-001/1")
+    shard_0 = store.put(large, "results/t-001/0")
+    assert shard_0["resultChunks"]
+    item = {"resultData": shard_1["resultData"]}
+
+    refs = store.locate(shard_1, data_index=0) + store.locate(shard_0)
+    assert refs[:2] == [{"dataIndex": 0, "index": 0}, {"dataIndex": 0, "index": 1}]
+    assert refs[2] == {
+        "bucket": BUCKET_NAME,
+        "key": "results/t-001/0/00000.jsonl.gz",
+        "index": 0,
+    }
+
+    assert store.read_refs(refs, [item] * len(refs)) == small + large
+    assert store.read_refs(
+        [refs[-1], None, {"dataIndex": 1, "index": 0}, {"dataIndex": 0, "index": 5}],
+        [{}, {}, item, item],
+    ) == [large[-1], None, None, None]
@@ -0,0 +1,44 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+from datetime import date
+
+from commonlib.stats import RunStatsDao, get_bucket_name
+from .conftest import DDB_TABLE_NAME
+
+
+def test_run_stats(ddb_client):
+    dao = RunStatsDao(DDB_TABLE_NAME)
+
+    assert get_bucket_name(60) == "bucketLe60"
+    assert get_bucket_name(61) == "bucketLe300"
+    assert get_bucket_name(7200) == "bucketInf"
+
+    dao.record_run_stats("m-001", "PASS", "2024-01-01T00:00:00Z", duration=100)
+    dao.record_run_stats("m-001", "FAILED", "2024-01-01T01:00:00Z", duration=40)
+    dao.record_run_stats("m-001", "PASS", "2024-01-03T00:00:00Z", duration=7200)
+    dao.record_run_stats("m-001", "ERROR", "2024-01-03T01:00:00Z", duration="-")
+
+    total, daily = dao.get_run_stats("m-001", days=3, today=date(2024, 1, 3))
+    assert total["runs"] == 4
+    assert total["passes"] == 2
+    assert total["failures"] == 2
+    assert total["durationSum"] == 7340
+    assert total["durationMin"] == 40
+    assert total["durationMax"] == 7200
+    assert total["bucketLe60"] == 1
+    assert total["bucketLe300"] == 1
+    assert total["bucketInf"] == 1
+
+    assert [item["SK"] for item in daily] == ["DAY#2024-01-01", "DAY#2024-01-03"]
+    assert daily[0]["runs"] == 2
+    assert daily[0]["durationMin"] == 40
+    assert daily[0]["durationMax"] == 100
+    assert daily[1]["runs"] == 2
+    assert daily[1]["durationSum"] == 7200
+
+    _, daily = dao.get_run_stats("m-001", days=1, today=date(2024, 1, 2))
+    assert daily == []
+
+    assert dao.get_run_stats("m-002") == (None, [])
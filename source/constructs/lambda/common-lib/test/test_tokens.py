@@ -0,0 +1,28 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+
+import time
+
+import pytest
+
+from commonlib.exception import APIException
+from commonlib.tokens import ClientTokenDao
+from .conftest import DDB_TABLE_NAME
+
+
+def test_client_token(ddb_client, mocker):
+    dao = ClientTokenDao(DDB_TABLE_NAME)
+
+    assert dao.claim_client_token("token-1", "m-001", "t-101", 60) == "t-101"
+    # a replay returns the run of the first request
+    assert dao.claim_client_token("token-1", "m-001", "t-102", 60) == "t-101"
+    with pytest.raises(APIException):
+        dao.claim_client_token("token-1", "m-002", "t-103", 60)
+
+    # an expired token is reused, even if not deleted yet
+    mocker.patch("commonlib.tokens.time.time", return_value=time.time() + 61)
+    assert dao.claim_client_token("token-1", "m-001", "t-104", 60) == "t-104"
+
+    dao.release_client_token("token-1")
+    assert dao.claim_client_token("token-1", "m-001", "t-105", 60) == "t-105"
@@ -2,8 +2,12 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import pytest
 
+from commonlib.exception import APIException
 from commonlib.utils import (
+    decode_next_token,
+    encode_next_token,
     get_resource_from_arn,
     get_name_from_tags,
     get_partition,
@@ -125,3 +129,15 @@ def test_create_stack_name():
     os.environ["STACK_PREFIX"] = "Test"
     id = "abc"
     assert create_stack_name("Haha", id) == "Test-Haha-abc"
+
+
+def test_next_token():
+    key = {"PK": "MARKER#m-001", "SK": "PROJECT#p-001"}
+    next_token = encode_next_token(key)
+    assert decode_next_token(next_token) == key
+
+    assert encode_next_token(None) == ""
+    assert decode_next_token("") is None
+
+    with pytest.raises(APIException, match="Invalid nextToken"):
+        decode_next_token("not-a-token")
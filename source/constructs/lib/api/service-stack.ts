@@ -17,14 +17,19 @@ import * as path from "path";
 import * as appsync from "@aws-cdk/aws-appsync-alpha";
 import {
   Aws,
+  CustomResource,
   Duration,
   RemovalPolicy,
   aws_codebuild as codebuild,
   aws_dynamodb as ddb,
+  aws_events as events,
+  aws_events_targets as targets,
   aws_iam as iam,
   aws_lambda as lambda,
   aws_s3 as s3,
   aws_s3_notifications as s3n,
+  aws_sqs as sqs,
+  custom_resources as cr,
 } from "aws-cdk-lib";
 import { Construct } from "constructs";
 
@@ -78,6 +83,109 @@ export class ServiceStack extends Construct {
       projectionType: ddb.ProjectionType.ALL,
     });
 
+    // Indexes added to the table after its first release, in order.
+    // DynamoDB creates a single index per table update, so an existing
+    // table is upgraded one index per deployment with the context value
+    // tableIndexStage, e.g. -c tableIndexStage=1, then 2, then without it.
+    const addedIndexes: ddb.GlobalSecondaryIndexProps[] = [
+      // Sparse index on the entity type, only set on MARKER and PROJECT items
+      {
+        indexName: 'entityTypeIndex',
+        partitionKey: {
+          name: 'entityType',
+          type: ddb.AttributeType.STRING
+        },
+        sortKey: {
+          name: 'PK',
+          type: ddb.AttributeType.STRING
+        },
+        projectionType: ddb.ProjectionType.ALL,
+      },
+      // Sparse index on the runs in flight, set to the status of QUEUED and
+      // RUNNING TEST items
+      {
+        indexName: 'inFlightIndex',
+        partitionKey: {
+          name: 'inFlight',
+          type: ddb.AttributeType.STRING
+        },
+        sortKey: {
+          name: 'createdAt',
+          type: ddb.AttributeType.STRING
+        },
+        projectionType: ddb.ProjectionType.INCLUDE,
+        nonKeyAttributes: ['codeBuildArn', 'shardBuildArns'],
+      },
+      // Sparse index on the history of a test case, only set on CASE items
+      {
+        indexName: 'nodeIdIndex',
+        partitionKey: {
+          name: 'nodeid',
+          type: ddb.AttributeType.STRING
+        },
+        sortKey: {
+          name: 'testedAt',
+          type: ddb.AttributeType.STRING
+        },
+        projectionType: ddb.ProjectionType.INCLUDE,
+        nonKeyAttributes: ['markerId', 'outcome', 'duration', 'traceRef'],
+      },
+    ];
+    const indexStage = Number(
+      this.node.tryGetContext("tableIndexStage") ?? addedIndexes.length
+    );
+    addedIndexes
+      .slice(0, indexStage)
+      .forEach((index) => this.svcTable.addGlobalSecondaryIndex(index));
+
+    // Runs are queued, and started by the dispatcher within the concurrency
+    // limits of the account.
+    const launchQueue = new sqs.Queue(this, "LaunchQueue", {
+      visibilityTimeout: Duration.minutes(3),
+      retentionPeriod: Duration.days(1),
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+    });
+
+    const launchDispatcher = new lambda.Function(this, "LaunchDispatcher", {
+      code: lambda.AssetCode.fromAsset(
+        path.join(__dirname, "../../lambda/api/dispatcher")
+      ),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "lambda_function.lambda_handler",
+      timeout: Duration.minutes(2),
+      memorySize: 256,
+      // a single dispatcher drains the queue at a time
+      reservedConcurrentExecutions: 1,
+      layers: [SharedPythonLayer.getInstance(this)],
+      environment: {
+        TABLE: this.svcTable.tableName,
+        SOLUTION_VERSION: process.env.VERSION || "v1.0.0",
+        REGION: Aws.REGION,
+        CODEBUILD_PROJECT_NAME: props.codeBuildProject.projectName,
+        LAUNCH_QUEUE_URL: launchQueue.queueUrl,
+        MAX_IN_FLIGHT_PER_PROJECT: "5",
+        MAX_IN_FLIGHT_PER_ACCOUNT: "20",
+        LAUNCH_RATE: "1",
+        LAUNCH_BURST: "5",
+      },
+      description: `${Aws.STACK_NAME} - Launch Dispatcher`,
+    });
+    this.svcTable.grantReadWriteData(launchDispatcher);
+    launchQueue.grantConsumeMessages(launchDispatcher);
+    launchDispatcher.addToRolePolicy(
+      new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        resources: [props.codeBuildProject.projectArn],
+        actions: ["codebuild:StartBuild", "codebuild:StopBuild"],
+      })
+    );
+
+    // Drain the runs deferred by the limits
+    new events.Rule(this, "LaunchDispatcherSchedule", {
+      schedule: events.Schedule.rate(Duration.minutes(1)),
+      targets: [new targets.LambdaFunction(launchDispatcher)],
+    });
+
     // Create a lambda to handle all related APIs.
     const svcHandler = new lambda.Function(this, "ServiceHandler", {
       code: lambda.AssetCode.fromAsset(
@@ -95,12 +203,16 @@ export class ServiceStack extends Construct {
         REGION: Aws.REGION,
         PARTITION: Aws.PARTITION,
         CODEBUILD_PROJECT_NAME: props.codeBuildProject.projectName,
+        LAUNCH_QUEUE_URL: launchQueue.queueUrl,
+        DISPATCHER_FUNCTION_NAME: launchDispatcher.functionName,
       },
       description: `${Aws.STACK_NAME} - APIs Resolver`,
     });
 
     // Grant permissions to the pipeline lambda
     this.svcTable.grantReadWriteData(svcHandler);
+    // Results too large for the table are read from their chunks
+    props.centralBucket.grantRead(svcHandler, "results/*");
 
     const svcFnPolicy = new iam.Policy(this, "SvcFnPolicy", {
       statements: [
@@ -144,6 +256,54 @@ export class ServiceStack extends Construct {
       responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
     });
 
+    svcLambdaDS.createResolver("listTestCaseHistory", {
+      typeName: "Query",
+      fieldName: "listTestCaseHistory",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("getCheckPointStats", {
+      typeName: "Query",
+      fieldName: "getCheckPointStats",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    // The result of a test history is only loaded when it is selected,
+    // the results of a list are resolved in one batch invocation.
+    svcLambdaDS.createResolver("TestHistoryResult", {
+      typeName: "TestHistory",
+      fieldName: "result",
+      maxBatchSize: 100,
+      requestMappingTemplate: appsync.MappingTemplate.fromString(
+        `{"version": "2018-05-29", "operation": "BatchInvoke", "payload": $util.toJson($ctx)}`
+      ),
+      responseMappingTemplate: appsync.MappingTemplate.fromString(
+        `#if($ctx.result.errorMessage)
+  $util.error($ctx.result.errorMessage, $ctx.result.errorType)
+#end
+$util.toJson($ctx.result.data)`
+      ),
+    });
+
+    // The result of a test case is read through its traceRef, in the run
+    // item or in a result chunk, for a page of test cases at once.
+    svcLambdaDS.createResolver("TestCaseResult", {
+      typeName: "TestCase",
+      fieldName: "result",
+      maxBatchSize: 100,
+      requestMappingTemplate: appsync.MappingTemplate.fromString(
+        `{"version": "2018-05-29", "operation": "BatchInvoke", "payload": $util.toJson($ctx)}`
+      ),
+      responseMappingTemplate: appsync.MappingTemplate.fromString(
+        `#if($ctx.result.errorMessage)
+  $util.error($ctx.result.errorMessage, $ctx.result.errorType)
+#end
+$util.toJson($ctx.result.data)`
+      ),
+    });
+
     svcLambdaDS.createResolver("startSingleTest", {
       typeName: "Mutation",
       fieldName: "startSingleTest",
@@ -151,6 +311,100 @@ export class ServiceStack extends Construct {
       responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
     });
 
+    svcLambdaDS.createResolver("startBatchTests", {
+      typeName: "Mutation",
+      fieldName: "startBatchTests",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("startMatrixTest", {
+      typeName: "Mutation",
+      fieldName: "startMatrixTest",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("getMatrixRun", {
+      typeName: "Query",
+      fieldName: "getMatrixRun",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("getLaunchQueueStatus", {
+      typeName: "Query",
+      fieldName: "getLaunchQueueStatus",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("listProjects", {
+      typeName: "Query",
+      fieldName: "listProjects",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("putProject", {
+      typeName: "Mutation",
+      fieldName: "putProject",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("stopTest", {
+      typeName: "Mutation",
+      fieldName: "stopTest",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("stopTestsForMarker", {
+      typeName: "Mutation",
+      fieldName: "stopTestsForMarker",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    svcLambdaDS.createResolver("rerunFailed", {
+      typeName: "Mutation",
+      fieldName: "rerunFailed",
+      requestMappingTemplate: appsync.MappingTemplate.lambdaRequest(),
+      responseMappingTemplate: appsync.MappingTemplate.lambdaResult(),
+    });
+
+    // Materialize the latest run status on existing checkpoints. The
+    // provider waits for the backfill, and fails the deployment if it fails.
+    const backfillHandler = new lambda.Function(this, "BackfillHandler", {
+      code: lambda.AssetCode.fromAsset(
+        path.join(__dirname, "../../lambda/api/server")
+      ),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "lambda_function.backfill_handler",
+      timeout: Duration.minutes(14),
+      memorySize: 1024,
+      layers: [SharedPythonLayer.getInstance(this)],
+      environment: {
+        TABLE: this.svcTable.tableName,
+        SOLUTION_VERSION: process.env.VERSION || "v1.0.0",
+        REGION: Aws.REGION,
+      },
+      description: `${Aws.STACK_NAME} - Backfill Handler`,
+    });
+    this.svcTable.grantReadWriteData(backfillHandler);
+
+    const backfillProvider = new cr.Provider(this, "BackfillProvider", {
+      onEventHandler: backfillHandler,
+    });
+    new CustomResource(this, "BackfillCheckPoints", {
+      serviceToken: backfillProvider.serviceToken,
+      properties: {
+        // run on every deployment
+        deployedAt: Date.now().toString(),
+      },
+    });
+
     // Set parser for test result
     const testResultParser = new lambda.Function(this, "TestResultParser", {
       code: lambda.AssetCode.fromAsset(
@@ -190,5 +444,38 @@ export class ServiceStack extends Construct {
         suffix: '.json',
       }
     );
+
+    // Finish the runs whose build finished without a report
+    const runReconciler = new lambda.Function(this, "RunReconciler", {
+      code: lambda.AssetCode.fromAsset(
+        path.join(__dirname, "../../lambda/api/reconciler")
+      ),
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "lambda_function.lambda_handler",
+      timeout: Duration.minutes(5),
+      memorySize: 512,
+      reservedConcurrentExecutions: 1,
+      layers: [SharedPythonLayer.getInstance(this)],
+      environment: {
+        TABLE: this.svcTable.tableName,
+        SOLUTION_VERSION: process.env.VERSION || "v1.0.0",
+        REGION: Aws.REGION,
+        GRACE_PERIOD_MINUTES: "15",
+      },
+      description: `${Aws.STACK_NAME} - Run Reconciler`,
+    });
+    this.svcTable.grantReadWriteData(runReconciler);
+    runReconciler.addToRolePolicy(
+      new iam.PolicyStatement({
+        effect: iam.Effect.ALLOW,
+        resources: [props.codeBuildProject.projectArn],
+        actions: ["codebuild:BatchGetBuilds"],
+      })
+    );
+
+    new events.Rule(this, "RunReconcilerSchedule", {
+      schedule: events.Schedule.rate(Duration.minutes(15)),
+      targets: [new targets.LambdaFunction(runReconciler)],
+    });
   }
 }
@@ -65,14 +65,18 @@ export class WorkerStack extends Construct {
             build: {
               commands: [
                 'echo \"start tests\"', // Your build commands go here
+                // The build of a shard runs its share of the tests, with pytest-shard
+                'if [ -n \"$shard_total\" ]; then export PYTEST_ADDOPTS=\"$PYTEST_ADDOPTS --shard-id=$shard_index --num-shards=$shard_total\"; fi',
+                // A rerun only collects the selected tests
+                'if [ -n \"$selected_tests\" ]; then export PYTEST_ADDOPTS=\"$PYTEST_ADDOPTS $selected_tests\"; fi',
                 'sh start_test_autotest_platform.sh \"$mark\" \"$parameter\" \"$region\"'
               ],
             },
             post_build: {
               commands: [
                 'current_time=$(date +\"%H-%M-%S\")',
-                'RESULTS_FILE_NAME=\"${project_name}-${mark}-${current_time}.json\"',
-                "jq -r '.pk = \"'\"${pk}\"'\" | .sk = \"'\"${sk}\"'\"' test-report.json > tmp.json",
+                'RESULTS_FILE_NAME=\"${project_name}-${mark}-${current_time}-${shard_index:-0}.json\"',
+                "jq -r '.pk = \"'\"${pk}\"'\" | .sk = \"'\"${sk}\"'\" | .shardIndex = '\"${shard_index:-0}\"' | .shardTotal = '\"${shard_total:-1}\"'' test-report.json > tmp.json",
                 "mv tmp.json test-report.json",
                 "cat test-report.json",
                 `aws s3 cp test-report.json s3://${props.centralBucket.bucketName}/$project_name/$mark/$RESULTS_FILE_NAME`, // Upload files from 'testResult' to S3